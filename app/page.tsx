@@ -4,7 +4,7 @@ import { useAuth } from '../src/contexts/AuthContext'
 import { useRouter } from 'next/navigation'
 import { useEffect, useState, useRef } from 'react'
 import { supabase } from '../src/lib/supabase'
-import { connectToPi, disconnectFromPi, isConnectedToPi, dispenseToPi, sendSmsViaPi, confirmServo2Dispense, setButtonPressCallback, setConnectionStatusCallback, updateLCDSchedules } from '../src/lib/pi-websocket'
+import { connectToPi, disconnectFromPi, isConnectedToPi, dispenseToPi, sendSmsViaPi, confirmServo2Dispense, setButtonPressCallback, setConnectionStatusCallback, updateLCDSchedules, configurePiScheduler, setLocalDispenseCallback } from '../src/lib/pi-websocket'
 import { formatDate, getPhilippineTime } from '../src/lib/date-utils'
 
 interface Medication {
@@ -863,6 +863,45 @@ export default function Home() {
     }
   }, [days, piConnected])
 
+  // Pi local scheduler: dispenses doses itself when this page isn't open, using the same
+  // dispense mode and SMS number; its dispenses are logged here once we reconnect
+  useEffect(() => {
+    if (!piConnected || !user) {
+      return
+    }
+
+    const effectiveUserId = isOwner ? user.id : (ownerUserId || user.id)
+
+    supabase
+      .from('profiles')
+      .select('phone_number')
+      .eq('id', effectiveUserId)
+      .single()
+      .then(({ data: profileData }) => {
+        configurePiScheduler({
+          automatic: dispenseMode === 'automatic',
+          phoneNumbers: profileData?.phone_number ? [profileData.phone_number] : []
+        }).catch((error) => console.error('❌ Failed to configure Pi scheduler:', error))
+      })
+
+    setLocalDispenseCallback(async (dispense) => {
+      const notes = `Dispensed by the Pi scheduler (web app offline) on ${dispense.date} at ${dispense.time} (${dispense.time_frame}) - ${dispense.medications.join(', ')}`
+      for (const medicationName of dispense.medications) {
+        const { error } = await supabase.from('dispense_history').insert({
+          user_id: effectiveUserId,
+          servo_number: 1,
+          medication_name: medicationName,
+          action: 'auto',
+          status: dispense.status === 'success' ? 'success' : 'error',
+          notes
+        })
+        if (error) throw error
+      }
+    })
+
+    return () => setLocalDispenseCallback(null)
+  }, [piConnected, user, isOwner, ownerUserId, dispenseMode])
+
   // Automatic scheduling system - check every second
   useEffect(() => {
     let checkCounter = 0
@@ -2025,7 +2064,8 @@ export default function Home() {
     day: DayData,
     frameMedications: Medication[],
     scheduledTime: string,
-    medicationNames: string
+    medicationNames: string,
+    forceDispense: boolean = false
   ) => {
     // Update UI to show dispensing
     setDays(prevDays => 
@@ -2043,7 +2083,7 @@ export default function Home() {
     console.log(`🎯 Time frame dispense: ${day.name} ${TIME_FRAMES[targetTimeFrame].label} → Target angle: ${targetAngle}° (Current: ${currentAngle}°)`)
     
     // Move directly to the target angle for this time frame
-    const response = await dispenseToPi('servo1', medicationNames, targetAngle, day.selectedDate || undefined, scheduledTime, targetTimeFrame)
+    const response = await dispenseToPi('servo1', medicationNames, targetAngle, day.selectedDate || undefined, scheduledTime, targetTimeFrame, forceDispense)
     console.log('✅ Manual dispense bundle response:', response)
     
     // Update last known servo1 angle from response
@@ -2051,6 +2091,17 @@ export default function Home() {
       setLastServo1Angle(response.servo1_angle)
     }
     
+    // The Pi already dispensed this slot - nothing moved, so don't leave the day as dispensing
+    if (response?.status === 'duplicate') {
+      setDays(prevDays => 
+        prevDays.map(d => 
+          d.dayOfWeek === dayOfWeek 
+            ? { ...d, status: 'ready' }
+            : d
+        )
+      )
+    }
+    
     return response
   }
 
@@ -2256,7 +2307,7 @@ export default function Home() {
       
       // Move directly to the target angle for this time frame
       // If already at target, it will stay there (server handles this)
-      const response = await dispenseToPi('servo1', medicationNames, targetAngle, day.selectedDate || undefined, scheduledTime, targetTimeFrame)
+      const response = await dispenseToPi('servo1', medicationNames, targetAngle, day.selectedDate || undefined, scheduledTime, targetTimeFrame, forceDispense)
       console.log('✅ Manual dispense bundle response:', response)
       
       // Update last known servo1 angle from response
@@ -2264,6 +2315,24 @@ export default function Home() {
         setLastServo1Angle(response.servo1_angle)
       }
       
+      // The Pi already dispensed this slot (its local scheduler, or another client) - the servo
+      // didn't move, so no SMS, no servo2 and no history row (the Pi's own dispense is logged
+      // through setLocalDispenseCallback)
+      if (response?.status === 'duplicate') {
+        console.log('⏭️ Pi reports this slot was already dispensed:', response?.message)
+        showNotification(`${day.name} ${TIME_FRAMES[targetTimeFrame].label} was already dispensed by the Pi.`, 'info')
+        setDays(prevDays => {
+          const updated = prevDays.map(d => 
+            d.dayOfWeek === dayOfWeek 
+              ? { ...d, status: 'ready' }
+              : d
+          )
+          daysRef.current = updated // Update ref
+          return updated
+        })
+        return
+      }
+      
       // Check if servo1 is at 180° (needs confirmation to reset)
       const isAt180 = response?.servo1_at_180 === true
       const servo2Ready = response?.servo2_ready === true
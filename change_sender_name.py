@@ -5,31 +5,14 @@ Tries multiple methods to set the sender name
 Note: Sender name is usually controlled by carrier, but we'll try all methods
 """
 
-import serial
-import time
 import sys
+import os
 
-def send_at_command(ser, command, timeout=5):
-    """Send AT command and get response"""
-    try:
-        ser.reset_input_buffer()
-        time.sleep(0.2)
-        ser.write(f"{command}\r\n".encode())
-        time.sleep(0.5)
-        
-        response = ""
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            if ser.in_waiting > 0:
-                chunk = ser.read(ser.in_waiting).decode('utf-8', errors='ignore')
-                response += chunk
-                if 'OK' in response or 'ERROR' in response:
-                    break
-            time.sleep(0.1)
-        
-        return response.strip()
-    except Exception as e:
-        return f"ERROR: {e}"
+try:
+    from simcom_at import open_modem
+except ImportError:  # Run from the repo root: the shared AT client lives in pi-server/
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pi-server'))
+    from simcom_at import open_modem
 
 def change_sender_name():
     """Try to change sender name to PillPal"""
@@ -45,20 +28,11 @@ def change_sender_name():
     baudrate = 115200
     
     print(f"Connecting to {port} at {baudrate} baud...")
-    try:
-        ser = serial.Serial(port=port, baudrate=baudrate, timeout=5, writeTimeout=5)
-        time.sleep(2)
-        print("✅ Connected")
-    except Exception as e:
-        print(f"❌ Connection failed: {e}")
-        return False
-    
-    # Test communication
-    response = send_at_command(ser, "AT")
-    if "OK" not in response:
-        print("❌ Module not responding")
-        ser.close()
+    at = open_modem(port, (baudrate,))
+    if at is None:
+        print("❌ Connection failed: module not answering AT")
         return False
+    print("✅ Connected")
     
     print("\n" + "=" * 70)
     print("Method 1: Phonebook Entry (AT+CPBW)")
@@ -66,15 +40,15 @@ def change_sender_name():
     
     # Set character set to GSM
     print("Setting character set to GSM...")
-    response = send_at_command(ser, 'AT+CSCS="GSM"')
+    response = at.command('AT+CSCS="GSM"')
     print(f"Response: {response}")
     
     # Try to write "PillPal" to phonebook
     print("Writing 'PillPal' to phonebook...")
-    response = send_at_command(ser, 'AT+CPBW=1,"PillPal",129,"PillPal"')
+    response = at.command('AT+CPBW=1,"PillPal",129,"PillPal"')
     print(f"Response: {response}")
     
-    if "OK" in response:
+    if response.ok:
         print("✅ Phonebook entry written")
     else:
         print("⚠️ Phonebook method may not be supported")
@@ -85,12 +59,12 @@ def change_sender_name():
     
     # Check manufacturer
     print("Checking device manufacturer...")
-    response = send_at_command(ser, "AT+CGMI")
+    response = at.command("AT+CGMI")
     print(f"Manufacturer: {response}")
     
     # Check model
     print("Checking device model...")
-    response = send_at_command(ser, "AT+CGMM")
+    response = at.command("AT+CGMM")
     print(f"Model: {response}")
     
     print("\n" + "=" * 70)
@@ -99,12 +73,12 @@ def change_sender_name():
     
     # Check phonebook storage
     print("Checking phonebook storage...")
-    response = send_at_command(ser, "AT+CPBS?")
+    response = at.command("AT+CPBS?")
     print(f"Response: {response}")
     
     # Try to read phonebook entry 1
     print("Reading phonebook entry 1...")
-    response = send_at_command(ser, "AT+CPBR=1")
+    response = at.command("AT+CPBR=1")
     print(f"Response: {response}")
     
     print("\n" + "=" * 70)
@@ -113,7 +87,7 @@ def change_sender_name():
     print("Note: This usually doesn't change sender name, but we'll try...")
     
     # Get current service center
-    response = send_at_command(ser, "AT+CSCA?")
+    response = at.command("AT+CSCA?")
     print(f"Current service center: {response}")
     
     print("\n" + "=" * 70)
@@ -140,7 +114,7 @@ def change_sender_name():
     print("   'PillPal: It's time for your medicine...'")
     print()
     
-    ser.close()
+    at.ser.close()
     return True
 
 if __name__ == "__main__":
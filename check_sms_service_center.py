@@ -3,31 +3,14 @@
 Check and Set SMS Service Center for Smart Network
 """
 
-import serial
-import time
 import sys
+import os
 
-def send_at_command(ser, command, timeout=5):
-    """Send AT command and get response"""
-    try:
-        ser.reset_input_buffer()
-        time.sleep(0.2)
-        ser.write(f"{command}\r\n".encode())
-        time.sleep(0.3)
-        
-        response = ""
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            if ser.in_waiting > 0:
-                chunk = ser.read(ser.in_waiting).decode('utf-8', errors='ignore')
-                response += chunk
-                if 'OK' in response or 'ERROR' in response:
-                    break
-            time.sleep(0.1)
-        
-        return response.strip()
-    except Exception as e:
-        return f"ERROR: {e}"
+try:
+    from simcom_at import REGISTERED, open_modem
+except ImportError:  # Run from the repo root: the shared AT client lives in pi-server/
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pi-server'))
+    from simcom_at import REGISTERED, open_modem
 
 def check_and_set_service_center():
     """Check current service center and set Smart network if needed"""
@@ -40,20 +23,18 @@ def check_and_set_service_center():
     baudrate = 115200
     
     print(f"Connecting to {port} at {baudrate} baud...")
-    try:
-        ser = serial.Serial(port=port, baudrate=baudrate, timeout=5, writeTimeout=5)
-        time.sleep(2)
-        print("✅ Connected")
-    except Exception as e:
-        print(f"❌ Connection failed: {e}")
+    at = open_modem(port, (baudrate,))
+    if at is None:
+        print("❌ Connection failed: module not answering AT")
         return False
+    print("✅ Connected")
     
     # Check current service center
     print()
     print("Checking current SMS service center...")
     print("-" * 70)
-    response = send_at_command(ser, "AT+CSCA?")
-    print(f"Response: {response}")
+    current_sc = at.service_center() or ""
+    print(f"   Current Service Center: {current_sc or 'not set'}")
     
     # Smart network service center numbers (Philippines)
     # Smart: +639170000130 or +639170000131
@@ -66,21 +47,10 @@ def check_and_set_service_center():
         "09170000131"     # Without +
     ]
     
-    current_sc = ""
-    if "+CSCA:" in response:
-        try:
-            # Extract service center from response
-            parts = response.split("+CSCA:")[1].strip().split(",")
-            if len(parts) >= 1:
-                current_sc = parts[0].strip().replace('"', '')
-                print(f"   Current Service Center: {current_sc}")
-        except:
-            pass
-    
     # Check if it's a Smart number
     is_smart = False
     for sc in smart_service_centers:
-        if sc in current_sc or current_sc in sc:
+        if current_sc and (sc in current_sc or current_sc in sc):
             is_smart = True
             break
     
@@ -97,15 +67,14 @@ def check_and_set_service_center():
     
     # Try Smart main service center
     smart_sc = "+639170000130"
-    response = send_at_command(ser, f'AT+CSCA="{smart_sc}"', timeout=5)
+    response = at.command(f'AT+CSCA="{smart_sc}"', timeout=5)
     print(f"Setting to {smart_sc}: {response}")
     
     # Verify it was set
-    time.sleep(0.5)
-    response = send_at_command(ser, "AT+CSCA?")
-    print(f"Verification: {response}")
+    new_sc = at.service_center()
+    print(f"Verification: {new_sc}")
     
-    if "+CSCA:" in response and smart_sc in response:
+    if new_sc == smart_sc:
         print("   ✅ Service center set successfully")
     else:
         print("   ⚠️ Service center may not have been set (this is OK if already correct)")
@@ -114,7 +83,7 @@ def check_and_set_service_center():
     print()
     print("Checking network operator...")
     print("-" * 70)
-    response = send_at_command(ser, "AT+COPS?")
+    response = at.command("AT+COPS?").text
     print(f"Response: {response}")
     
     if "SMART" in response.upper() or "51503" in response:
@@ -128,20 +97,11 @@ def check_and_set_service_center():
     print()
     print("Checking network registration...")
     print("-" * 70)
-    response = send_at_command(ser, "AT+CREG?")
-    print(f"Response: {response}")
-    
-    if "+CREG:" in response:
-        try:
-            parts = response.split("+CREG:")[1].strip().split(",")
-            if len(parts) >= 2:
-                stat = int(parts[1].strip())
-                if stat in [1, 2, 5]:
-                    print(f"   ✅ Network registered (status: {stat})")
-                else:
-                    print(f"   ⚠️ Network not fully registered (status: {stat})")
-        except:
-            pass
+    stat = at.registration()
+    if stat in REGISTERED:
+        print(f"   ✅ Network registered (status: {stat})")
+    else:
+        print(f"   ⚠️ Network not fully registered (status: {stat})")
     
     print()
     print("=" * 70)
@@ -155,7 +115,7 @@ def check_and_set_service_center():
     print("4. If SMS fails, check network registration and signal strength")
     print()
     
-    ser.close()
+    at.ser.close()
     return True
 
 if __name__ == "__main__":
@@ -5,30 +5,14 @@ Checks why module is not responding consistently
 """
 
 import serial
-import time
 import sys
+import os
 
-def send_at_command(ser, command, timeout=5):
-    """Send AT command and get response"""
-    try:
-        ser.reset_input_buffer()
-        time.sleep(0.2)
-        ser.write(f"{command}\r\n".encode())
-        time.sleep(0.3)
-        
-        response = ""
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            if ser.in_waiting > 0:
-                chunk = ser.read(ser.in_waiting).decode('utf-8', errors='ignore')
-                response += chunk
-                if 'OK' in response or 'ERROR' in response or '>' in response:
-                    break
-            time.sleep(0.1)
-        
-        return response.strip()
-    except Exception as e:
-        return f"ERROR: {e}"
+try:
+    from simcom_at import ATClient
+except ImportError:  # Run from the repo root: the shared AT client lives in pi-server/
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pi-server'))
+    from simcom_at import ATClient
 
 def diagnose_module():
     """Diagnose SIMCOM module issues"""
@@ -42,8 +26,7 @@ def diagnose_module():
     
     print(f"Connecting to {port} at {baudrate} baud...")
     try:
-        ser = serial.Serial(port=port, baudrate=baudrate, timeout=5, writeTimeout=5)
-        time.sleep(2)
+        at = ATClient(serial.Serial(port=port, baudrate=baudrate, write_timeout=5))
         print("✅ Connected")
     except Exception as e:
         print(f"❌ Connection failed: {e}")
@@ -55,13 +38,12 @@ def diagnose_module():
     print("-" * 70)
     at_success = 0
     for i in range(5):
-        response = send_at_command(ser, "AT", timeout=3)
-        if "OK" in response:
+        response = at.command("AT", timeout=3)
+        if response.ok:
             at_success += 1
-            print(f"   Attempt {i+1}: ✅ OK")
+            print(f"   Attempt {i+1}: ✅ OK ({response.elapsed * 1000:.0f} ms)")
         else:
-            print(f"   Attempt {i+1}: ❌ Failed - {response[:50]}")
-        time.sleep(0.5)
+            print(f"   Attempt {i+1}: ❌ Failed - {response.text[:50] or response.error}")
     
     print(f"\n   Result: {at_success}/5 successful")
     if at_success < 3:
@@ -73,22 +55,22 @@ def diagnose_module():
     print("-" * 70)
     
     # Check SIM card
-    response = send_at_command(ser, "AT+CPIN?")
+    response = at.command("AT+CPIN?")
     print(f"   SIM Status: {response}")
     
     # Check network
-    response = send_at_command(ser, "AT+CREG?")
+    response = at.command("AT+CREG?")
     print(f"   Network: {response}")
     
     # Check signal
-    response = send_at_command(ser, "AT+CSQ")
+    response = at.command("AT+CSQ")
     print(f"   Signal: {response}")
     
     # Test 3: SMS mode check
     print()
     print("TEST 3: SMS Mode Check")
     print("-" * 70)
-    response = send_at_command(ser, "AT+CMGF?")
+    response = at.command("AT+CMGF?")
     print(f"   SMS Mode: {response}")
     
     # Test 4: Try to get CMGS prompt
@@ -97,28 +79,22 @@ def diagnose_module():
     print("-" * 70)
     print("   Sending AT+CMGS command (will cancel with Ctrl+C equivalent)...")
     
-    ser.reset_input_buffer()
-    time.sleep(0.2)
-    ser.write(b'AT+CMGS="+639276760439"\r\n')
-    time.sleep(1)
-    
-    response = ""
-    start_time = time.time()
-    while time.time() - start_time < 5:
-        if ser.in_waiting > 0:
-            chunk = ser.read(ser.in_waiting).decode('utf-8', errors='ignore')
-            response += chunk
-            if '>' in response:
-                print(f"   ✅ Got '>' prompt: {response}")
-                # Cancel by sending Ctrl+C (0x03)
-                ser.write(b'\x03')
-                time.sleep(0.5)
-                break
-        time.sleep(0.1)
-    
-    if '>' not in response:
+    response = at.command('AT+CMGS="+639276760439"', timeout=5, expect_prompt=True)
+    prompt_ok = response.prompt
+    if prompt_ok:
+        print(f"   ✅ Got '>' prompt after {response.elapsed * 1000:.0f} ms")
+    else:
         print(f"   ❌ No '>' prompt received")
-        print(f"   Response: {response[:200]}")
+        print(f"   Response: {response.text[:200] or response.error}")
+    # Abort the SMS input (ESC) so nothing is sent
+    at.cancel()
+    
+    # Unsolicited messages seen during the run (e.g. +CPIN, Call Ready, +CREG)
+    if at.urcs:
+        print()
+        print("   Unsolicited messages from the module:")
+        for _, line in at.urcs:
+            print(f"      {line}")
     
     # Test 5: Check for pending operations
     print()
@@ -126,11 +102,11 @@ def diagnose_module():
     print("-" * 70)
     
     # Check if there are any pending SMS
-    response = send_at_command(ser, "AT+CPMS?")
+    response = at.command("AT+CPMS?")
     print(f"   SMS Storage: {response}")
     
     # Check module status
-    response = send_at_command(ser, "AT+CSCLK?")
+    response = at.command("AT+CSCLK?")
     print(f"   Sleep Mode: {response}")
     
     # Final summary
@@ -156,7 +132,7 @@ def diagnose_module():
         print("3. Check USB connection and power")
         print("4. Try power cycling the module")
     
-    if '>' not in response:
+    if not prompt_ok:
         print()
         print("❌ PROBLEM: Module not sending '>' prompt")
         print()
@@ -172,7 +148,7 @@ def diagnose_module():
         print("3. Wait longer for prompt")
         print("4. Check if module is ready")
     
-    ser.close()
+    at.ser.close()
     return True
 
 if __name__ == "__main__":
@@ -4,31 +4,14 @@ Fix SMS Service Center Configuration
 Sets the SMS service center for Globe SIM (Philippines)
 """
 
-import serial
-import time
 import sys
+import os
 
-def send_at_command(ser, command, timeout=5):
-    """Send AT command and get response"""
-    try:
-        ser.reset_input_buffer()
-        time.sleep(0.2)
-        ser.write(f"{command}\r\n".encode())
-        time.sleep(0.3)
-        
-        response = ""
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            if ser.in_waiting > 0:
-                chunk = ser.read(ser.in_waiting).decode('utf-8', errors='ignore')
-                response += chunk
-                if 'OK' in response or 'ERROR' in response:
-                    break
-            time.sleep(0.1)
-        
-        return response.strip()
-    except Exception as e:
-        return f"ERROR: {e}"
+try:
+    from simcom_at import open_modem
+except ImportError:  # Run from the repo root: the shared AT client lives in pi-server/
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pi-server'))
+    from simcom_at import open_modem
 
 def fix_service_center():
     """Check and set SMS service center"""
@@ -41,37 +24,21 @@ def fix_service_center():
     baudrate = 115200
     
     print(f"Connecting to {port} at {baudrate} baud...")
-    try:
-        ser = serial.Serial(port=port, baudrate=baudrate, timeout=5, writeTimeout=5)
-        time.sleep(2)
-        print("✅ Connected")
-    except Exception as e:
-        print(f"❌ Connection failed: {e}")
-        return False
-    
-    # Test communication
-    response = send_at_command(ser, "AT")
-    if "OK" not in response:
+    at = open_modem(port, (baudrate,))
+    if at is None:
         print(f"❌ Module not responding")
-        ser.close()
         return False
+    print("✅ Connected")
     
     # Check current service center
     print("\nChecking current SMS service center...")
-    response = send_at_command(ser, "AT+CSCA?")
-    print(f"Response: {response}")
+    sca = at.service_center()
+    print(f"Current service center: {sca}")
     
-    if "+CSCA:" in response:
-        try:
-            sca = response.split("+CSCA:")[1].strip().strip('"')
-            print(f"✅ Current service center: {sca}")
-            
-            if sca and len(sca) > 5:
-                print("\n✅ Service center is configured!")
-                ser.close()
-                return True
-        except:
-            pass
+    if sca and len(sca) > 5:
+        print("\n✅ Service center is configured!")
+        at.ser.close()
+        return True
     
     # Service center not configured or empty
     print("\n⚠️ Service center not configured or empty")
@@ -87,20 +54,19 @@ def fix_service_center():
     
     for center in globe_centers:
         print(f"Trying: {center}...")
-        response = send_at_command(ser, f'AT+CSCA="{center}"', timeout=10)
+        response = at.command(f'AT+CSCA="{center}"', timeout=10)
         print(f"Response: {response}")
         
-        if "OK" in response:
+        if response.ok:
             print(f"✅ Service center set to: {center}")
             
             # Verify it was set
-            time.sleep(1)
-            response = send_at_command(ser, "AT+CSCA?")
-            print(f"\nVerification: {response}")
+            sca = at.service_center()
+            print(f"\nVerification: {sca}")
             
-            if center in response:
+            if sca == center:
                 print("✅ Service center verified!")
-                ser.close()
+                at.ser.close()
                 return True
         else:
             print(f"❌ Failed to set service center")
@@ -113,7 +79,7 @@ def fix_service_center():
     print("   sudo minicom -D /dev/ttyS0 -b 115200")
     print("   Then type: AT+CSCA=\"+639170000130\"")
     
-    ser.close()
+    at.ser.close()
     return False
 
 if __name__ == "__main__":
@@ -4,34 +4,17 @@ Force Network Registration
 Manually registers with network (Globe) if automatic registration fails
 """
 
-import serial
-import time
 import sys
+import os
 
-def send_at_command(ser, command, timeout=10):
-    """Send AT command and get response"""
-    try:
-        ser.reset_input_buffer()
-        time.sleep(0.2)
-        ser.write(f"{command}\r\n".encode())
-        time.sleep(0.5)
-        
-        response = ""
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            if ser.in_waiting > 0:
-                chunk = ser.read(ser.in_waiting).decode('utf-8', errors='ignore')
-                response += chunk
-                if 'OK' in response or 'ERROR' in response:
-                    break
-            time.sleep(0.1)
-        
-        return response.strip()
-    except Exception as e:
-        return f"ERROR: {e}"
+try:
+    from simcom_at import REGISTERED, REGISTRATION_STATES, open_modem
+except ImportError:  # Run from the repo root: the shared AT client lives in pi-server/
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pi-server'))
+    from simcom_at import REGISTERED, REGISTRATION_STATES, open_modem
 
 def force_network_register():
-    """Force network registration"""
+    """Force network registration (waits on +CREG notifications instead of fixed sleeps)"""
     print("=" * 70)
     print("Force Network Registration Tool")
     print("=" * 70)
@@ -41,79 +24,53 @@ def force_network_register():
     baudrate = 115200
     
     print(f"Connecting to {port} at {baudrate} baud...")
-    try:
-        ser = serial.Serial(port=port, baudrate=baudrate, timeout=10, writeTimeout=10)
-        time.sleep(2)
-        print("✅ Connected")
-    except Exception as e:
-        print(f"❌ Connection failed: {e}")
-        return False
-    
-    # Test communication
-    response = send_at_command(ser, "AT")
-    if "OK" not in response:
+    at = open_modem(port, (baudrate,))
+    if at is None:
         print("❌ Module not responding")
-        ser.close()
         return False
+    print("✅ Connected")
     
     # Check current registration
     print("\n1. Checking current registration status...")
-    response = send_at_command(ser, "AT+CREG?")
-    print(f"   Response: {response}")
+    stat = at.registration()
+    print(f"   Status: {stat} ({REGISTRATION_STATES.get(stat, 'no answer')})")
     
     # Enable network registration notifications
     print("\n2. Enabling network registration notifications...")
-    response = send_at_command(ser, "AT+CREG=2")
+    response = at.command("AT+CREG=1")
     print(f"   Response: {response}")
-    time.sleep(2)
     
     # Check signal strength
     print("\n3. Checking signal strength...")
-    response = send_at_command(ser, "AT+CSQ")
-    print(f"   Response: {response}")
-    
-    signal = 0
-    if "+CSQ:" in response:
-        try:
-            signal = int(response.split("+CSQ:")[1].strip().split(",")[0].strip())
-            if signal == 99:
-                print("   ⚠️ Signal: Unknown/Not detectable (99)")
-                print("   ⚠️ This is bad - check antenna and location")
-            elif signal == 0:
-                print(f"   ❌ Signal: NO SIGNAL ({signal}/31)")
-            else:
-                print(f"   ✅ Signal: {signal}/31")
-        except:
-            pass
+    quality = at.signal_quality()
+    signal = quality[0] if quality else 0
+    if quality is None or signal == 99:
+        print("   ⚠️ Signal: Unknown/Not detectable (99)")
+        print("   ⚠️ This is bad - check antenna and location")
+    elif signal == 0:
+        print(f"   ❌ Signal: NO SIGNAL ({signal}/31)")
+    else:
+        print(f"   ✅ Signal: {signal}/31")
     
     # Search for available networks
     print("\n4. Searching for available networks...")
     print("   This may take 30-60 seconds...")
-    response = send_at_command(ser, "AT+COPS=?", timeout=60)
-    print(f"   Response: {response[:500]}...")  # Show first 500 chars
+    response = at.command("AT+COPS=?", timeout=90)
+    print(f"   Response: {response.text[:500]}...")  # Show first 500 chars
     
     # Try automatic registration first
     print("\n5. Trying automatic network registration...")
-    response = send_at_command(ser, "AT+COPS=0", timeout=30)
-    print(f"   Response: {response}")
-    time.sleep(5)
-    
-    # Check registration status
-    print("\n6. Checking registration status...")
-    response = send_at_command(ser, "AT+CREG?")
+    response = at.command("AT+COPS=0", timeout=30)
     print(f"   Response: {response}")
     
-    if "+CREG:" in response:
-        try:
-            parts = response.split("+CREG:")[1].strip().split(",")
-            if len(parts) >= 2:
-                stat = int(parts[1].strip())
-                if stat == 1 or stat == 2 or stat == 5:
-                    print("   ✅ Network registered!")
-                    ser.close()
-                    return True
-        except:
-            pass
+    # Wait for the module to report registration
+    print("\n6. Waiting for registration (up to 20 s)...")
+    stat = at.wait_registered(20)
+    print(f"   Status: {stat} ({REGISTRATION_STATES.get(stat, 'no answer')})")
+    if stat in REGISTERED:
+        print("   ✅ Network registered!")
+        at.ser.close()
+        return True
     
     # If automatic failed, try manual registration with Globe
     print("\n7. Automatic registration failed, trying manual registration...")
@@ -123,55 +80,36 @@ def force_network_register():
     
     for code in globe_codes:
         print(f"\n   Trying Globe network code: {code}...")
-        response = send_at_command(ser, f'AT+COPS=1,2,"{code}"', timeout=30)
+        response = at.command(f'AT+COPS=1,2,"{code}"', timeout=60)
         print(f"   Response: {response}")
         
-        if "OK" in response:
+        if response.ok:
             print("   ✅ Registration command accepted, waiting...")
-            time.sleep(10)  # Wait for registration
-            
-            # Check status
-            response = send_at_command(ser, "AT+CREG?")
-            print(f"   Registration status: {response}")
-            
-            if "+CREG:" in response:
-                try:
-                    parts = response.split("+CREG:")[1].strip().split(",")
-                    if len(parts) >= 2:
-                        stat = int(parts[1].strip())
-                        if stat == 1 or stat == 2 or stat == 5:
-                            print(f"   ✅ Successfully registered with network {code}!")
-                            ser.close()
-                            return True
-                except:
-                    pass
+            stat = at.wait_registered(15)
+            print(f"   Registration status: {stat}")
+            if stat in REGISTERED:
+                print(f"   ✅ Successfully registered with network {code}!")
+                at.ser.close()
+                return True
     
     # Final check
     print("\n8. Final registration check...")
-    response = send_at_command(ser, "AT+CREG?")
-    print(f"   Response: {response}")
-    
-    if "+CREG:" in response:
-        try:
-            parts = response.split("+CREG:")[1].strip().split(",")
-            if len(parts) >= 2:
-                stat = int(parts[1].strip())
-                if stat == 1 or stat == 2 or stat == 5:
-                    print("\n✅ NETWORK REGISTERED!")
-                    ser.close()
-                    return True
-                else:
-                    print(f"\n❌ Network still not registered (status: {stat})")
-                    print("\nTroubleshooting:")
-                    print("1. Check antenna connection")
-                    print("2. Move to better location (near window)")
-                    print("3. Wait longer (some modules need 1-2 minutes)")
-                    print("4. Check if SIM card has active service")
-                    print("5. Power cycle the module (unplug/replug USB)")
-        except:
-            pass
-    
-    ser.close()
+    stat = at.registration()
+    print(f"   Status: {stat}")
+    
+    if stat in REGISTERED:
+        print("\n✅ NETWORK REGISTERED!")
+        at.ser.close()
+        return True
+    print(f"\n❌ Network still not registered (status: {stat})")
+    print("\nTroubleshooting:")
+    print("1. Check antenna connection")
+    print("2. Move to better location (near window)")
+    print("3. Wait longer (some modules need 1-2 minutes)")
+    print("4. Check if SIM card has active service")
+    print("5. Power cycle the module (unplug/replug USB)")
+    
+    at.ser.close()
     return False
 
 if __name__ == "__main__":
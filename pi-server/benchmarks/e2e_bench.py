@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmarks for the PillPal Pi server
+
+Runs the real handle_client behind a local websocket server, with simulated hardware
+in place of the PCA9685, the I2C LCD and the SIMCOM modem, and measures:
+  - dispense       request -> reply round trip for servo1 dispenses
+  - servo2         servo2_dispense cycle time (includes the handler's fixed waits)
+  - sms            send_sms batch throughput (request -> sms_status broadcast)
+  - schedules      update_schedules cost versus schedule count (changed and unchanged pushes)
+  - button         button_press fan-out latency versus connected client count
+
+The simulated devices answer like the real ones (servo/LCD writes cost I2C time, the modem
+speaks the AT commands SMSController uses), so the numbers include the server's own
+sleeps and retries. GPIO (LEDs, buzzer, button) stays in demo mode.
+
+Usage (from pi-server/):
+    python3 benchmarks/e2e_bench.py --json e2e.json
+    python3 benchmarks/e2e_bench.py --only dispense,schedules --compare e2e.json
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from collections import deque
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+import websockets  # noqa: E402
+
+import pi_websocket_server_PCA9685 as server  # noqa: E402
+
+BENCHMARKS = ("dispense", "servo2", "sms", "schedules", "button")
+
+
+# ---------------------------------------------------------------------------
+# Simulated hardware
+# ---------------------------------------------------------------------------
+
+class SimI2CBus:
+    """Counts I2C transactions and charges each one a fixed bus time"""
+    
+    def __init__(self, write_seconds: float = 0.0005):
+        self.write_seconds = write_seconds
+        self.writes = 0
+    
+    def write(self, count: int = 1):
+        self.writes += count
+        time.sleep(self.write_seconds * count)
+
+
+class SimServo:
+    def __init__(self, bus: SimI2CBus):
+        self._bus = bus
+        self._angle = None
+        self.actuation_range = 180
+    
+    def set_pulse_width_range(self, min_pulse: int, max_pulse: int):
+        self._bus.write()
+    
+    @property
+    def angle(self):
+        return self._angle
+    
+    @angle.setter
+    def angle(self, value):
+        self._bus.write()
+        self._angle = value
+
+
+class SimServoKit:
+    """adafruit_servokit.ServoKit stand-in"""
+    
+    def __init__(self, bus: SimI2CBus, channels: int = 16, address: int = 0x40):
+        self.address = address
+        self.servo = [SimServo(bus) for _ in range(channels)]
+
+
+class SimCharLCD:
+    """RPLCD CharLCD stand-in: clear() is slow on an HD44780, each character is one write"""
+    
+    CLEAR_SECONDS = 0.002
+    
+    def __init__(self, bus: SimI2CBus):
+        self._bus = bus
+        self.cursor_pos = (0, 0)
+    
+    def clear(self):
+        self._bus.write()
+        time.sleep(self.CLEAR_SECONDS)
+    
+    def write_string(self, text: str):
+        self._bus.write(len(text))
+
+
+class SimModem:
+    """pyserial stand-in answering the AT commands SMSController sends"""
+    
+    def __init__(self, latency: float = 0.02, send_seconds: float = 0.5):
+        self.latency = latency  # Command -> response delay
+        self.send_seconds = send_seconds  # Ctrl+Z -> +CMGS delay (network submit)
+        self.timeout = 3  # Like pyserial: read() waits this long for the first byte
+        self.closed = False
+        self.sent = 0
+        self._pending = deque()  # (ready monotonic time, bytes)
+        self._rx = bytearray()
+        self._line = bytearray()
+        self._composing = False  # Between the '>' prompt and Ctrl+Z
+    
+    def _reply(self, text: str, delay: float = None):
+        ready = time.monotonic() + (self.latency if delay is None else delay)
+        self._pending.append((ready, text.encode()))
+    
+    def _pump(self):
+        now = time.monotonic()
+        while self._pending and self._pending[0][0] <= now:
+            self._rx += self._pending.popleft()[1]
+    
+    @property
+    def in_waiting(self) -> int:
+        self._pump()
+        return len(self._rx)
+    
+    def read(self, size: int = 1) -> bytes:
+        self._pump()
+        if not self._rx and self.timeout:
+            # Block until the next reply is due or the timeout passes, as a real port does
+            deadline = time.monotonic() + self.timeout
+            wake = min(self._pending[0][0], deadline) if self._pending else deadline
+            time.sleep(max(0.0, wake - time.monotonic()))
+            self._pump()
+        data = bytes(self._rx[:size])
+        del self._rx[:size]
+        return data
+    
+    def reset_input_buffer(self):
+        self._pump()
+        self._rx.clear()
+    
+    def reset_output_buffer(self):
+        pass
+    
+    def close(self):
+        self.closed = True
+    
+    def write(self, data: bytes) -> int:
+        for byte in data:
+            if self._composing:
+                if byte == 0x1A:  # Ctrl+Z submits the message
+                    self._composing = False
+                    self.sent += 1
+                    self._reply(f"\r\n+CMGS: {self.sent}\r\n\r\nOK\r\n", delay=self.send_seconds)
+                elif byte == 0x1B:  # ESC aborts it
+                    self._composing = False
+            elif byte == 0x0D:
+                self._command(self._line.decode(errors="ignore").strip())
+                self._line.clear()
+            elif byte not in (0x0A, 0x03, 0x1B):
+                self._line.append(byte)
+        return len(data)
+    
+    def _command(self, command: str):
+        command = command.upper()
+        if not command:
+            return
+        if command.startswith("AT+CMGS="):
+            self._composing = True
+            self._reply("\r\n> ")
+        elif command == "AT+CPIN?":
+            self._reply("\r\n+CPIN: READY\r\n\r\nOK\r\n")
+        elif command == "AT+CSQ":
+            self._reply("\r\n+CSQ: 20,0\r\n\r\nOK\r\n")
+        elif command == "AT+CREG?":
+            self._reply("\r\n+CREG: 0,1\r\n\r\nOK\r\n")
+        else:
+            self._reply("\r\nOK\r\n")
+
+
+def install_sim_hardware(position_file: str) -> SimI2CBus:
+    """Build the app in demo mode, then put simulated devices behind the servo, LCD and SMS controllers"""
+    controllers = server.create_app(demo_mode=True, log_profile="quiet")
+    bus = SimI2CBus()
+    
+    servo = controllers["servo"]
+    servo.POSITION_FILE = position_file
+    servo.demo_mode = False
+    server.ServoKit = lambda **kwargs: SimServoKit(bus, **kwargs)
+    server.PCA9685_AVAILABLE = True
+    servo._initialize_servos()
+    
+    lcd = controllers["lcd"]
+    lcd.demo_mode = False
+    lcd.lcd = SimCharLCD(bus)
+    
+    sms = controllers["sms"]
+    sms.demo_mode = False
+    sms.serial = SimModem()
+    sms.sim_inserted = True
+    return bus
+
+
+# ---------------------------------------------------------------------------
+# Client side
+# ---------------------------------------------------------------------------
+
+class BenchClient:
+    """Websocket client matching replies by request_id; other frames go to event handlers"""
+    
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self._ids = itertools.count(1)
+        self._waiters = {}
+        self._event_waiters = {}  # type -> list of futures
+        self.on_event = None  # Optional callback(message, received_at)
+        self._reader = asyncio.create_task(self._read())
+    
+    @classmethod
+    async def connect(cls, uri: str) -> "BenchClient":
+        return cls(await websockets.connect(uri, max_size=None))
+    
+    async def _read(self):
+        async for frame in self.websocket:
+            received_at = time.perf_counter()
+            message = json.loads(frame)
+            waiter = self._waiters.pop(message.get("request_id"), None)
+            if waiter is not None:
+                waiter.set_result(message)
+                continue
+            for future in self._event_waiters.pop(message.get("type"), []):
+                if not future.done():
+                    future.set_result(message)
+            if self.on_event is not None:
+                self.on_event(message, received_at)
+    
+    async def request(self, message: dict) -> dict:
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[request_id] = future
+        await self.websocket.send(json.dumps({**message, "request_id": request_id}))
+        return await future
+    
+    def next_event(self, message_type: str) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._event_waiters.setdefault(message_type, []).append(future)
+        return future
+    
+    async def close(self):
+        await self.websocket.close()
+        self._reader.cancel()
+
+
+def summarize(seconds: list) -> dict:
+    ms = sorted(s * 1000 for s in seconds)
+    return {
+        "n": len(ms),
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "p50_ms": round(statistics.median(ms), 3),
+        "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 3),
+        "max_ms": round(ms[-1], 3),
+    }
+
+
+async def timed(coro):
+    started = time.perf_counter()
+    result = await coro
+    return result, time.perf_counter() - started
+
+
+# ---------------------------------------------------------------------------
+# Benchmarks
+# ---------------------------------------------------------------------------
+
+async def bench_dispense(uri: str, args) -> dict:
+    client = await BenchClient.connect(uri)
+    samples = []
+    for i in range(args.dispenses):
+        reply, elapsed = await timed(client.request({
+            "type": "dispense", "servo_id": "servo1", "medication": f"bench-{i}"
+        }))
+        if reply.get("status") != "success":
+            raise RuntimeError(f"dispense failed: {reply}")
+        samples.append(elapsed)
+    await client.close()
+    return summarize(samples)
+
+
+async def bench_servo2(uri: str, args) -> dict:
+    client = await BenchClient.connect(uri)
+    samples = []
+    for _ in range(args.servo2_cycles):
+        reply, elapsed = await timed(client.request({"type": "servo2_dispense"}))
+        if reply.get("status") not in ("success", "partial_success"):
+            raise RuntimeError(f"servo2_dispense failed: {reply}")
+        samples.append(elapsed)
+    await client.close()
+    return summarize(samples)
+
+
+async def bench_sms(uri: str, args) -> dict:
+    client = await BenchClient.connect(uri)
+    results = {}
+    for size in args.sms_batches:
+        server.sms_controller.last_sms_time = 0  # Don't charge one batch for the previous one's rate limit
+        numbers = ["0917%07d" % i for i in range(size)]
+        status = client.next_event("sms_status")
+        started = time.perf_counter()
+        reply = await client.request({"type": "send_sms", "phone_numbers": numbers, "message": "Benchmark"})
+        queued = time.perf_counter() - started
+        outcome = await status
+        elapsed = time.perf_counter() - started
+        if not outcome.get("success"):
+            raise RuntimeError(f"SMS batch of {size} failed: {outcome}")
+        results[str(size)] = {
+            "queued_ms": round(queued * 1000, 3),
+            "total_ms": round(elapsed * 1000, 3),
+            "per_sms_ms": round(elapsed * 1000 / size, 3),
+            "sms_per_minute": round(size * 60 / elapsed, 2),
+            "reply_status": reply.get("status"),
+        }
+    await client.close()
+    return results
+
+
+def make_schedules(count: int, revision: int) -> list:
+    frames = ("morning", "afternoon", "evening")
+    return [{
+        "id": f"bench-{i}",
+        "date": "2030-01-%02d" % (1 + i % 28),
+        "time": "%02d:%02d" % (6 + i % 16, i % 60),
+        "time_frame": frames[i % 3],
+        "medication": f"med-{i}-r{revision}",
+    } for i in range(count)]
+
+
+async def bench_schedules(uri: str, args) -> dict:
+    client = await BenchClient.connect(uri)
+    revisions = itertools.count()
+    results = {}
+    for count in args.schedule_counts:
+        changed, unchanged = [], []
+        for _ in range(args.schedule_repeats):
+            schedules = make_schedules(count, next(revisions))
+            # Every entry differs from the stored set -> full re-parse and LCD redraw
+            reply, elapsed = await timed(client.request({"type": "update_schedules", "schedules": schedules}))
+            if reply.get("status") != "success":
+                raise RuntimeError(f"update_schedules failed: {reply}")
+            changed.append(elapsed)
+            # Same set again (the web app re-pushing) -> diff only
+            _, elapsed = await timed(client.request({"type": "update_schedules", "schedules": schedules}))
+            unchanged.append(elapsed)
+        results[str(count)] = {"changed": summarize(changed), "unchanged": summarize(unchanged)}
+    await client.close()
+    return results
+
+
+async def bench_button(uri: str, args) -> dict:
+    loop = asyncio.get_running_loop()
+    results = {}
+    for count in args.client_counts:
+        clients = [await BenchClient.connect(uri) for _ in range(count)]
+        samples, slowest = [], []
+        for _ in range(args.presses):
+            received = []
+            done = loop.create_future()
+            
+            def on_event(message, received_at, received=received, done=done):
+                if message.get("type") == "button_press":
+                    received.append(received_at)
+                    if len(received) == count and not done.done():
+                        done.set_result(None)
+            
+            for client in clients:
+                client.on_event = on_event
+            pressed_at = time.perf_counter()
+            server.button_monitor._handle_press(time.time())
+            await asyncio.wait_for(done, timeout=10)
+            latencies = [at - pressed_at for at in received]
+            samples.extend(latencies)
+            slowest.append(max(latencies))
+            await asyncio.sleep(server.ButtonMonitor.DEBOUNCE_TIME * 2)  # Stay clear of the debounce window
+        for client in clients:
+            await client.close()
+        results[str(count)] = {"per_client": summarize(samples), "last_client": summarize(slowest)}
+    return results
+
+
+async def run(args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        bus = install_sim_hardware(os.path.join(tmp, "servo_positions.json"))
+        server.event_store.open(os.path.join(tmp, "dispense_events.db"))  # Dispenses are recorded as in production
+        server.local_scheduler.STATE_FILE = os.path.join(tmp, "scheduler_state.json")
+        server.wire_listeners(asyncio.get_running_loop())
+        
+        ws_server = await websockets.serve(server.handle_client, "127.0.0.1", 0, **server.server_config.serve_kwargs())
+        port = ws_server.sockets[0].getsockname()[1]
+        uri = f"ws://127.0.0.1:{port}"
+        
+        results = {}
+        try:
+            for name in args.only:
+                print(f"▶ {name}...", flush=True)
+                results[name], elapsed = await timed(globals()[f"bench_{name}"](uri, args))
+                print(f"  done in {elapsed:.1f} s", flush=True)
+        finally:
+            ws_server.close()
+            await ws_server.wait_closed()
+        results["i2c_writes"] = bus.writes
+        return results
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    """{'schedules': {'100': {'changed': {'p50_ms': ..}}}} -> {'schedules.100.changed.p50_ms': ..}"""
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, path + "."))
+        elif isinstance(value, (int, float)):
+            flat[path] = value
+    return flat
+
+
+def compare(results: dict, baseline_path: str, tolerance: float) -> bool:
+    """Print p50/total changes against a previous run; False if any got slower than the tolerance"""
+    with open(baseline_path) as f:
+        baseline = flatten(json.load(f)["results"])
+    current = flatten(results)
+    ok = True
+    print(f"\nCompared with {baseline_path} (tolerance {tolerance:.0%}):")
+    for key, value in current.items():
+        if not key.endswith(("p50_ms", "total_ms")) or not baseline.get(key):
+            continue
+        change = value / baseline[key] - 1
+        regressed = change > tolerance
+        ok = ok and not regressed
+        print(f"  {'REGRESSED' if regressed else 'ok':9} {key}: {baseline[key]:.1f} -> {value:.1f} ms ({change:+.0%})")
+    return ok
+
+
+def print_summary(results: dict):
+    print()
+    for key, value in flatten(results).items():
+        if key.endswith(("p50_ms", "p95_ms", "total_ms", "sms_per_minute")):
+            print(f"  {key:45} {value:10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", default=",".join(BENCHMARKS),
+                        help=f"comma-separated benchmarks to run (default: {','.join(BENCHMARKS)})")
+    parser.add_argument("--dispenses", type=int, default=14, help="servo1 dispenses (default 14, two full cycles)")
+    parser.add_argument("--servo2-cycles", type=int, default=3, help="servo2_dispense cycles (default 3)")
+    parser.add_argument("--sms-batches", default="1,3", help="SMS batch sizes (default 1,3)")
+    parser.add_argument("--schedule-counts", default="10,100,1000", help="schedule counts (default 10,100,1000)")
+    parser.add_argument("--schedule-repeats", type=int, default=5, help="pushes per schedule count (default 5)")
+    parser.add_argument("--client-counts", default="1,10,50", help="connected clients for fan-out (default 1,10,50)")
+    parser.add_argument("--presses", type=int, default=20, help="button presses per client count (default 20)")
+    parser.add_argument("--json", metavar="PATH", help="write the results to a JSON file")
+    parser.add_argument("--compare", metavar="PATH", help="compare with a previous --json file")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown for --compare before exiting non-zero (default 0.2 = 20%%)")
+    args = parser.parse_args()
+    
+    args.only = [name.strip() for name in args.only.split(",") if name.strip()]
+    unknown = set(args.only) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(sorted(unknown))}")
+    args.sms_batches = [int(n) for n in args.sms_batches.split(",")]
+    args.schedule_counts = [int(n) for n in args.schedule_counts.split(",")]
+    args.client_counts = [int(n) for n in args.client_counts.split(",")]
+    
+    results = asyncio.run(run(args))
+    print_summary(results)
+    
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "websockets": websockets.__version__,
+                "encodings": server.SUBPROTOCOLS,
+                "config": {k: v for k, v in vars(args).items() if k not in ("json", "compare")},
+                "results": results,
+            }, f, indent=2)
+    
+    if args.compare and not compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Startup-time budget check for the PillPal Pi server
+
+Imports pi_websocket_server_PCA9685 in fresh interpreters with `python -X importtime`,
+reports the slowest imports and the time create_app(demo_mode=True) takes, and exits
+non-zero if the median import time exceeds the budget.
+
+Usage (from pi-server/):
+    python3 benchmarks/importtime_bench.py
+    python3 benchmarks/importtime_bench.py --budget-ms 300 --runs 7 --json importtime.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULE = "pi_websocket_server_PCA9685"
+
+CREATE_APP_SNIPPET = f"""
+import json, time
+started = time.perf_counter()
+import {MODULE} as server
+imported = time.perf_counter()
+server.create_app(demo_mode=True, log_profile='quiet')
+built = time.perf_counter()
+print(json.dumps({{"import_ms": (imported - started) * 1000, "create_app_ms": (built - imported) * 1000}}))
+"""
+
+
+def run_importtime() -> dict:
+    """One fresh interpreter: package -> (self_us, cumulative_us) from -X importtime"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {MODULE}"],
+        cwd=SERVER_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import failed:\n{result.stderr}")
+    
+    timings = {}
+    for line in result.stderr.splitlines():
+        # import time:       self [us] |  cumulative | imported package
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, package = line[len("import time:"):].split("|", 2)
+            timings[package.strip()] = (int(self_us), int(cumulative_us))
+        except ValueError:
+            continue
+    return timings
+
+
+def run_create_app() -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", CREATE_APP_SNIPPET],
+        cwd=SERVER_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"create_app failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=250.0, help="max median import time (default 250 ms)")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to measure (default 5)")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list (default 15)")
+    parser.add_argument("--json", metavar="PATH", help="also write the results to a JSON file")
+    args = parser.parse_args()
+    
+    run_importtime()  # Warm-up: compiles .pyc files so the first run isn't an outlier
+    runs = [run_importtime() for _ in range(args.runs)]
+    module_ms = [run[MODULE][1] / 1000 for run in runs]
+    median_ms = statistics.median(module_ms)
+    
+    # Slowest imports by median cumulative time (nested packages included)
+    packages = set().union(*runs)
+    slowest = sorted(
+        ((statistics.median(run[p][1] for run in runs if p in run) / 1000, p) for p in packages),
+        reverse=True
+    )[:args.top]
+    
+    app_runs = [run_create_app() for _ in range(args.runs)]
+    create_app_ms = statistics.median(run["create_app_ms"] for run in app_runs)
+    
+    print(f"{MODULE} import: median {median_ms:.1f} ms "
+          f"(min {min(module_ms):.1f}, max {max(module_ms):.1f}, {args.runs} runs)")
+    print(f"create_app(demo_mode=True): median {create_app_ms:.1f} ms")
+    print("\nSlowest imports (cumulative):")
+    for ms, package in slowest:
+        print(f"  {ms:8.1f} ms  {package}")
+    
+    within_budget = median_ms <= args.budget_ms
+    print(f"\nBudget {args.budget_ms:.0f} ms: {'OK' if within_budget else 'EXCEEDED'}")
+    
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "module": MODULE,
+                "budget_ms": args.budget_ms,
+                "import_ms": {"median": median_ms, "runs": module_ms},
+                "create_app_ms": create_app_ms,
+                "slowest": [{"package": p, "cumulative_ms": ms} for ms, p in slowest],
+                "within_budget": within_budget,
+            }, f, indent=2)
+    
+    sys.exit(0 if within_budget else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Shared I2C bus (bus 1) for the PCA9685 servo board and the LCD backpack
+
+- scan() probes the bus once, the way `i2cdetect -y 1` does, and caches which devices answered
+  (PCA9685 at 0x40, PCF8574 LCD backpack at 0x27 or 0x3F); later calls return the cache
+- transaction('lcd') serializes access between devices with one bus lock and records each
+  device's transaction latency (and how long it waited for the bus)
+
+Usage:
+    from i2c_bus import I2CBus, LCD_ADDRESSES
+    bus = I2CBus()
+    bus.scan()                                  # {0x27: 'lcd', 0x40: 'pca9685'}
+    address = bus.find(LCD_ADDRESSES)           # 0x27 / 0x3F, None if neither answered
+    with bus.transaction('lcd'):
+        lcd.write_string("Hello")
+    print(bus.report())
+
+Scanning needs smbus (python3-smbus) or smbus2; without either, scan() returns None and
+callers fall back to their default addresses.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger('i2c_bus')
+
+BUS_NUMBER = 1  # /dev/i2c-1 on every Pi since the model B rev 2
+PCA9685_ADDRESS = 0x40
+LCD_ADDRESSES = (0x27, 0x3F)  # PCF8574 / PCF8574A backpacks
+KNOWN_DEVICES = {PCA9685_ADDRESS: 'pca9685', 0x27: 'lcd', 0x3F: 'lcd', 0x70: 'pca9685 (all-call)'}
+
+FIRST_ADDRESS, LAST_ADDRESS = 0x03, 0x77  # Same range as i2cdetect
+# i2cdetect reads instead of quick-writing here: a quick write can corrupt EEPROMs and
+# lock up some sensors in these ranges
+READ_PROBE_RANGES = ((0x30, 0x37), (0x50, 0x5F))
+
+
+def _open_smbus(bus_number: int):
+    try:
+        import smbus
+    except ImportError:
+        import smbus2 as smbus
+    return smbus.SMBus(bus_number)
+
+
+class DeviceStats:
+    """Transaction latency for one device"""
+    
+    RECENT = 200  # Samples kept for the percentiles
+    
+    def __init__(self):
+        self.transactions = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self.wait_max = 0.0  # Longest wait for the bus lock
+        self.recent = deque(maxlen=self.RECENT)
+    
+    def record(self, seconds: float, waited: float, ok: bool):
+        self.transactions += 1
+        if not ok:
+            self.errors += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.last = seconds
+        self.wait_max = max(self.wait_max, waited)
+        self.recent.append(seconds)
+    
+    def as_dict(self) -> dict:
+        recent = sorted(self.recent)
+        
+        def percentile(fraction: float) -> Optional[float]:
+            if not recent:
+                return None
+            return round(recent[min(len(recent) - 1, int(len(recent) * fraction))] * 1000, 3)
+        
+        return {
+            "transactions": self.transactions,
+            "errors": self.errors,
+            "mean_ms": round(self.total / self.transactions * 1000, 3) if self.transactions else None,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "max_ms": round(self.max * 1000, 3),
+            "last_ms": round(self.last * 1000, 3),
+            "lock_wait_max_ms": round(self.wait_max * 1000, 3),
+        }
+
+
+class I2CBus:
+    """
+    One I2C bus shared by several drivers (ServoKit, RPLCD), each with its own bus handle
+    The kernel keeps single transfers atomic; the lock keeps one device's multi-transfer
+    updates (an LCD redraw, a servo move) from interleaving with another's.
+    """
+    
+    def __init__(self, bus_number: int = BUS_NUMBER):
+        self.bus_number = bus_number
+        self.lock = threading.RLock()
+        self._scan_lock = threading.Lock()  # One scan at a time; the bus lock is only held per probe
+        self.devices: Optional[Dict[int, str]] = None  # address -> name; None until scanned
+        self.scanned_at: Optional[float] = None  # time.time() of the last scan
+        self.scan_seconds = 0.0
+        self.scan_error: Optional[str] = None
+        self.stats: Dict[str, DeviceStats] = {}
+        self._listeners = []
+    
+    def add_listener(self, callback: Callable[[str, float, bool], None]):
+        """Register callback(device, seconds, ok), called after every transaction"""
+        self._listeners.append(callback)
+    
+    @property
+    def scanned(self) -> bool:
+        return self.devices is not None
+    
+    def scan(self, force: bool = False) -> Optional[Dict[int, str]]:
+        """Probe the bus (once - cached unless force); None if the bus can't be opened"""
+        with self._scan_lock:
+            if self.devices is not None and not force:
+                return self.devices
+            started = time.monotonic()
+            try:
+                bus = _open_smbus(self.bus_number)
+            except (ImportError, OSError) as e:
+                self.scan_error = str(e)
+                logger.warning("⚠️ Cannot scan I2C bus %s: %s", self.bus_number, e)
+                return None
+            
+            devices = {}
+            try:
+                for address in range(FIRST_ADDRESS, LAST_ADDRESS + 1):
+                    # Bus lock per probe, not per scan: an LCD redraw or servo move waits for one
+                    # probe at most instead of the whole sweep
+                    with self.lock:
+                        try:
+                            if any(low <= address <= high for low, high in READ_PROBE_RANGES):
+                                bus.read_byte(address)
+                            else:
+                                bus.write_quick(address)
+                        except OSError:
+                            continue  # No ACK: nothing at this address
+                    devices[address] = KNOWN_DEVICES.get(address, 'unknown')
+            finally:
+                bus.close()
+            
+            self.devices = devices
+            self.scan_error = None
+            self.scanned_at = time.time()
+            self.scan_seconds = time.monotonic() - started
+            logger.info("🔍 I2C bus %s: %s (%.0f ms)", self.bus_number,
+                        ", ".join(f"0x{address:02X} {name}" for address, name in devices.items()) or "no devices",
+                        self.scan_seconds * 1000)
+            return devices
+    
+    def present(self, address: int) -> Optional[bool]:
+        """Whether address answered the scan; None if the bus was never scanned"""
+        if self.devices is None:
+            return None
+        return address in self.devices
+    
+    def find(self, addresses: Iterable[int]) -> Optional[int]:
+        """First of addresses that answered the scan"""
+        for address in addresses:
+            if self.present(address):
+                return address
+        return None
+    
+    @contextmanager
+    def transaction(self, device: str):
+        """Hold the bus for one device's update and record its latency"""
+        requested = time.monotonic()
+        ok = False
+        with self.lock:
+            started = time.monotonic()
+            try:
+                yield
+                ok = True
+            finally:
+                elapsed = time.monotonic() - started
+                stats = self.stats.get(device)
+                if stats is None:
+                    stats = self.stats[device] = DeviceStats()
+                stats.record(elapsed, started - requested, ok)
+                for callback in self._listeners:
+                    try:
+                        callback(device, elapsed, ok)
+                    except Exception as e:
+                        logger.warning("I2C listener failed: %s", e)
+    
+    def report(self) -> dict:
+        """Scan results and per-device latency (JSON-ready)"""
+        return {
+            "bus": self.bus_number,
+            "scanned": self.scanned,
+            "scanned_at": self.scanned_at,
+            "scan_ms": round(self.scan_seconds * 1000, 1),
+            "scan_error": self.scan_error,
+            "devices": [{"address": f"0x{address:02X}", "name": name}
+                        for address, name in sorted((self.devices or {}).items())],
+            "latency": {device: stats.as_dict() for device, stats in sorted(self.stats.items())},
+        }
+
+
+if __name__ == '__main__':
+    import json
+    bus = I2CBus()
+    bus.scan()
+    print(json.dumps(bus.report(), indent=2))
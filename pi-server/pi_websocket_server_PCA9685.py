@@ -10,69 +10,413 @@ import asyncio
 import websockets
 import json
 import logging
+import queue
 import time
 import os
+import atexit
 import hashlib
-import subprocess
-from typing import Dict, Optional
+import threading
+import functools
+import bisect
+import secrets
+import heapq
+import sqlite3
+import sys
+import traceback
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
 from datetime import datetime, timedelta
 
-# Serial import for SIMCOM module (optional - only needed if SIMCOM is connected)
-try:
-    import serial
-    import serial.tools.list_ports
-    SERIAL_AVAILABLE = True
-except ImportError:
-    SERIAL_AVAILABLE = False
-    logger.warning("⚠️ pyserial not installed. Install with: pip3 install pyserial")
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+from simcom_at import ATClient, BAUD_RATES, REGISTERED, open_modem
+from simcom_diag import run_plan, select_plan
+from i2c_bus import I2CBus, LCD_ADDRESSES, PCA9685_ADDRESS
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Logging verbosity profiles - select with the PILLPAL_LOG_PROFILE environment variable
+LOG_PROFILES = {
+    'production': {'level': logging.INFO, 'rate_limit': True},  # Default - no debug narration
+    'verbose': {'level': logging.DEBUG, 'rate_limit': True},  # Debug narration, noisy call sites still limited
+    'debug': {'level': logging.DEBUG, 'rate_limit': False},  # Everything
+    'quiet': {'level': logging.WARNING, 'rate_limit': True},  # Warnings and errors only
+}
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Per-call-site rate limiting for log calls that opt in with extra=rate_limited(seconds)
+    Suppressed records are counted and the count is added to the next record that gets through
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self._last_emit: Dict[tuple, float] = {}  # (file, line) -> last emit time
+        self._suppressed: Dict[tuple, int] = {}  # (file, line) -> records dropped since
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        interval = getattr(record, 'rate_limit', None)
+        if not interval:
+            return True
+        site = (record.pathname, record.lineno)
+        now = time.monotonic()
+        last = self._last_emit.get(site)
+        if last is not None and now - last < interval:
+            self._suppressed[site] = self._suppressed.get(site, 0) + 1
+            return False
+        self._last_emit[site] = now
+        suppressed = self._suppressed.pop(site, 0)
+        if suppressed:
+            record.msg = f"{record.msg} (+{suppressed} similar suppressed)"
+        return True
+
+
+def rate_limited(seconds: float) -> dict:
+    """`extra=` argument limiting a log call site to one record per `seconds`"""
+    return {'rate_limit': seconds}
+
+
+def configure_logging(profile: Optional[str] = None) -> QueueListener:
+    """
+    Route all logging through a QueueHandler so the event loop never blocks on stderr/journald
+    A QueueListener thread does the actual writing.
+    """
+    profile_name = profile or os.environ.get('PILLPAL_LOG_PROFILE', 'production')
+    settings = LOG_PROFILES.get(profile_name, LOG_PROFILES['production'])
+    
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    if settings['rate_limit']:
+        queue_handler.addFilter(RateLimitFilter())
+    
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    listener = QueueListener(log_queue, stream_handler)
+    
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(settings['level'])
+    # Keep library frame-level chatter out even in debug profiles
+    logging.getLogger('websockets').setLevel(max(settings['level'], logging.INFO))
+    
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
 logger = logging.getLogger(__name__)
+_log_listener: Optional[QueueListener] = None  # Set by create_app()
+
+# Hardware driver libraries are imported lazily by the load_* functions below, from each
+# controller's initialize() (worker threads, see HardwareReadiness). Importing this module
+# is therefore fast and never touches hardware; until loaded, every driver counts as missing.
+serial = None
+GPIO = None
+pigpio = None
+ServoKit = None
+smbus = None
+CharLCD = None
+SERIAL_AVAILABLE = False
+GPIO_AVAILABLE = False
+PIGPIO_AVAILABLE = False
+PCA9685_AVAILABLE = False
+LCD_AVAILABLE = False
+
+# The PCA9685 and the LCD share I2C bus 1: it is scanned once by whichever controller
+# initializes first, and every servo move and LCD redraw holds its lock (see i2c_bus.py)
+i2c_bus = I2CBus()
+
+
+@functools.lru_cache(maxsize=None)
+def load_serial() -> bool:
+    """Serial import for SIMCOM module (optional - only needed if SIMCOM is connected)"""
+    global serial, SERIAL_AVAILABLE
+    try:
+        import serial
+        import serial.tools.list_ports
+        SERIAL_AVAILABLE = True
+    except ImportError:
+        SERIAL_AVAILABLE = False
+        logger.warning("⚠️ pyserial not installed. Install with: pip3 install pyserial")
+    return SERIAL_AVAILABLE
+
+
+@functools.lru_cache(maxsize=None)
+def load_gpio() -> bool:
+    """GPIO imports for button (GPIO26), LEDs (GPIO27, GPIO22) and buzzer (GPIO17)"""
+    global GPIO, GPIO_AVAILABLE
+    try:
+        import RPi.GPIO as GPIO
+        GPIO_AVAILABLE = True
+        logger.info("✅ RPi.GPIO imported successfully")
+    except ImportError as e:
+        logger.warning("⚠️ RPi.GPIO not found: %s", e)
+        logger.warning("GPIO button and LED functionality will be disabled")
+        GPIO_AVAILABLE = False
+    except Exception as e:
+        logger.warning("⚠️ Error importing RPi.GPIO: %s", e)
+        GPIO_AVAILABLE = False
+    
+    # Initialize GPIO mode ONCE before any GPIO operations
+    if GPIO_AVAILABLE:
+        try:
+            GPIO.setmode(GPIO.BCM)
+            logger.info("✅ GPIO mode set to BCM (initialized once)")
+        except Exception as e:
+            logger.error("❌ Error setting GPIO mode: %s", e)
+    return GPIO_AVAILABLE
+
+
+@functools.lru_cache(maxsize=None)
+def load_pigpio() -> bool:
+    """pigpio for hardware-timed buzzer tones (optional - needs the pigpiod daemon running)"""
+    global pigpio, PIGPIO_AVAILABLE
+    try:
+        import pigpio
+        PIGPIO_AVAILABLE = True
+    except ImportError:
+        PIGPIO_AVAILABLE = False
+    return PIGPIO_AVAILABLE
+
+
+@functools.lru_cache(maxsize=None)
+def load_servokit() -> bool:
+    """Hardware imports - PCA9685 version (adafruit_servokit pulls in Blinka - the slowest import)"""
+    global ServoKit, PCA9685_AVAILABLE
+    try:
+        from adafruit_servokit import ServoKit
+        PCA9685_AVAILABLE = True
+        logger.info("✅ adafruit_servokit imported successfully")
+    except ImportError as e:
+        logger.error("❌ adafruit_servokit not found: %s", e)
+        logger.error("Install with: pip3 install adafruit-circuitpython-servokit")
+        PCA9685_AVAILABLE = False
+    except Exception as e:
+        logger.error("❌ Error importing adafruit_servokit: %s", e)
+        PCA9685_AVAILABLE = False
+    return PCA9685_AVAILABLE
+
+
+@functools.lru_cache(maxsize=None)
+def load_lcd() -> bool:
+    """LCD imports - I2C LCD (address 0x27 or 0x3F)"""
+    global smbus, CharLCD, LCD_AVAILABLE
+    try:
+        import smbus
+        from RPLCD.i2c import CharLCD
+        LCD_AVAILABLE = True
+        logger.info("✅ RPLCD imported successfully")
+    except ImportError as e:
+        logger.warning("⚠️ RPLCD not found: %s", e)
+        logger.warning("LCD functionality will be disabled")
+        logger.warning("Install with: pip3 install RPLCD")
+        LCD_AVAILABLE = False
+    except Exception as e:
+        logger.warning("⚠️ Error importing RPLCD: %s", e)
+        LCD_AVAILABLE = False
+    return LCD_AVAILABLE
+
+
+class _Metric:
+    """Base for metrics: a value per label combination, rendered in Prometheus text format"""
+    
+    TYPE = 'untyped'
+    
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._children: Dict[tuple, '_Metric'] = {}
+        # Metrics are updated from worker threads too (SMS, I2C, watchdog): guards children and values
+        self._lock = threading.Lock()
+    
+    def labels(self, *values) -> '_Metric':
+        """Child metric for one label combination (created on first use, then cached)"""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+    
+    def _new_child(self) -> '_Metric':
+        return type(self)(self.name, self.help)
+    
+    def _series(self):
+        """(label values, child) pairs to render - the metric itself when it has no labels"""
+        if self.labelnames:
+            with self._lock:
+                children = list(self._children.items())
+            return sorted(children)
+        return [((), self)]
+    
+    @staticmethod
+    def _escape(value) -> str:
+        """Label value escaping required by the text format: backslash, double quote, newline"""
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    
+    def _label_str(self, values: tuple, extra: str = '') -> str:
+        pairs = [f'{name}="{self._escape(value)}"' for name, value in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+    
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.TYPE}"]
+        for values, child in self._series():
+            lines.extend(child._render_samples(self, values))
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonic count"""
+    
+    TYPE = 'counter'
+    
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        super().__init__(name, help_text, labelnames)
+        self.value = 0
+    
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+    
+    def _render_samples(self, parent: _Metric, values: tuple) -> list:
+        return [f"{parent.name}{parent._label_str(values)} {self.value}"]
 
-# GPIO imports for button (GPIO26) and LEDs (GPIO27, GPIO22)
+
+class Gauge(_Metric):
+    """Value that goes up and down, or is read from a callback at scrape time"""
+    
+    TYPE = 'gauge'
+    
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), function=None):
+        super().__init__(name, help_text, labelnames)
+        self.value = 0
+        self.function = function  # Optional zero-argument callable evaluated on each scrape
+    
+    def set(self, value: float):
+        self.value = value
+    
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+    
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self.value -= amount
+    
+    def _render_samples(self, parent: _Metric, values: tuple) -> list:
+        value = self.function() if self.function is not None else self.value
+        return [f"{parent.name}{parent._label_str(values)} {value}"]
+
+
+class Histogram(_Metric):
+    """Observations counted into fixed buckets (per-bucket counts; cumulated only when rendered)"""
+    
+    TYPE = 'histogram'
+    
+    def __init__(self, name: str, help_text: str, buckets: tuple, labelnames: tuple = ()):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+    
+    def _new_child(self) -> 'Histogram':
+        return Histogram(self.name, self.help, self.buckets)
+    
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+    
+    def _render_samples(self, parent: _Metric, values: tuple) -> list:
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            le = 'le="%s"' % ('+Inf' if bound == float('inf') else f'{bound:g}')
+            lines.append(f"{parent.name}_bucket{parent._label_str(values, le)} {cumulative}")
+        lines.append(f"{parent.name}_sum{parent._label_str(values)} {total}")
+        lines.append(f"{parent.name}_count{parent._label_str(values)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """All metrics exported on /metrics"""
+    
+    def __init__(self, prefix: str = 'pillpal_'):
+        self.prefix = prefix
+        self.metrics: Dict[str, _Metric] = {}
+    
+    def _register(self, metric: _Metric) -> _Metric:
+        self.metrics[metric.name] = metric
+        return metric
+    
+    def counter(self, name: str, help_text: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(self.prefix + name, help_text, labelnames))
+    
+    def gauge(self, name: str, help_text: str, labelnames: tuple = (), function=None) -> Gauge:
+        return self._register(Gauge(self.prefix + name, help_text, labelnames, function))
+    
+    def histogram(self, name: str, help_text: str, buckets: tuple, labelnames: tuple = ()) -> Histogram:
+        return self._register(Histogram(self.prefix + name, help_text, buckets, labelnames))
+    
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+CONNECTIONS_TOTAL = metrics.counter('connections_total', 'WebSocket connections accepted')
+REQUESTS_TOTAL = metrics.counter('requests_total', 'WebSocket requests handled', ('type', 'status'))
+DISPENSE_TOTAL = metrics.counter('dispense_total', 'Dispense operations', ('servo', 'status'))
+DISPENSE_SECONDS = metrics.histogram('dispense_seconds', 'Dispense duration including servo travel',
+                                     (0.5, 1, 2, 3, 5, 8, 13, 20), ('servo',))
+SMS_TOTAL = metrics.counter('sms_total', 'SMS batches sent', ('result',))
+SMS_SECONDS = metrics.histogram('sms_seconds', 'SMS batch duration (all recipients)', (2, 5, 10, 20, 30, 60, 120))
+LCD_REFRESH_TOTAL = metrics.counter('lcd_refresh_total', 'LCD redraws', ('result',))
+LCD_REFRESH_SECONDS = metrics.histogram('lcd_refresh_seconds', 'LCD redraw duration over I2C',
+                                        (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1))
+I2C_SECONDS = metrics.histogram('i2c_transaction_seconds', 'I2C bus transactions (lock held) by device',
+                                (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1), ('device',))
+i2c_bus.add_listener(lambda device, seconds, ok: I2C_SECONDS.labels(device).observe(seconds))
+LOOP_LAG_SECONDS = metrics.histogram('loop_lag_seconds', 'Event loop scheduling lag',
+                                     (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+LOOP_LAG_MAX_SECONDS = metrics.gauge('loop_lag_max_seconds', 'Largest event loop lag since the last scrape')
+LOOP_STALLS_TOTAL = metrics.counter('loop_stalls_total', 'Times the event loop was blocked past the stall threshold')
+BLOCKING_SAMPLES_TOTAL = metrics.counter('blocking_samples_total', 'Stack samples taken while the loop was blocked, by innermost frame', ('frame',))
+SESSIONS_TOTAL = metrics.counter('sessions_total', 'session_resume handshakes', ('result',))
+RELAY_CONNECTS_TOTAL = metrics.counter('relay_connects_total', 'Relay links established (outbound mode)')
+
+
+# Compact wire encodings for the websocket protocol (optional - JSON is always available)
 try:
-    import RPi.GPIO as GPIO
-    GPIO_AVAILABLE = True
-    logger.info("✅ RPi.GPIO imported successfully")
-except ImportError as e:
-    logger.warning(f"⚠️ RPi.GPIO not found: {e}")
-    logger.warning("GPIO button and LED functionality will be disabled")
-    GPIO_AVAILABLE = False
-except Exception as e:
-    logger.warning(f"⚠️ Error importing RPi.GPIO: {e}")
-    GPIO_AVAILABLE = False
-
-# Hardware imports - PCA9685 version
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
 try:
-    from adafruit_servokit import ServoKit
-    PCA9685_AVAILABLE = True
-    logger.info("✅ adafruit_servokit imported successfully")
-except ImportError as e:
-    logger.error(f"❌ adafruit_servokit not found: {e}")
-    logger.error("Install with: pip3 install adafruit-circuitpython-servokit")
-    PCA9685_AVAILABLE = False
-except Exception as e:
-    logger.error(f"❌ Error importing adafruit_servokit: {e}")
-    PCA9685_AVAILABLE = False
-
-# LCD imports - I2C LCD (address 0x27)
+    import cbor2
+    CBOR_AVAILABLE = True
+except ImportError:
+    CBOR_AVAILABLE = False
+
+# Tunable permessage-deflate (optional - older websockets releases use the default compression)
 try:
-    import smbus
-    from RPLCD.i2c import CharLCD
-    LCD_AVAILABLE = True
-    logger.info("✅ RPLCD imported successfully")
-except ImportError as e:
-    logger.warning(f"⚠️ RPLCD not found: {e}")
-    logger.warning("LCD functionality will be disabled")
-    logger.warning("Install with: pip3 install RPLCD")
-    LCD_AVAILABLE = False
-except Exception as e:
-    logger.warning(f"⚠️ Error importing RPLCD: {e}")
-    LCD_AVAILABLE = False
+    from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+    DEFLATE_TUNING_AVAILABLE = True
+except ImportError:
+    DEFLATE_TUNING_AVAILABLE = False
 
 class ServoController:
     """Manages servo motors without resetting on initialization - PCA9685 version"""
@@ -83,16 +427,22 @@ class ServoController:
     # Valid positions: 0, 30, 60, 90, 120, 150, 180
     VALID_ANGLES = [0, 30, 60, 90, 120, 150, 180]
     
-    def __init__(self, demo_mode=False):
+    def __init__(self, demo_mode=False, defer_init=False):
         self.demo_mode = demo_mode
-        self.servos: Dict[str, any] = {}
+        self.servos: Dict[str, Any] = {}
         self.servo_positions: Dict[str, float] = {}  # Track positions
         self.kit = None
+        self._position_listeners = []  # Callbacks notified on position changes
         
+        if not defer_init:
+            self.initialize()
+    
+    def initialize(self):
+        """Load saved positions and restore the servos (~2 s - main() runs it in a worker thread)"""
         # Load saved positions from file (persists across reboots)
         self._load_positions()
         
-        if not demo_mode and PCA9685_AVAILABLE:
+        if not self.demo_mode and load_servokit():
             self._initialize_servos()
     
     def _load_positions(self):
@@ -102,12 +452,12 @@ class ServoController:
                 with open(self.POSITION_FILE, 'r') as f:
                     saved_positions = json.load(f)
                     self.servo_positions = saved_positions
-                    logger.info(f"📂 Loaded saved positions: {saved_positions}")
+                    logger.info("📂 Loaded saved positions: %s", saved_positions)
             else:
                 logger.info("📂 No saved positions file found, starting from 0")
                 self.servo_positions = {}
         except Exception as e:
-            logger.error(f"❌ Error loading positions: {e}")
+            logger.error("❌ Error loading positions: %s", e)
             self.servo_positions = {}
     
     def _save_positions(self):
@@ -115,15 +465,36 @@ class ServoController:
         try:
             with open(self.POSITION_FILE, 'w') as f:
                 json.dump(self.servo_positions, f)
-            logger.info(f"💾 Saved positions: {self.servo_positions}")
+            logger.debug("💾 Saved positions: %s", self.servo_positions)
         except Exception as e:
-            logger.error(f"❌ Error saving positions: {e}")
+            logger.error("❌ Error saving positions: %s", e)
+    
+    def add_position_listener(self, callback):
+        """
+        Register callback(servo_id, angle) to be called whenever a servo position changes
+        Callbacks run in whichever thread moved the servo
+        """
+        self._position_listeners.append(callback)
+    
+    def _set_angle(self, channel: int, angle):
+        """Command a channel's angle (an I2C write to the PCA9685, under the shared bus lock)"""
+        with i2c_bus.transaction('pca9685'):
+            self.kit.servo[channel].angle = angle
+    
+    def _set_position(self, servo_id: str, angle: float):
+        """Record a new servo position and notify listeners"""
+        self.servo_positions[servo_id] = angle
+        for callback in self._position_listeners:
+            try:
+                callback(servo_id, angle)
+            except Exception as e:
+                logger.error("❌ Error in servo position listener: %s", e)
     
     def _initialize_servos(self):
         """Initialize servos WITHOUT resetting to 0 degrees"""
         try:
             logger.info("🔧 Starting PCA9685 initialization...")
-            logger.info(f"🔍 PCA9685_AVAILABLE: {PCA9685_AVAILABLE}")
+            logger.info("🔍 PCA9685_AVAILABLE: %s", PCA9685_AVAILABLE)
             
             if not PCA9685_AVAILABLE:
                 logger.error("❌ PCA9685 library not available - cannot initialize servos")
@@ -133,10 +504,17 @@ class ServoController:
             # IMPORTANT: Don't set servo positions on initialization
             # Servos will maintain their current position
             
-            logger.info("🔧 Initializing PCA9685 board (16 channels, address 0x40)...")
+            # The cached bus scan tells a missing/unpowered board apart from a driver problem
+            if i2c_bus.scan() is not None and not i2c_bus.present(PCA9685_ADDRESS):
+                logger.error("❌ No PCA9685 answering at 0x%02X on the I2C bus - check wiring and power", PCA9685_ADDRESS)
+                self.demo_mode = True
+                return
+            
+            logger.info("🔧 Initializing PCA9685 board (16 channels, address 0x%02X)...", PCA9685_ADDRESS)
             # Initialize PCA9685 board (16 channels, default I2C address 0x40)
-            # Change address if your board uses different address
-            self.kit = ServoKit(channels=16, address=0x40)
+            # Change PCA9685_ADDRESS in i2c_bus.py if your board uses a different address
+            with i2c_bus.transaction('pca9685'):
+                self.kit = ServoKit(channels=16, address=PCA9685_ADDRESS)
             
             # Configure servo for precise angle control
             channel = 4  # Your servo channel
@@ -161,15 +539,15 @@ class ServoController:
                     pass
             
             logger.info("✅ PCA9685 kit created successfully with 180° actuation range")
-            logger.info(f"✅ Servo channel {channel} configured for 0-180° range")
+            logger.info("✅ Servo channel %s configured for 0-180° range", channel)
             
             # Map servo IDs to PCA9685 channels
             # servo1 = channel 4, servo2 = channel 5
             # CHANGE CHANNEL NUMBERS IF YOUR SERVOS ARE ON DIFFERENT CHANNELS
             self.servos['servo1'] = 4  # Channel 4 on PCA9685 (main dispensing servo)
             self.servos['servo2'] = 5  # Channel 5 on PCA9685 (secondary servo for additional dispense)
-            logger.info(f"✅ Mapped servo1 to PCA9685 channel 4")
-            logger.info(f"✅ Mapped servo2 to PCA9685 channel 5")
+            logger.info("✅ Mapped servo1 to PCA9685 channel 4")
+            logger.info("✅ Mapped servo2 to PCA9685 channel 5")
             
             # Initialize servo2 (channel 5) - set to 0 degrees initially
             # Servo2 moves COUNTER-CLOCKWISE (reversed direction)
@@ -185,7 +563,7 @@ class ServoController:
             
             # Initialize servo2 position - always start at 3° (optimal resting position)
             # Servo2 should always be at 3° when not dispensing medicine
-            self.kit.servo[channel2].angle = 3
+            self._set_angle(channel2, 3)
             self.servo_positions['servo2'] = 3.0
             logger.info("📊 Starting servo2 at 3 degrees (optimal resting position, counter-clockwise mode)")
             time.sleep(0.3)
@@ -201,12 +579,12 @@ class ServoController:
                 self.servo_positions['servo1'] = 0.0
                 logger.info("📊 Starting servo1 at 0 degrees (no saved position)")
                 # Set servo to 0 (it's probably already there after reboot)
-                self.kit.servo[4].angle = 0
+                self._set_angle(4, 0)
                 time.sleep(0.3)
             else:
                 saved_angle = self.servo_positions['servo1']
-                logger.info(f"📊 Restoring servo1 to saved position: {saved_angle} degrees")
-                logger.info(f"💡 Servo was at {saved_angle}° before Pi was turned off")
+                logger.info("📊 Restoring servo1 to saved position: %s degrees", saved_angle)
+                logger.info("💡 Servo was at %s° before Pi was turned off", saved_angle)
                 
                 # CRITICAL: Ensure servo is properly configured before restoring
                 # Wait a bit for PCA9685 to fully initialize
@@ -218,29 +596,29 @@ class ServoController:
                     self.kit.servo[4].set_pulse_width_range(500, 2400)
                     logger.info("✅ Servo calibration applied before restore")
                 except Exception as e:
-                    logger.warning(f"⚠️ Could not set pulse width: {e}")
+                    logger.warning("⚠️ Could not set pulse width: %s", e)
                 
                 # Restore servo to saved position (servo resets to 0 on power loss, so we move it back)
-                logger.info(f"🎯 Moving servo from 0° to {saved_angle}° (restore after reboot)")
-                self.kit.servo[4].angle = int(saved_angle)
+                logger.info("🎯 Moving servo from 0° to %s° (restore after reboot)", saved_angle)
+                self._set_angle(4, int(saved_angle))
                 
                 # Wait longer for movement to complete (servo needs time to move from 0 to saved position)
                 wait_time = 1.0 if saved_angle >= 90 else 0.8
                 time.sleep(wait_time)
                 
                 # Verify by setting the angle again (ensures it's at correct position)
-                self.kit.servo[4].angle = int(saved_angle)
+                self._set_angle(4, int(saved_angle))
                 time.sleep(0.3)
                 
-                logger.info(f"✅ Servo1 restored to {saved_angle} degrees (from saved file)")
-                logger.info(f"✅ Physical servo should now be at {saved_angle}° (not 0°)")
+                logger.info("✅ Servo1 restored to %s degrees (from saved file)", saved_angle)
+                logger.info("✅ Physical servo should now be at %s° (not 0°)", saved_angle)
             
             # Note: LEDs will be updated in main() after all controllers are initialized
             
             logger.info("✅ Servos initialized (positions maintained) - PCA9685")
-            logger.info(f"✅ Available servos: {list(self.servos.keys())}")
+            logger.info("✅ Available servos: %s", list(self.servos.keys()))
         except Exception as e:
-            logger.error(f"❌ Failed to initialize servos: {e}", exc_info=True)
+            logger.error("❌ Failed to initialize servos: %s", e, exc_info=True)
             self.demo_mode = True
             self.kit = None
     
@@ -256,10 +634,10 @@ class ServoController:
         try:
             # Get current position (default to 0 if not set)
             current_angle = self.servo_positions.get(servo_id, 0.0)
-            logger.info(f"🚀 dispense() called: servo_id='{servo_id}', current_angle={current_angle}°")
-            logger.info(f"🔍 Available servos: {list(self.servos.keys())}")
-            logger.info(f"🔍 Demo mode: {self.demo_mode}")
-            logger.info(f"🔍 PCA9685 kit initialized: {self.kit is not None}")
+            logger.debug("🚀 dispense() called: servo_id='%s', current_angle=%s°", servo_id, current_angle)
+            logger.debug("🔍 Available servos: %s", list(self.servos.keys()))
+            logger.debug("🔍 Demo mode: %s", self.demo_mode)
+            logger.debug("🔍 PCA9685 kit initialized: %s", self.kit is not None)
             
             # Ensure current angle is an integer (snap to nearest valid angle)
             current_angle_int = int(round(current_angle))
@@ -270,7 +648,7 @@ class ServoController:
                 # Find closest valid angle
                 closest = min(self.VALID_ANGLES, key=lambda x: abs(x - current_angle_int))
                 current_angle = closest
-                logger.info(f"🔧 Snapped current angle from {current_angle_int}° to {current_angle}°")
+                logger.debug("🔧 Snapped current angle from %s° to %s°", current_angle_int, current_angle)
             
             # Time frame dispense logic: use target_angle if provided (direct movement to time frame angle)
             if target_angle is not None:
@@ -278,44 +656,45 @@ class ServoController:
                 # Saturday Morning=30°, Afternoon=60°, Evening=90°
                 # Sunday Morning=120°, Afternoon=150°, Evening=180°
                 new_angle = int(round(target_angle))
-                logger.info(f"🎯 Time frame dispense: Moving directly to target angle {new_angle}° (from frontend time frame mapping)")
+                logger.debug("🎯 Time frame dispense: Moving directly to target angle %s° (from frontend time frame mapping)", new_angle)
                 # Ensure target angle is valid
                 if new_angle not in self.VALID_ANGLES and new_angle != 0:
                     # Snap to nearest valid angle
                     closest = min(self.VALID_ANGLES, key=lambda x: abs(x - new_angle))
                     new_angle = closest
-                    logger.info(f"🔧 Snapped target angle to {new_angle}°")
+                    logger.debug("🔧 Snapped target angle to %s°", new_angle)
             else:
                 # Legacy behavior: add exactly 30 degrees (integer)
                 new_angle = current_angle + self.DISPENSE_INCREMENT
-                logger.info(f"🔢 Legacy calculation: {current_angle}° + {self.DISPENSE_INCREMENT}° = {new_angle}°")
+                logger.debug("🔢 Legacy calculation: %s° + %s° = %s°", current_angle, self.DISPENSE_INCREMENT, new_angle)
                 
                 # If current angle is already 180° or more, reset to 0° immediately
                 if current_angle >= self.MAX_ANGLE:
                     new_angle = 0
-                    logger.info(f"🔄 At {self.MAX_ANGLE}° (6th dispense completed), resetting to 0° immediately")
+                    logger.debug("🔄 At %s° (6th dispense completed), resetting to 0° immediately", self.MAX_ANGLE)
                 # If adding 30 would exceed 180°, go to 180° first
                 elif new_angle > self.MAX_ANGLE:
                     new_angle = self.MAX_ANGLE
-                    logger.info(f"📍 Reaching {self.MAX_ANGLE}° (6th dispense)")
+                    logger.debug("📍 Reaching %s° (6th dispense)", self.MAX_ANGLE)
             
             # Ensure new_angle is a valid integer
             new_angle = int(new_angle)
             
-            logger.info(f"📐 Moving from {current_angle}° to {new_angle}° (exactly +{self.DISPENSE_INCREMENT}°)")
+            logger.debug("📐 Moving from %s° to %s° (exactly +%s°)", current_angle, new_angle, self.DISPENSE_INCREMENT)
             
             if self.demo_mode:
-                logger.info(f"DEMO: Servo {servo_id} would move from {current_angle}° to {new_angle}°")
-                self.servo_positions[servo_id] = new_angle
+                logger.info("DEMO: Servo %s would move from %s° to %s°", servo_id, current_angle, new_angle)
                 # If we reached 180°, automatically reset to 0° in demo mode too
                 if new_angle >= self.MAX_ANGLE:
-                    logger.info(f"🔄 DEMO: Automatically resetting from {self.MAX_ANGLE}° to 0°")
-                    self.servo_positions[servo_id] = 0.0
+                    logger.info("🔄 DEMO: Automatically resetting from %s° to 0°", self.MAX_ANGLE)
+                    self._set_position(servo_id, 0.0)
+                else:
+                    self._set_position(servo_id, new_angle)
                 self._save_positions()
                 return True
             
             if servo_id not in self.servos:
-                logger.error(f"❌ Servo {servo_id} not found in {list(self.servos.keys())}")
+                logger.error("❌ Servo %s not found in %s", servo_id, list(self.servos.keys()))
                 return False
             
             if not self.kit:
@@ -324,21 +703,21 @@ class ServoController:
             
             # Get channel number for this servo
             channel = self.servos[servo_id]
-            logger.info(f"🔧 Using PCA9685 channel {channel} for servo {servo_id}")
+            logger.debug("🔧 Using PCA9685 channel %s for servo %s", channel, servo_id)
             
             # Calculate exact angle difference
             angle_difference = new_angle - current_angle
             
-            logger.info(f"⚙️ Setting PCA9685 channel {channel} to EXACT angle {new_angle}° (integer)")
-            logger.info(f"📊 ANGLE CHANGE: {current_angle}° → {new_angle}° (DIFFERENCE: {angle_difference}°)")
+            logger.debug("⚙️ Setting PCA9685 channel %s to EXACT angle %s° (integer)", channel, new_angle)
+            logger.debug("📊 ANGLE CHANGE: %s° → %s° (DIFFERENCE: %s°)", current_angle, new_angle, angle_difference)
             
             # Verify it's exactly 30 degrees (or 180 to 0)
             if angle_difference != 30 and angle_difference != -180:
-                logger.error(f"❌ ERROR: Expected 30° or -180° movement, but got {angle_difference}°")
-                logger.error(f"❌ This should not happen! Current: {current_angle}°, New: {new_angle}°")
+                logger.error("❌ ERROR: Expected 30° or -180° movement, but got %s°", angle_difference)
+                logger.error("❌ This should not happen! Current: %s°, New: %s°", current_angle, new_angle)
             
             # Set the exact angle using integer (PCA9685 handles 0-180 degrees)
-            logger.info(f"🎯 Sending command: self.kit.servo[{channel}].angle = {new_angle}")
+            logger.debug("🎯 Sending command: self.kit.servo[%s].angle = %s", channel, new_angle)
             
             # Ensure servo is configured for 180-degree range before setting angle
             self.kit.servo[channel].actuation_range = 180
@@ -351,53 +730,53 @@ class ServoController:
             
             # Special handling for 5th rotation (120° → 150°) to prevent overshoot
             if current_angle == 120 and new_angle == 150:
-                logger.info("🔧 5th rotation detected (120° → 150°) - using conservative pulse width")
+                logger.debug("🔧 5th rotation detected (120° → 150°) - using conservative pulse width")
                 # Use slightly narrower pulse width to prevent overshooting 150°
                 try:
                     self.kit.servo[channel].set_pulse_width_range(500, 2350)  # Slightly reduced max
-                    logger.info("✅ Applied conservative pulse width for 5th rotation")
+                    logger.debug("✅ Applied conservative pulse width for 5th rotation")
                 except:
                     pass
             
             # Set the angle
-            self.kit.servo[channel].angle = new_angle
-            self.servo_positions[servo_id] = float(new_angle)  # Store as float for JSON compatibility
+            self._set_angle(channel, new_angle)
+            self._set_position(servo_id, float(new_angle))  # Store as float for JSON compatibility
             
             # For 180 degrees, use calibrated pulse width (not maximum)
             if new_angle == 180:
-                logger.info("🔧 Setting 180° with calibrated pulse width (2400 microseconds)")
+                logger.debug("🔧 Setting 180° with calibrated pulse width (2400 microseconds)")
                 # Restore full pulse width range for 180°
                 try:
                     self.kit.servo[channel].set_pulse_width_range(500, 2400)
                 except:
                     pass
-                logger.info(f"🔧 Servo actuation_range: {self.kit.servo[channel].actuation_range}°")
+                logger.debug("🔧 Servo actuation_range: %s°", self.kit.servo[channel].actuation_range)
             
             # Wait for movement to complete (servos need time to reach position)
             # Longer wait for 180° to ensure it reaches full range
             wait_time = 0.8 if new_angle == 180 else 0.6
             time.sleep(wait_time)
-            logger.info(f"⏱️  Waited {wait_time}s for servo to reach position")
+            logger.debug("⏱️  Waited %ss for servo to reach position", wait_time)
             
             # CRITICAL: After 5th rotation (150°), verify and correct position to prevent overshoot
             if new_angle == 150:
-                logger.info("🔧 5th rotation complete - verifying and correcting position to exactly 150°")
+                logger.debug("🔧 5th rotation complete - verifying and correcting position to exactly 150°")
                 # Re-apply pulse width calibration and set exact angle again to ensure precision
                 try:
                     self.kit.servo[channel].set_pulse_width_range(500, 2350)  # Keep conservative for correction
-                    self.kit.servo[channel].angle = 150  # Set exact angle again
+                    self._set_angle(channel, 150)  # Set exact angle again
                     time.sleep(0.3)  # Wait for correction
-                    logger.info("✅ Position corrected to exactly 150°")
+                    logger.debug("✅ Position corrected to exactly 150°")
                     # Restore normal pulse width for next rotation
                     self.kit.servo[channel].set_pulse_width_range(500, 2400)
                 except Exception as e:
-                    logger.warning(f"⚠️ Could not apply correction: {e}")
+                    logger.warning("⚠️ Could not apply correction: %s", e)
             
             # If we just reached 180° (6th dispense), DON'T auto-reset - wait for user confirmation
             # Servo1 will stay at 180° until user confirms via servo2 dialog
             if new_angle >= self.MAX_ANGLE:
-                logger.info(f"🔄 Reached {self.MAX_ANGLE}° (6th dispense) - waiting for user confirmation")
-                logger.info(f"💡 Servo1 will stay at 180° until user confirms. Then it will reset to 0°")
+                logger.info("🔄 Reached %s° (6th dispense) - waiting for user confirmation", self.MAX_ANGLE)
+                logger.debug("💡 Servo1 will stay at 180° until user confirms. Then it will reset to 0°")
             
             # Save position to file immediately (persists across reboots)
             self._save_positions()
@@ -409,14 +788,26 @@ class ServoController:
             # DON'T DO: self.kit.servo[channel].angle = 0  # This would reset!
             
             final_angle = int(self.servo_positions[servo_id])
-            logger.info(f"✅ Servo {servo_id} (channel {channel}) moved from {current_angle}° to {final_angle}°")
-            logger.info(f"💾 Position saved: {final_angle}°")
-            logger.info(f"✅ Movement complete: {angle_difference}° change confirmed")
+            logger.info("✅ Servo %s (channel %s) moved from %s° to %s°", servo_id, channel, current_angle, final_angle)
+            logger.debug("💾 Position saved: %s°", final_angle)
+            logger.debug("✅ Movement complete: %s° change confirmed", angle_difference)
             return True
-            
+        
         except Exception as e:
-            logger.error(f"❌ Error moving servo {servo_id}: {e}", exc_info=True)
+            logger.error("❌ Error moving servo %s: %s", servo_id, e, exc_info=True)
+            return False
+    
+    def reset_servo1(self) -> bool:
+        """Reset servo1 from 180° back to 0° (after the user confirms the 6th dispense)"""
+        if not self.kit:
             return False
+        channel = self.servos.get('servo1', 4)
+        self._set_angle(channel, 0)
+        self._set_position('servo1', 0.0)
+        time.sleep(0.6)
+        self._save_positions()
+        logger.info("✅ Servo1 reset to 0°")
+        return True
     
     def get_position(self, servo_id: str) -> Optional[float]:
         """Get current servo position"""
@@ -434,16 +825,16 @@ class ServoController:
             current_angle = self.servo_positions.get(servo_id, 3.0)  # Default to 3° if not set
             target_angle = 100  # Always move to 100° (from wherever it is)
             
-            logger.info(f"🎯 Moving {servo_id} COUNTER-CLOCKWISE SMOOTHLY from {current_angle}° to {target_angle} degrees (MG90S - smooth movement)")
+            logger.debug("🎯 Moving %s COUNTER-CLOCKWISE SMOOTHLY from %s° to %s degrees (MG90S - smooth movement)", servo_id, current_angle, target_angle)
             
             if self.demo_mode:
-                logger.info(f"DEMO: Servo {servo_id} would move COUNTER-CLOCKWISE SLOWLY from {current_angle}° to {target_angle}°")
-                self.servo_positions[servo_id] = float(target_angle)
+                logger.info("DEMO: Servo %s would move COUNTER-CLOCKWISE SLOWLY from %s° to %s°", servo_id, current_angle, target_angle)
+                self._set_position(servo_id, float(target_angle))
                 self._save_positions()
                 return True
             
             if servo_id not in self.servos:
-                logger.error(f"❌ Servo {servo_id} not found in {list(self.servos.keys())}")
+                logger.error("❌ Servo %s not found in %s", servo_id, list(self.servos.keys()))
                 return False
             
             if not self.kit:
@@ -451,14 +842,14 @@ class ServoController:
                 return False
             
             channel = self.servos[servo_id]
-            logger.info(f"🔧 Using PCA9685 channel {channel} for servo {servo_id} (COUNTER-CLOCKWISE, SLOW)")
+            logger.debug("🔧 Using PCA9685 channel %s for servo %s (COUNTER-CLOCKWISE, SLOW)", channel, servo_id)
             
             # Configure servo for 180-degree range with REVERSED pulse width (counter-clockwise)
             self.kit.servo[channel].actuation_range = 180
             try:
                 # REVERSED pulse width: 2400-500 instead of 500-2400 for counter-clockwise movement
                 self.kit.servo[channel].set_pulse_width_range(2400, 500)
-                logger.info("🔄 Servo2 pulse width reversed for counter-clockwise movement")
+                logger.debug("🔄 Servo2 pulse width reversed for counter-clockwise movement")
             except:
                 pass
             
@@ -470,7 +861,7 @@ class ServoController:
             if steps == 0:
                 steps = 1  # At least one step
             
-            logger.info(f"⚡ Moving fast: {start_angle}° → {target_angle}° in {steps} steps ({step_size}° per step)")
+            logger.debug("⚡ Moving fast: %s° → %s° in %s steps (%s° per step)", start_angle, target_angle, steps, step_size)
             
             # Fast movement - larger steps, minimal delays
             for step in range(1, steps + 1):
@@ -478,24 +869,24 @@ class ServoController:
                 if intermediate_angle > target_angle:
                     intermediate_angle = target_angle
                 
-                self.kit.servo[channel].angle = intermediate_angle
+                self._set_angle(channel, intermediate_angle)
                 time.sleep(0.02)  # 20ms delay - very fast movement
             
             # Final position
-            self.kit.servo[channel].angle = target_angle
-            self.servo_positions[servo_id] = float(target_angle)
+            self._set_angle(channel, target_angle)
+            self._set_position(servo_id, float(target_angle))
             
             # Wait for movement to complete
             time.sleep(0.05)
-            logger.info(f"✅ Servo {servo_id} (channel {channel}) moved COUNTER-CLOCKWISE FAST to {target_angle}°")
+            logger.info("✅ Servo %s (channel %s) moved COUNTER-CLOCKWISE FAST to %s°", servo_id, channel, target_angle)
             
             # Save position
             self._save_positions()
             
             return True
-            
+        
         except Exception as e:
-            logger.error(f"❌ Error moving servo2 to 100°: {e}", exc_info=True)
+            logger.error("❌ Error moving servo2 to 100°: %s", e, exc_info=True)
             return False
     
     def reset_servo2(self) -> bool:
@@ -510,16 +901,16 @@ class ServoController:
             current_angle = self.servo_positions.get(servo_id, 100.0)
             target_angle = 3  # Optimal resting position
             
-            logger.info(f"🔄 Returning {servo_id} COUNTER-CLOCKWISE SLOWLY from {current_angle}° to {target_angle}° (resting position, MG90S)")
+            logger.debug("🔄 Returning %s COUNTER-CLOCKWISE SLOWLY from %s° to %s° (resting position, MG90S)", servo_id, current_angle, target_angle)
             
             if self.demo_mode:
-                logger.info(f"DEMO: Servo {servo_id} would return COUNTER-CLOCKWISE SLOWLY to {target_angle}°")
-                self.servo_positions[servo_id] = float(target_angle)
+                logger.info("DEMO: Servo %s would return COUNTER-CLOCKWISE SLOWLY to %s°", servo_id, target_angle)
+                self._set_position(servo_id, float(target_angle))
                 self._save_positions()
                 return True
             
             if servo_id not in self.servos:
-                logger.error(f"❌ Servo {servo_id} not found")
+                logger.error("❌ Servo %s not found", servo_id)
                 return False
             
             if not self.kit:
@@ -533,7 +924,7 @@ class ServoController:
             try:
                 # REVERSED pulse width: 2400-500 for counter-clockwise movement
                 self.kit.servo[channel].set_pulse_width_range(2400, 500)
-                logger.info("🔄 Servo2 pulse width reversed for counter-clockwise return")
+                logger.debug("🔄 Servo2 pulse width reversed for counter-clockwise return")
             except:
                 pass
             
@@ -544,7 +935,7 @@ class ServoController:
             if steps == 0:
                 steps = 1  # At least one step
             
-            logger.info(f"⚡ Returning fast: {start_angle}° → {target_angle}° in {steps} steps ({step_size}° per step)")
+            logger.debug("⚡ Returning fast: %s° → %s° in %s steps (%s° per step)", start_angle, target_angle, steps, step_size)
             
             # Fast movement - larger steps, minimal delays
             for step in range(1, steps + 1):
@@ -557,48 +948,66 @@ class ServoController:
                 if intermediate_angle < target_angle:
                     intermediate_angle = target_angle
                 
-                self.kit.servo[channel].angle = intermediate_angle
+                self._set_angle(channel, intermediate_angle)
                 time.sleep(0.02)  # 20ms delay - very fast movement
             
             # Final position - ensure it's exactly 3° (resting position)
             final_angle = max(3, target_angle)  # Resting position is 3°
-            self.kit.servo[channel].angle = final_angle
-            self.servo_positions[servo_id] = float(final_angle)
+            self._set_angle(channel, final_angle)
+            self._set_position(servo_id, float(final_angle))
             
             # Wait for movement to complete
             time.sleep(0.1)
             
             # Set to 3° one more time to ensure it's at rest position
-            self.kit.servo[channel].angle = 3
+            self._set_angle(channel, 3)
             time.sleep(0.1)
             
-            logger.info(f"✅ Servo {servo_id} (channel {channel}) returned FAST to {final_angle}° and STOPPED (resting position)")
+            logger.info("✅ Servo %s (channel %s) returned FAST to %s° and STOPPED (resting position)", servo_id, channel, final_angle)
             
             # Save position
             self._save_positions()
             
             return True
-            
+        
         except Exception as e:
-            logger.error(f"❌ Error resetting servo2: {e}", exc_info=True)
+            logger.error("❌ Error resetting servo2: %s", e, exc_info=True)
             return False
 
 
 class SMSController:
-    """Handles SMS sending via SIMCOM module (SIM800L/SIM900A)"""
+    """Handles SMS sending via SIMCOM module (SIM800L/SIM900A), over simcom_at.ATClient"""
     
-    def __init__(self, demo_mode=False, serial_port='/dev/ttyUSB0', baudrate=115200):
+    PROMPT_TIMEOUT = 10  # AT+CMGS -> '>' prompt
+    SEND_TIMEOUT = 30  # Ctrl+Z -> +CMGS (network submit)
+    REGISTER_TIMEOUT = 10  # Wait for re-registration after AT+COPS=0
+    
+    def __init__(self, demo_mode=False, serial_port='/dev/ttyUSB0', baudrate=115200, defer_init=False):
         self.demo_mode = demo_mode
         self.serial_port = serial_port
         self.baudrate = baudrate  # Default to 115200 (most SIMCOM modules use this)
         self.serial = None
+        self._at_client = None
         self.sim_inserted = False
         self.signal_strength = 0
         self.last_sms_time = 0  # Track last SMS time to prevent too frequent sends
         
-        if not demo_mode:
+        if not defer_init:
+            self.initialize()
+    
+    def initialize(self):
+        """Probe the SIMCOM module (baud probing can take several seconds - main() runs it in a worker thread)"""
+        if not self.demo_mode:
+            load_serial()
             self._initialize_simcom()
     
+    @property
+    def at(self) -> ATClient:
+        """AT client for the current port (rebuilt if the port object changes)"""
+        if self._at_client is None or self._at_client.ser is not self.serial:
+            self._at_client = ATClient(self.serial)
+        return self._at_client
+    
     def _initialize_simcom(self):
         """Initialize SIMCOM module and check status"""
         try:
@@ -632,79 +1041,30 @@ class SMSController:
                 return
             
             self.serial_port = simcom_port
-            logger.info(f"📱 Connecting to SIMCOM module at {simcom_port}...")
-            
-            # Try different baud rates (most SIMCOM modules use 115200)
-            baud_rates = [115200, 9600, 57600, 38400]
-            self.serial = None
-            working_baud = None
-            
-            for baud in baud_rates:
-                try:
-                    logger.info(f"   Trying baud rate {baud}...")
-                    test_serial = serial.Serial(
-                        port=simcom_port,
-                        baudrate=baud,
-                        timeout=3,
-                        writeTimeout=3
-                    )
-                    time.sleep(2)  # Wait for module to initialize
-                    
-                    # Test AT command
-                    test_serial.reset_input_buffer()
-                    test_serial.write(b"AT\r\n")
-                    time.sleep(0.5)
-                    
-                    response = ""
-                    start_time = time.time()
-                    while time.time() - start_time < 2:
-                        if test_serial.in_waiting > 0:
-                            response += test_serial.read(test_serial.in_waiting).decode('utf-8', errors='ignore')
-                            if 'OK' in response:
-                                break
-                        time.sleep(0.1)
-                    
-                    if 'OK' in response:
-                        logger.info(f"   ✅ Module responding at {baud} baud!")
-                        self.serial = test_serial
-                        self.baudrate = baud
-                        working_baud = baud
-                        break
-                    else:
-                        test_serial.close()
-                        logger.debug(f"   No response at {baud} baud")
-                except Exception as e:
-                    logger.debug(f"   Error at {baud} baud: {e}")
-                    if test_serial and not test_serial.closed:
-                        test_serial.close()
+            logger.info("📱 Connecting to SIMCOM module at %s...", simcom_port)
             
-            if not self.serial:
-                logger.error(f"❌ Could not establish communication with SIMCOM module at {simcom_port}")
-                logger.error("   Tried baud rates: " + ", ".join(map(str, baud_rates)))
+            # Try different baud rates (most SIMCOM modules use 115200); returns on the first OK
+            at = open_modem(simcom_port, BAUD_RATES)
+            if at is None:
+                logger.error("❌ Could not establish communication with SIMCOM module at %s", simcom_port)
+                logger.error("   Tried baud rates: " + ", ".join(map(str, BAUD_RATES)))
                 logger.error("   Check: power, USB connection, or try different port")
                 return
             
-            logger.info(f"✅ Connected at {working_baud} baud")
-            
-            # Send basic AT command to wake up module
-            self._send_at_command("AT")
-            time.sleep(0.5)
+            self.serial = at.ser
+            self._at_client = at
+            self.baudrate = at.ser.baudrate
+            logger.info("✅ Connected at %s baud", self.baudrate)
             
             # Set SMS text mode (should be done once at startup)
-            self._send_at_command("AT+CMGF=1")
-            time.sleep(0.5)
+            at.command("AT+CMGF=1", timeout=2)
             
             # Try to set sender name to "PillPal" via phonebook
             # This stores "PillPal" as the device name (some carriers use this as sender name)
-            try:
-                # Store "PillPal" in SIM phonebook at position 1 (if supported)
-                # AT+CPBW writes to phonebook: AT+CPBW=<index>,"<number>",<type>,"<name>"
-                # We'll try to set it, but it may not work on all carriers
-                self._send_at_command('AT+CPBW=1,"PillPal",129,"PillPal"')
-                time.sleep(0.3)
-                logger.info("📱 Attempted to set sender name to 'PillPal'")
-            except Exception as e:
-                logger.debug(f"Could not set sender name (this is normal): {e}")
+            # AT+CPBW writes to phonebook: AT+CPBW=<index>,"<number>",<type>,"<name>"
+            # We'll try to set it, but it may not work on all carriers
+            if at.command('AT+CPBW=1,"PillPal",129,"PillPal"', timeout=2).ok:
+                logger.info("📱 Set sender name to 'PillPal'")
             
             # Note: Sender name is usually controlled by the carrier/SIM card
             # The phonebook method above may not work on all carriers
@@ -716,106 +1076,15 @@ class SMSController:
             # Check signal strength
             self._check_signal()
             
-            logger.info(f"✅ SIMCOM module initialized: SIM={'Inserted' if self.sim_inserted else 'Not found'}, Signal={self.signal_strength}")
-            
+            logger.info("✅ SIMCOM module initialized: SIM=%s, Signal=%s", 'Inserted' if self.sim_inserted else 'Not found', self.signal_strength)
+        
         except ImportError:
             logger.warning("⚠️ pyserial not installed. Install with: pip3 install pyserial")
             self.serial = None
         except Exception as e:
-            logger.error(f"❌ Error initializing SIMCOM: {e}")
+            logger.error("❌ Error initializing SIMCOM: %s", e)
             self.serial = None
     
-    def _cancel_any_pending_sms(self):
-        """Cancel any pending SMS operation (if module is stuck waiting for input)"""
-        try:
-            # Send Ctrl+C (0x03) multiple times to ensure cancellation
-            for _ in range(3):
-                self.serial.write(b'\x03')
-                time.sleep(0.2)
-            
-            # Send ESC (0x1B) as well
-            self.serial.write(b'\x1B')
-            time.sleep(0.2)
-            
-            # Clear buffers completely
-            self.serial.reset_input_buffer()
-            self.serial.reset_output_buffer()
-            time.sleep(0.3)
-            
-            if self.serial.in_waiting > 0:
-                self.serial.read(self.serial.in_waiting)
-            
-            # Send AT command to reset module state
-            try:
-                self._send_at_command("AT", timeout=2)
-            except:
-                pass
-        except:
-            pass
-    
-    def _send_at_command(self, command: str, timeout=3, wait_for_prompt=False) -> str:
-        """Send AT command and wait for response"""
-        if not self.serial or self.serial.closed:
-            return ""
-        
-        try:
-            # CRITICAL: Clear buffer completely before sending
-            self.serial.reset_input_buffer()
-            time.sleep(0.15)
-            
-            # Clear any leftover data
-            if self.serial.in_waiting > 0:
-                self.serial.read(self.serial.in_waiting)
-            time.sleep(0.15)
-            
-            # Send command
-            self.serial.write(f"{command}\r\n".encode())
-            time.sleep(0.25)  # Give module time to process
-            
-            # Read response
-            response = ""
-            start_time = time.time()
-            while time.time() - start_time < timeout:
-                if self.serial.in_waiting > 0:
-                    chunk = self.serial.read(self.serial.in_waiting).decode('utf-8', errors='ignore')
-                    response += chunk
-                    
-                    # If waiting for prompt (for CMGS), look for ">"
-                    if wait_for_prompt:
-                        if '>' in response:
-                            break
-                        # Sometimes we get CMGS confirmation instead of prompt
-                        if '+CMGS:' in response:
-                            break
-                    else:
-                        # For regular commands, wait for OK or ERROR
-                        if 'OK' in response or 'ERROR' in response:
-                            break
-                time.sleep(0.1)
-            
-            # Read any remaining data (important for prompt detection)
-            if wait_for_prompt and '>' not in response:
-                # Wait longer and read multiple times for prompt
-                for wait_attempt in range(3):
-                    time.sleep(0.8)  # Wait 0.8 seconds
-                    if self.serial.in_waiting > 0:
-                        additional = self.serial.read(self.serial.in_waiting).decode('utf-8', errors='ignore')
-                        response += additional
-                        if '>' in additional:
-                            break
-            
-            # Clear any remaining data after reading
-            time.sleep(0.15)
-            if self.serial.in_waiting > 0:
-                self.serial.read(self.serial.in_waiting)
-            
-            return response.strip()
-        except Exception as e:
-            logger.error(f"Error sending AT command {command}: {e}")
-            import traceback
-            traceback.print_exc()
-            return ""
-    
     def _check_sim_status(self) -> bool:
         """Check if SIM card is inserted"""
         try:
@@ -823,25 +1092,19 @@ class SMSController:
                 return False
             
             # Check SIM card status
-            response = self._send_at_command("AT+CPIN?")
-            if "READY" in response:
-                self.sim_inserted = True
+            status = self.at.sim_status()
+            self.sim_inserted = status == "READY"
+            if self.sim_inserted:
                 logger.info("✅ SIM card detected and ready")
-                return True
-            elif "SIM PIN" in response:
+            elif status == "SIM PIN":
                 logger.warning("⚠️ SIM card requires PIN")
-                self.sim_inserted = False
-                return False
-            elif "SIM PUK" in response:
+            elif status == "SIM PUK":
                 logger.error("❌ SIM card is locked (PUK required)")
-                self.sim_inserted = False
-                return False
             else:
                 logger.warning("⚠️ SIM card not detected")
-                self.sim_inserted = False
-                return False
+            return self.sim_inserted
         except Exception as e:
-            logger.error(f"Error checking SIM status: {e}")
+            logger.error("Error checking SIM status: %s", e)
             self.sim_inserted = False
             return False
     
@@ -851,25 +1114,20 @@ class SMSController:
             if not self.serial:
                 return 0
             
-            response = self._send_at_command("AT+CSQ")
-            # Response format: +CSQ: <rssi>,<ber>
             # rssi: 0-31 (99 = unknown/not detectable)
-            if "+CSQ:" in response:
-                parts = response.split("+CSQ:")[1].split(",")[0].strip()
-                try:
-                    rssi = int(parts)
-                    if rssi == 99:
-                        self.signal_strength = 0
-                        logger.warning("⚠️ Signal strength: Unknown/Not detectable")
-                    else:
-                        self.signal_strength = rssi
-                        logger.info(f"📶 Signal strength: {rssi}/31")
-                    return self.signal_strength
-                except ValueError:
-                    return 0
-            return 0
+            quality = self.at.signal_quality()
+            if quality is None:
+                return 0
+            rssi = quality[0]
+            if rssi == 99:
+                self.signal_strength = 0
+                logger.warning("⚠️ Signal strength: Unknown/Not detectable")
+            else:
+                self.signal_strength = rssi
+                logger.info("📶 Signal strength: %s/31", rssi)
+            return self.signal_strength
         except Exception as e:
-            logger.error(f"Error checking signal: {e}")
+            logger.error("Error checking signal: %s", e)
             return 0
     
     def get_status(self) -> dict:
@@ -880,78 +1138,78 @@ class SMSController:
             "connected": self.serial is not None and not self.serial.closed if self.serial else False
         }
     
+    def diagnose(self, checks: Optional[list] = None) -> dict:
+        """
+        Run the modem diagnostics plan (simcom_diag) on the open port - blocking, call from a thread
+        Waits for an SMS in progress to finish; refreshes the cached SIM and signal status.
+        """
+        if not self.serial or self.serial.closed:
+            raise RuntimeError("SIMCOM module not connected")
+        report = run_plan(self.at, select_plan(checks))
+        for check in report['checks']:
+            if check['name'] == 'sim':
+                self.sim_inserted = check['value'] == 'READY'
+            elif check['name'] == 'signal' and check['value']:
+                self.signal_strength = 0 if check['value']['rssi'] == 99 else check['value']['rssi']
+        return report
+    
     def _check_and_ensure_network_registered(self) -> bool:
         """Check network registration and re-register if needed - with automatic recovery"""
         try:
             if not self.serial or self.serial.closed:
                 return False
             
-            # Check registration status
-            response = self._send_at_command("AT+CREG?", timeout=3)
+            # Only the +CREG line is parsed (the old text split also swallowed "OK", so every
+            # SMS forced a ~12 s re-registration)
+            stat = self.at.registration()
+            if stat in REGISTERED:
+                return True  # Already registered
             
-            is_registered = False
-            if "+CREG:" in response:
-                try:
-                    parts = response.split("+CREG:")[1].strip().split(",")
-                    if len(parts) >= 2:
-                        stat = int(parts[1].strip())
-                        # Status 1, 2, or 5 means registered
-                        if stat in [1, 2, 5]:
-                            is_registered = True
-                            return True  # Already registered
-                        else:
-                            logger.warning(f"⚠️ Network not registered (status: {stat}), re-registering...")
-                except:
-                    pass
+            logger.warning("⚠️ Network not registered (status: %s), re-registering...", stat)
             
-            # If not registered, force re-registration
-            if not is_registered:
-                logger.info("🔄 Network lost - re-registering automatically...")
-                
-                # Cancel any stuck operations first
-                self._cancel_any_pending_sms()
-                time.sleep(0.3)
-                
-                # Clear buffers
-                self.serial.reset_input_buffer()
-                time.sleep(0.2)
-                
-                # Enable network registration notifications
-                self._send_at_command("AT+CREG=2", timeout=2)
-                time.sleep(0.5)
-                
-                # Force automatic network selection
-                self._send_at_command("AT+COPS=0", timeout=8)
-                time.sleep(3)  # Wait for registration
-                
-                # Check again
-                response = self._send_at_command("AT+CREG?", timeout=3)
-                if "+CREG:" in response:
-                    try:
-                        parts = response.split("+CREG:")[1].strip().split(",")
-                        if len(parts) >= 2:
-                            stat = int(parts[1].strip())
-                            if stat in [1, 2, 5]:
-                                logger.info("✅ Network re-registered successfully")
-                                return True
-                            else:
-                                logger.warning(f"⚠️ Still not registered (status: {stat}), but will try SMS anyway")
-                    except:
-                        pass
-                
-                # Return True anyway - sometimes SMS works even if status shows 0
-                return True
+            # Force automatic network selection, then wait for the +CREG URC (no fixed sleep)
+            self.at.cancel()
+            self.at.command("AT+COPS=0", timeout=8)
+            stat = self.at.wait_registered(self.REGISTER_TIMEOUT)
+            if stat in REGISTERED:
+                logger.info("✅ Network re-registered successfully")
+            else:
+                logger.warning("⚠️ Still not registered (status: %s), but will try SMS anyway", stat)
             
+            # Return True anyway - sometimes SMS works even if status shows 0
             return True
         except Exception as e:
-            logger.error(f"Error checking network registration: {e}")
+            logger.error("Error checking network registration: %s", e)
             return True  # Don't block SMS attempt
     
+    @staticmethod
+    def _normalize_phone(phone: str) -> Optional[str]:
+        """Convert a Philippine number to +63XXXXXXXXXX (SIMCOM modules need international format)"""
+        # Remove all spaces, dashes, and other characters
+        phone_clean = phone.strip().replace(" ", "").replace("-", "").replace("(", "").replace(")", "").replace(".", "")
+        
+        # Remove + if present
+        if phone_clean.startswith("+"):
+            phone_clean = phone_clean[1:]
+        
+        # Remove country code 63 if present
+        if phone_clean.startswith("63"):
+            phone_clean = phone_clean[2:]
+        
+        # Remove leading 0 if present (Philippine format)
+        if phone_clean.startswith("0"):
+            phone_clean = phone_clean[1:]
+        
+        # Now we should have just the 10-digit number
+        if not phone_clean.isdigit() or len(phone_clean) != 10:
+            return None
+        return "+63" + phone_clean
+    
     def send_sms(self, phone_numbers: list, message: str) -> bool:
         """Send SMS to phone numbers"""
         try:
             if self.demo_mode:
-                logger.info(f"DEMO: Would send SMS to {phone_numbers}: {message}")
+                logger.info("DEMO: Would send SMS to %s: %s", phone_numbers, message)
                 return True
             
             if not self.serial or self.serial.closed:
@@ -962,291 +1220,95 @@ class SMSController:
                 logger.error("❌ SIM card not inserted or not ready")
                 return False
             
-            # CRITICAL: Check and ensure network is registered BEFORE SMS
-            # This is called every time because network can be lost after first SMS
-            if not self._check_and_ensure_network_registered():
-                logger.warning("⚠️ Network registration check failed, but will attempt SMS anyway")
-            
-            # Check signal strength
-            try:
-                csq_response = self._send_at_command("AT+CSQ", timeout=2)
-                if "+CSQ:" in csq_response:
-                    try:
-                        parts = csq_response.split("+CSQ:")[1].strip().split(",")
-                        if len(parts) >= 1:
-                            rssi = int(parts[0].strip())
-                            if rssi == 99:
-                                logger.warning("⚠️ No signal - SMS may fail")
-                            elif rssi < 10:
-                                logger.warning(f"⚠️ Weak signal ({rssi}/31) - SMS may fail")
-                    except:
-                        pass
-            except:
-                pass
-            
-            # Add "PillPal: " prefix to message since sender name is controlled by carrier
-            # This ensures "PillPal" appears in the message even if sender name shows "Iz Me"
-            if not message.startswith("PillPal:"):
-                message = f"PillPal: {message}"
-            
-            # Prevent too frequent SMS sends (wait at least 3 seconds between SMS)
-            current_time = time.time()
-            if current_time - self.last_sms_time < 3:
-                wait_time = 3 - (current_time - self.last_sms_time)
-                time.sleep(wait_time)
-            
-            # CRITICAL: Cancel any stuck operations FIRST (module might be busy from previous SMS)
-            self._cancel_any_pending_sms()
-            time.sleep(0.3)
-            
-            # Clear all buffers completely
-            self.serial.reset_input_buffer()
-            self.serial.reset_output_buffer()
-            time.sleep(0.3)
-            if self.serial.in_waiting > 0:
-                self.serial.read(self.serial.in_waiting)
-            
-            # Check if module is ready (with recovery)
-            module_ready = False
-            for attempt in range(3):
-                at_response = self._send_at_command("AT", timeout=2)
-                if "OK" in at_response:
-                    module_ready = True
-                    break
-                else:
-                    logger.warning(f"⚠️ Module not responding (attempt {attempt + 1}/3), recovering...")
-                    # Cancel and clear again
-                    self._cancel_any_pending_sms()
-                    time.sleep(0.5)
-                    self.serial.reset_input_buffer()
-                    if self.serial.in_waiting > 0:
-                        self.serial.read(self.serial.in_waiting)
-            
-            if not module_ready:
-                logger.error("❌ Module not responding after recovery attempts, skipping SMS")
-                return False
-            
-            # Set SMS text mode
-            self._send_at_command("AT+CMGF=1", timeout=2)
-            time.sleep(0.2)
-            
-            success_count = 0
-            for phone in phone_numbers:
-                # Simplified: single attempt per phone (no retries to avoid delays)
-                # SMS runs in background thread so it won't block other operations
-                try:
-                    # Normalize phone number for SMS (SIMCOM modules need international format)
-                    # Remove all spaces, dashes, and other characters
-                    phone = phone.strip().replace(" ", "").replace("-", "").replace("(", "").replace(")", "").replace(".", "")
-                    
-                    # Log original format for debugging
-                    original_phone = phone
-                    
-                    # ALWAYS convert to international format (+63XXXXXXXXXX)
-                    # Remove any existing country code or leading characters
-                    phone_clean = phone
-                    
-                    # Remove + if present
-                    if phone_clean.startswith("+"):
-                        phone_clean = phone_clean[1:]
-                    
-                    # Remove country code 63 if present
-                    if phone_clean.startswith("63"):
-                        phone_clean = phone_clean[2:]
-                    
-                    # Remove leading 0 if present (Philippine format)
-                    if phone_clean.startswith("0"):
-                        phone_clean = phone_clean[1:]
-                    
-                    # Now we should have just the 10-digit number
-                    # Validate it's 10 digits
-                    if not phone_clean.isdigit() or len(phone_clean) != 10:
-                        logger.error(f"❌ Invalid phone number format: {original_phone} (cleaned: {phone_clean})")
-                        continue
-                    
-                    # Convert to +63 format
-                    phone = "+63" + phone_clean
-                    
-                    # Verify final format
-                    if not phone.startswith("+63") or len(phone) != 13:
-                        logger.error(f"❌ Phone number conversion failed: {original_phone} → {phone}")
-                        continue
-                    
-                    logger.info(f"📤 Sending SMS to {phone} (original: {original_phone})...")
-                    
-                    # Clear buffer before sending
-                    self.serial.reset_input_buffer()
-                    time.sleep(0.3)
-                    if self.serial.in_waiting > 0:
-                        self.serial.read(self.serial.in_waiting)
-                    
-                    # CRITICAL: Ensure module is ready before sending CMGS
-                    # Send AT command to wake up module
-                    at_check = self._send_at_command("AT", timeout=2)
-                    if "OK" not in at_check:
-                        logger.warning(f"⚠️ Module not ready for {phone}, skipping...")
-                        self._cancel_any_pending_sms()
-                        time.sleep(0.5)
-                        continue
-                    
-                    # Clear buffer again
-                    time.sleep(0.2)
-                    if self.serial.in_waiting > 0:
-                        self.serial.read(self.serial.in_waiting)
-                    
-                    # Send AT+CMGS command and wait for prompt (with retries)
-                    prompt_received = False
-                    prompt_response = ""
-                    
-                    for prompt_attempt in range(3):  # Try 3 times
-                        logger.debug(f"   Attempting to get '>' prompt (attempt {prompt_attempt + 1}/3)...")
-                        
-                        # Clear buffer before each attempt
-                        self.serial.reset_input_buffer()
-                        time.sleep(0.2)
-                        if self.serial.in_waiting > 0:
-                            self.serial.read(self.serial.in_waiting)
-                        
-                        # Send CMGS command
-                        prompt_response = self._send_at_command(f'AT+CMGS="{phone}"', timeout=10, wait_for_prompt=True)
-                        
-                        # Check for prompt
-                        if '>' in prompt_response:
-                            prompt_received = True
-                            logger.debug(f"   ✅ Got '>' prompt on attempt {prompt_attempt + 1}")
-                            break
-                        else:
-                            # Wait longer and check buffer
-                            logger.debug(f"   ⚠️ No prompt yet, waiting longer...")
-                            time.sleep(1.0)  # Wait 1 second
-                            
-                            # Read any additional data
-                            if self.serial.in_waiting > 0:
-                                additional = self.serial.read(self.serial.in_waiting).decode('utf-8', errors='ignore')
-                                prompt_response += additional
-                                logger.debug(f"   Additional data: {additional[:100]}")
-                                
-                                if '>' in additional:
-                                    prompt_received = True
-                                    logger.debug(f"   ✅ Got '>' prompt in additional data")
-                                    break
-                            
-                            # If still no prompt, cancel and retry
-                            if prompt_attempt < 2:  # Not last attempt
-                                logger.warning(f"   ⚠️ No prompt (attempt {prompt_attempt + 1}/3), canceling and retrying...")
-                                self._cancel_any_pending_sms()
-                                time.sleep(1.0)  # Wait before retry
-                    
-                    if not prompt_received:
-                        logger.error(f"❌ No '>' prompt for {phone} after 3 attempts")
-                        logger.error(f"   Response received: {prompt_response[:200]}")
-                        self._cancel_any_pending_sms()
-                        # Clear all buffers
-                        self.serial.reset_input_buffer()
-                        time.sleep(0.5)
-                        if self.serial.in_waiting > 0:
-                            self.serial.read(self.serial.in_waiting)
+            at = self.at
+            with at.lock:  # One exchange at a time (SMS threads, modem diagnostics)
+                
+                # CRITICAL: Check and ensure network is registered BEFORE SMS
+                # This is called every time because network can be lost after first SMS
+                if not self._check_and_ensure_network_registered():
+                    logger.warning("⚠️ Network registration check failed, but will attempt SMS anyway")
+                
+                # Check signal strength
+                quality = at.signal_quality()
+                if quality is not None:
+                    rssi = quality[0]
+                    if rssi == 99:
+                        logger.warning("⚠️ No signal - SMS may fail")
+                    elif rssi < 10:
+                        logger.warning("⚠️ Weak signal (%s/31) - SMS may fail", rssi)
+                
+                # Add "PillPal: " prefix to message since sender name is controlled by carrier
+                # This ensures "PillPal" appears in the message even if sender name shows "Iz Me"
+                if not message.startswith("PillPal:"):
+                    message = f"PillPal: {message}"
+                
+                # Prevent too frequent SMS sends (wait at least 3 seconds between SMS)
+                current_time = time.time()
+                if current_time - self.last_sms_time < 3:
+                    wait_time = 3 - (current_time - self.last_sms_time)
+                    time.sleep(wait_time)
+                
+                # Check if module is ready (ESC + AT until OK also clears a stuck '>' prompt)
+                if not at.sync(attempts=3, timeout=2):
+                    logger.error("❌ Module not responding after recovery attempts, skipping SMS")
+                    return False
+                
+                # Set SMS text mode
+                at.command("AT+CMGF=1", timeout=2)
+                
+                success_count = 0
+                for original_phone in phone_numbers:
+                    # Single attempt per phone; SMS runs in a worker thread so it won't block other operations
+                    phone = self._normalize_phone(original_phone)
+                    if phone is None:
+                        logger.error("❌ Invalid phone number format: %s", original_phone)
                         continue
                     
-                    # Clear buffer before sending message
-                    time.sleep(0.1)
-                    if self.serial.in_waiting > 0:
-                        self.serial.read(self.serial.in_waiting)
-                    
-                    # Send message
-                    message_bytes = message.encode('utf-8')
-                    self.serial.write(message_bytes)
-                    time.sleep(0.15)
-                    self.serial.write(b'\x1A')  # Ctrl+Z
-                    time.sleep(0.3)
-                    
-                    # Wait for response (faster timeout)
-                    response = ""
-                    start_time = time.time()
-                    while time.time() - start_time < 8:  # 8 second timeout
-                        if self.serial.in_waiting > 0:
-                            chunk = self.serial.read(self.serial.in_waiting).decode('utf-8', errors='ignore')
-                            response += chunk
-                            
-                            if '+CMGS:' in response:
-                                logger.info(f"✅ SMS sent successfully to {phone}")
-                                success_count += 1
-                                self.last_sms_time = time.time()
-                                break
-                            elif 'OK' in response and len(response) > 5:
-                                # Quick check for CMGS
-                                time.sleep(0.3)
-                                if self.serial.in_waiting > 0:
-                                    more = self.serial.read(self.serial.in_waiting).decode('utf-8', errors='ignore')
-                                    response += more
-                                    if '+CMGS:' in response:
-                                        logger.info(f"✅ SMS sent successfully to {phone}")
-                                        success_count += 1
-                                        self.last_sms_time = time.time()
-                                        break
-                                # Consider OK as success
-                                logger.info(f"✅ SMS sent to {phone}")
-                                success_count += 1
-                                self.last_sms_time = time.time()
-                                break
-                            elif 'ERROR' in response or 'CMS ERROR' in response:
-                                logger.error(f"❌ SMS failed: {response[:150]}")
-                                break
-                        time.sleep(0.1)
-                    
-                    # CRITICAL: Clean up after SMS to prevent "module busy" on next SMS
-                    time.sleep(0.3)
-                    if self.serial.in_waiting > 0:
-                        self.serial.read(self.serial.in_waiting)
-                    
-                    # Cancel any pending operations to ensure clean state
-                    self._cancel_any_pending_sms()
-                    
-                    # Clear buffers
-                    self.serial.reset_input_buffer()
-                    time.sleep(0.2)
-                    
-                    # Short wait between phone numbers
-                    time.sleep(1.5)
-                    
-                except Exception as e:
-                    logger.error(f"❌ Error sending SMS to {phone}: {e}")
-                    # CRITICAL: Cancel any pending operations and clean up
-                    try:
-                        self._cancel_any_pending_sms()
-                        self.serial.reset_input_buffer()
-                        if self.serial.in_waiting > 0:
-                            self.serial.read(self.serial.in_waiting)
-                        time.sleep(0.5)
-                        # Re-check network registration after error
+                    logger.info("📤 Sending SMS to %s (original: %s)...", phone, original_phone)
+                    result = at.send_sms(phone, message, prompt_timeout=self.PROMPT_TIMEOUT, send_timeout=self.SEND_TIMEOUT)
+                    if result.ok:
+                        logger.info("✅ SMS sent successfully to %s (%s, %.1fs)", phone, result.value('+CMGS:') or 'no ref', result.elapsed)
+                        success_count += 1
+                        self.last_sms_time = time.time()
+                    elif result.command.startswith('AT+CMGS'):
+                        logger.error("❌ No '>' prompt for %s: %s", phone, result.error)
+                    else:
+                        logger.error("❌ SMS to %s failed: %s", phone, result.error)
+                        # Network may have dropped mid-send - recheck before the next recipient
                         self._check_and_ensure_network_registered()
-                    except:
-                        pass
-                    continue
-            
-            if success_count > 0:
-                logger.info(f"✅ SMS sent to {success_count}/{len(phone_numbers)} recipient(s)")
-                return True
-            else:
-                logger.error("❌ Failed to send SMS to any recipient")
-                return False
                 
+                if success_count > 0:
+                    logger.info("✅ SMS sent to %s/%s recipient(s)", success_count, len(phone_numbers))
+                    return True
+                else:
+                    logger.error("❌ Failed to send SMS to any recipient")
+                    return False
+        
         except Exception as e:
-            logger.error(f"Error sending SMS: {e}")
+            logger.error("Error sending SMS: %s", e)
             return False
 
 
+def schedule_key(schedule: dict) -> str:
+    """Stable key for a schedule: its id if the web app sent one, else date/time/frame/medication"""
+    if schedule.get('id') is not None:
+        return str(schedule['id'])
+    return "_".join(str(schedule.get(field) or '') for field in ('date', 'time', 'time_frame', 'medication'))
+
+
 class LCDController:
-    """Handles I2C LCD display (address 0x27)"""
+    """Handles I2C LCD display (address 0x27 or 0x3F, whichever the I2C bus scan found)"""
     
-    LCD_ADDRESS = 0x27
+    LCD_ADDRESS = 0x27  # Used when the bus can't be scanned
     LCD_COLS = 16
     LCD_ROWS = 2
     
-    def __init__(self, demo_mode=False):
+    def __init__(self, demo_mode=False, defer_init=False):
         self.demo_mode = demo_mode
         self.lcd = None
+        self.address = None  # I2C address in use once initialized
         self.current_schedules = []  # Store schedules from frontend
+        self._schedule_index: Dict[str, tuple] = {}  # schedule key -> (parsed time or None, schedule)
         self.last_update_time = None
         self.dispensed_schedules = set()  # Track dispensed schedules (date_time_frame)
         self.is_dispensing = False  # Flag to show "DISPENSING" message
@@ -1254,37 +1316,86 @@ class LCDController:
         self.is_dispensed = False  # Flag to show "DISPENSED" message
         self.dispensed_until = None  # When to stop showing "DISPENSED"
         
-        if not demo_mode and LCD_AVAILABLE:
+        if not defer_init:
+            self.initialize()
+    
+    def initialize(self):
+        """Set up the I2C LCD"""
+        if not self.demo_mode and load_lcd():
             self._initialize_lcd()
     
     def _initialize_lcd(self):
         """Initialize I2C LCD display"""
         try:
-            logger.info(f"🔧 Initializing I2C LCD at address 0x{self.LCD_ADDRESS:02X}...")
-            # Initialize LCD with I2C address 0x27, 16 columns, 2 rows
-            self.lcd = CharLCD(i2c_expander='PCF8574', address=self.LCD_ADDRESS, cols=self.LCD_COLS, rows=self.LCD_ROWS)
-            self.lcd.clear()
-            self.lcd.write_string("PillPal Ready")
-            time.sleep(1)
+            # Backpacks ship at 0x27 (PCF8574) or 0x3F (PCF8574A); the cached bus scan says which
+            address = self.LCD_ADDRESS
+            if i2c_bus.scan() is not None:
+                address = i2c_bus.find(LCD_ADDRESSES)
+                if address is None:
+                    raise RuntimeError("no LCD answering at " + " or ".join(f"0x{a:02X}" for a in LCD_ADDRESSES))
+            
+            logger.info("🔧 Initializing I2C LCD at address 0x%02X...", address)
+            # 16 columns, 2 rows; the first redraw replaces the splash text
+            with i2c_bus.transaction('lcd'):
+                self.lcd = CharLCD(i2c_expander='PCF8574', address=address, cols=self.LCD_COLS, rows=self.LCD_ROWS)
+                self.lcd.clear()
+                self.lcd.write_string("PillPal Ready")
+            self.address = address
             logger.info("✅ LCD initialized successfully")
         except Exception as e:
-            logger.error(f"❌ Failed to initialize LCD: {e}")
+            logger.error("❌ Failed to initialize LCD: %s", e)
             logger.error("LCD will run in demo mode")
             self.demo_mode = True
             self.lcd = None
     
     def update_schedules(self, schedules: list):
         """Update schedules from frontend (received via WebSocket)"""
-        self.current_schedules = schedules
+        self._schedule_index = {}
+        self.apply_schedule_delta({schedule_key(schedule): schedule for schedule in schedules}, [])
+    
+    def apply_schedule_delta(self, upserted: Dict[str, dict], removed: list):
+        """Apply changed/removed schedules - only the changed entries are re-parsed"""
+        for key in removed:
+            self._schedule_index.pop(key, None)
+        for key, schedule in upserted.items():
+            self._schedule_index[key] = (self._parse_schedule(schedule), schedule)
+        self.current_schedules = [schedule for _, schedule in self._schedule_index.values()]
         self.last_update_time = time.time()
-        logger.info(f"📅 LCD: Updated with {len(schedules)} schedule(s)")
+        logger.debug("📅 LCD: %s schedule(s) changed, %s removed, %s total",
+                     len(upserted), len(removed), len(self.current_schedules))
         self._update_display()
     
+    def _parse_schedule(self, schedule: dict) -> Optional[tuple]:
+        """Parse a schedule's date/time once -> (date or None, hour, minute, time_str, time_frame)"""
+        try:
+            # Parse time from schedule (format: "HH:MM" or "HH:MM:SS")
+            time_str = schedule.get('time', '')
+            if not time_str:
+                return None
+            
+            # Parse time (handle both "HH:MM" and "HH:MM:SS")
+            time_parts = time_str.split(':')
+            hour = int(time_parts[0])
+            minute = int(time_parts[1])
+            
+            # Parse date (None = today, resolved when the nearest dispense is calculated)
+            schedule_date = None
+            date_str = schedule.get('date')
+            if date_str:
+                try:
+                    schedule_date = datetime.strptime(date_str, "%Y-%m-%d").date()
+                except:
+                    pass
+            return (schedule_date, hour, minute, time_str, schedule.get('time_frame', ''))
+        except Exception as e:
+            logger.warning("⚠️ Error parsing schedule time: %s", e)
+            return None
+    
     def mark_dispensed(self, date: str, time_str: str, time_frame: str):
         """Mark a schedule as dispensed and show DISPENSED, then find next closest time"""
-        key = f"{date}_{time_str}_{time_frame}"
+        key = slot_key(date, time_str, time_frame)
         self.dispensed_schedules.add(key)
-        logger.info(f"✅ LCD: Marked as dispensed - {key}")
+        logger.debug("✅ LCD: Marked as dispensed - %s", key)
         
         # Stop showing DISPENSING, now show DISPENSED
         self.is_dispensing = False
@@ -1299,7 +1410,7 @@ class LCDController:
         """Show DISPENSING message (for force dispense or manual dispense)"""
         self.is_dispensing = True
         self.dispensing_until = time.time() + duration
-        logger.info("📺 LCD: Showing DISPENSING message")
+        logger.debug("📺 LCD: Showing DISPENSING message")
         self._update_display()
     
     def _get_time_of_day(self, hour: int, minute: int = 0) -> str:
@@ -1316,7 +1427,7 @@ class LCDController:
     
     def _calculate_nearest_dispense(self) -> Optional[Dict]:
         """Calculate the nearest dispense time from current schedules (excluding dispensed ones)"""
-        if not self.current_schedules:
+        if not self._schedule_index:
             return None
         
         now = datetime.now()
@@ -1324,25 +1435,13 @@ class LCDController:
         nearest_schedule = None
         min_delta = None
         
-        for schedule in self.current_schedules:
+        # Schedules are parsed once when they change (see apply_schedule_delta)
+        for parsed, schedule in self._schedule_index.values():
+            if parsed is None:
+                continue
             try:
-                # Parse time from schedule (format: "HH:MM" or "HH:MM:SS")
-                time_str = schedule.get('time', '')
-                if not time_str:
-                    continue
-                
-                # Parse time (handle both "HH:MM" and "HH:MM:SS")
-                time_parts = time_str.split(':')
-                hour = int(time_parts[0])
-                minute = int(time_parts[1])
-                
-                # Get date from schedule or use today
-                date_str = schedule.get('date', now.strftime("%Y-%m-%d"))
-                
-                # Parse date
-                try:
-                    schedule_date = datetime.strptime(date_str, "%Y-%m-%d").date()
-                except:
+                schedule_date, hour, minute, time_str, time_frame = parsed
+                if schedule_date is None:
                     schedule_date = now.date()
                 
                 # Create datetime for the scheduled date and time
@@ -1354,7 +1453,6 @@ class LCDController:
                     schedule_time += timedelta(days=1)
                 
                 # Check if this schedule was already dispensed
-                time_frame = schedule.get('time_frame', '')
                 # Check both today's date and tomorrow's date (in case schedule moved to next day)
                 today_key = f"{schedule_date.strftime('%Y-%m-%d')}_{time_str}_{time_frame}"
                 tomorrow_date = schedule_time.date()
@@ -1374,7 +1472,7 @@ class LCDController:
                     nearest_time = schedule_time
                     nearest_schedule = schedule
             except Exception as e:
-                logger.warning(f"⚠️ Error parsing schedule time: {e}")
+                logger.warning("⚠️ Error evaluating schedule time: %s", e)
                 continue
         
         if nearest_time:
@@ -1410,7 +1508,7 @@ class LCDController:
                 # Timeout expired - stop showing DISPENSED and find next closest time
                 self.is_dispensed = False
                 self.dispensed_until = None
-                logger.info("📺 LCD: DISPENSED timeout expired, finding next closest time")
+                logger.debug("📺 LCD: DISPENSED timeout expired, finding next closest time")
         
         # Check if DISPENSING timeout expired
         if self.is_dispensing and self.dispensing_until:
@@ -1418,89 +1516,432 @@ class LCDController:
                 # Timeout expired - stop showing DISPENSING and show next nearest time
                 self.is_dispensing = False
                 self.dispensing_until = None
-                logger.info("📺 LCD: DISPENSING timeout expired, showing next nearest time")
+                logger.debug("📺 LCD: DISPENSING timeout expired, showing next nearest time")
         
         if self.demo_mode:
             if self.is_dispensing:
-                logger.info("📺 LCD (DEMO): DISPENSING")
+                logger.debug("📺 LCD (DEMO): DISPENSING")
             elif self.is_dispensed:
-                logger.info("📺 LCD (DEMO): DISPENSED")
+                logger.debug("📺 LCD (DEMO): DISPENSED")
             else:
                 nearest = self._calculate_nearest_dispense()
                 if nearest:
-                    logger.info(f"📺 LCD (DEMO): {nearest['date_str']} {nearest['time_str']} ({nearest['time_of_day']})")
+                    logger.debug("📺 LCD (DEMO): %s %s (%s)", nearest['date_str'], nearest['time_str'], nearest['time_of_day'])
                 else:
-                    logger.info("📺 LCD (DEMO): PillPal READY")
+                    logger.debug("📺 LCD (DEMO): PillPal READY")
             return
         
         if not self.lcd:
             return
         
+        started = time.monotonic()
+        result = 'ok'
         try:
-            self.lcd.clear()
-            
             # Priority 1: Show "DISPENSING" if currently dispensing
             if self.is_dispensing:
-                self.lcd.cursor_pos = (0, 0)
-                self.lcd.write_string("DISPENSING")
-                self.lcd.cursor_pos = (1, 0)
-                self.lcd.write_string("")
-                logger.info("📺 LCD: DISPENSING")
-                return
-            
+                line1, line2 = "DISPENSING", ""
             # Priority 2: Show "DISPENSED" if just dispensed (after servo2 moved)
-            if self.is_dispensed:
-                self.lcd.cursor_pos = (0, 0)
-                self.lcd.write_string("DISPENSED")
-                self.lcd.cursor_pos = (1, 0)
-                self.lcd.write_string("")
-                logger.info("📺 LCD: DISPENSED")
-                return
-            
-            # Priority 3: Always find and show the closest scheduled time
-            nearest = self._calculate_nearest_dispense()
+            elif self.is_dispensed:
+                line1, line2 = "DISPENSED", ""
+            else:
+                # Priority 3: Always find and show the closest scheduled time
+                nearest = self._calculate_nearest_dispense()
+                if nearest:
+                    # Line 1: "11/20 08:00 AM" (date and time)
+                    line1 = f"{nearest['date_str']} {nearest['time_str']}"
+                    # Line 2: "Morning" (time frame)
+                    line2 = nearest['time_of_day']
+                else:
+                    # No schedule - show "PillPal READY"
+                    line1, line2 = "PillPal READY", ""
             
-            if nearest:
-                # Line 1: "11/20 08:00 AM" (date and time)
-                line1 = f"{nearest['date_str']} {nearest['time_str']}"
-                # Line 2: "Morning" (time frame)
-                line2 = nearest['time_of_day']
-                
+            # One bus transaction per redraw so a servo move can't land between its writes
+            with i2c_bus.transaction('lcd'):
+                self.lcd.clear()
                 self.lcd.cursor_pos = (0, 0)
                 self.lcd.write_string(line1[:self.LCD_COLS])
                 self.lcd.cursor_pos = (1, 0)
                 self.lcd.write_string(line2[:self.LCD_COLS])
-                
-                logger.info(f"📺 LCD: {line1} - {line2}")
-            else:
-                # No schedule - show "PillPal READY"
-                self.lcd.cursor_pos = (0, 0)
-                self.lcd.write_string("PillPal READY")
-                self.lcd.cursor_pos = (1, 0)
-                self.lcd.write_string("")
-                logger.info("📺 LCD: PillPal READY")
+            logger.debug("📺 LCD: %s - %s", line1, line2)
         except Exception as e:
-            logger.error(f"❌ Error updating LCD: {e}")
+            result = 'error'
+            logger.error("❌ Error updating LCD: %s", e)
+        finally:
+            LCD_REFRESH_SECONDS.observe(time.monotonic() - started)
+            LCD_REFRESH_TOTAL.labels(result).inc()
     
     def update_periodic(self):
         """Update display periodically (call this every minute or so)"""
         self._update_display()
 
 
+class ScheduleStore:
+    """
+    Versioned copy of the web app's schedules
+    Clients send deltas (schedule_upsert/schedule_delete) against the version they last saw.
+    Every real change bumps the version and is passed to listeners as a delta; pushes that
+    change nothing are no-ops and leave the version alone.
+    """
+    
+    def __init__(self):
+        self.version = 0
+        self.schedules: Dict[str, dict] = {}  # schedule key -> schedule
+        self._listeners = []
+    
+    def add_listener(self, callback):
+        """Register callback(upserted: dict, removed: list, version) called on every change"""
+        self._listeners.append(callback)
+    
+    def check_version(self, base_version: Optional[int]) -> bool:
+        """True if a delta based on base_version can be applied (None = unconditional)"""
+        return base_version is None or base_version == self.version
+    
+    def upsert(self, schedules: list) -> int:
+        """Add or replace schedules, returns how many actually changed"""
+        changed = {}
+        for schedule in schedules:
+            key = schedule_key(schedule)
+            if self.schedules.get(key) != schedule:
+                changed[key] = schedule
+        self._commit(changed, [])
+        return len(changed)
+    
+    def delete(self, keys: list) -> int:
+        """Remove schedules by key, returns how many existed"""
+        removed = [key for key in dict.fromkeys(keys) if key in self.schedules]
+        self._commit({}, removed)
+        return len(removed)
+    
+    def replace(self, schedules: list) -> int:
+        """Replace the whole set (full update_schedules push), returns how many entries changed"""
+        new = {schedule_key(schedule): schedule for schedule in schedules}
+        changed = {key: schedule for key, schedule in new.items() if self.schedules.get(key) != schedule}
+        removed = [key for key in self.schedules if key not in new]
+        self._commit(changed, removed)
+        return len(changed) + len(removed)
+    
+    def snapshot(self) -> dict:
+        return {"version": self.version, "schedules": dict(self.schedules)}
+    
+    def _commit(self, changed: Dict[str, dict], removed: list):
+        if not changed and not removed:
+            return
+        for key in removed:
+            del self.schedules[key]
+        self.schedules.update(changed)
+        self.version += 1
+        logger.debug("📅 Schedule store v%s: %s changed, %s removed", self.version, len(changed), len(removed))
+        for callback in self._listeners:
+            try:
+                callback(changed, removed, self.version)
+            except Exception as e:
+                logger.error("❌ Error in schedule listener: %s", e)
+
+
+class DispenseEventStore:
+    """
+    Append-only on-device log of dispense outcomes (SQLite in WAL mode)
+    record() only queues the event; a writer thread inserts queued events in one transaction,
+    so handlers never wait on the SD card. Queries use a separate connection (WAL lets it
+    read while the writer writes) and page newest-first with a (ts, id) cursor.
+    """
+    
+    COLUMNS = ('id', 'ts', 'action', 'servo_id', 'status', 'medication', 'schedule_key',
+               'date', 'time', 'time_frame', 'servo1_angle', 'duration_ms', 'message')
+    MAX_PAGE = 500
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS dispense_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts REAL NOT NULL,
+            action TEXT NOT NULL,
+            servo_id TEXT NOT NULL,
+            status TEXT NOT NULL,
+            medication TEXT,
+            schedule_key TEXT,
+            date TEXT,
+            time TEXT,
+            time_frame TEXT,
+            servo1_angle REAL,
+            duration_ms INTEGER,
+            message TEXT
+        );
+        CREATE INDEX IF NOT EXISTS dispense_events_ts ON dispense_events (ts);
+        CREATE INDEX IF NOT EXISTS dispense_events_schedule ON dispense_events (schedule_key, ts);
+    """
+    
+    def __init__(self):
+        self.path = None
+        self._queue = queue.Queue()
+        self._reader = None
+        self._read_lock = threading.Lock()
+    
+    @property
+    def is_open(self) -> bool:
+        return self._reader is not None
+    
+    @staticmethod
+    def _connect(path: str):
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # WAL + NORMAL: durable across app crashes, fsync only at checkpoints
+        return conn
+    
+    def open(self, path: str):
+        """Create/open the database and start the writer thread"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        writer = self._connect(path)
+        writer.executescript(self.SCHEMA)
+        self._reader = self._connect(path)
+        self.path = path
+        threading.Thread(target=self._write_loop, args=(writer,), name="event-store", daemon=True).start()
+        logger.info("🗃️ Dispense history: %s", path)
+    
+    def record(self, action: str, servo_id: str, result: dict, started: float,
+               schedule: Optional[dict] = None, medication: Optional[str] = None,
+               servo1_angle: Optional[float] = None):
+        """Queue one dispense outcome (no-op until open() was called)"""
+        if not self.is_open:
+            return
+        schedule = schedule or {}
+        status = result.get('status', 'unknown')
+        self._queue.put((
+            time.time(), action, servo_id, status,
+            medication or schedule.get('medication'),
+            schedule_key(schedule) if schedule else None,
+            schedule.get('date'), schedule.get('time'), schedule.get('time_frame'),
+            servo1_angle,
+            int((time.monotonic() - started) * 1000),
+            result.get('message') if status != 'success' else None,
+        ))
+    
+    def _write_loop(self, conn):
+        insert = (f"INSERT INTO dispense_events ({', '.join(self.COLUMNS[1:])}) "
+                  f"VALUES ({', '.join('?' * (len(self.COLUMNS) - 1))})")
+        while True:
+            rows = [self._queue.get()]
+            while True:
+                try:
+                    rows.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with conn:
+                    conn.executemany(insert, rows)
+            except sqlite3.Error as e:
+                logger.error("❌ Could not store %s dispense event(s): %s", len(rows), e, extra=rate_limited(60))
+            for _ in rows:
+                self._queue.task_done()
+    
+    def query(self, limit: int = 50, before_ts: Optional[float] = None, before_id: Optional[int] = None,
+              since: Optional[float] = None, until: Optional[float] = None, schedule_key: Optional[str] = None,
+              servo_id: Optional[str] = None, status: Optional[str] = None, compact: bool = False) -> dict:
+        """One page of events, newest first (blocking - run it in a worker thread)"""
+        self._queue.join()  # Read-your-writes: include events recorded before this query
+        limit = max(1, min(limit, self.MAX_PAGE))
+        where, args = [], []
+        if before_ts is not None:
+            where.append("(ts, id) < (?, ?)")
+            args += [before_ts, before_id if before_id is not None else 2 ** 63 - 1]
+        for column, op, value in (('ts', '>=', since), ('ts', '<', until), ('schedule_key', '=', schedule_key),
+                                  ('servo_id', '=', servo_id), ('status', '=', status)):
+            if value is not None:
+                where.append(f"{column} {op} ?")
+                args.append(value)
+        sql = f"SELECT {', '.join(self.COLUMNS)} FROM dispense_events"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY ts DESC, id DESC LIMIT ?"
+        with self._read_lock:
+            rows = self._reader.execute(sql, args + [limit + 1]).fetchall()
+        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        page = {"next_cursor": {"before_ts": rows[-1][1], "before_id": rows[-1][0]} if has_more else None}
+        if compact:
+            page["events"] = {"fields": list(self.COLUMNS), "rows": [list(row) for row in rows]}
+        else:
+            page["events"] = [{k: v for k, v in zip(self.COLUMNS, row) if v is not None} for row in rows]
+        return page
+
+
+class ToneEngine:
+    """
+    Generates buzzer tones on one GPIO pin
+    Backends (best first):
+      - 'pigpio': hardware-timed DMA waveforms. Each pattern is precomputed into a wave chain,
+                  so a whole melody plays with no per-note Python wakeups
+      - 'pwm':    RPi.GPIO software PWM, one frequency change per note
+      - None:     no tone support - caller falls back to plain on/off
+    """
+    
+    DUTY_CYCLE = 50  # Square wave
+    TICK_US = 1000  # Resolution of the on/off (non-tone) segments in pigpio chains
+    
+    def __init__(self, pin: int):
+        self.pin = pin
+        self.backend = None
+        self._pi = None
+        self._pwm = None
+        self._tone_waves: Dict[int, int] = {}  # frequency -> pigpio wave id (one period)
+        self._high_wave = None  # 1 tick with the pin HIGH (plain beep)
+        self._low_wave = None  # 1 tick with the pin LOW (pause)
+        self._chains: Dict[str, tuple] = {}  # pattern name -> (chain bytes, duration)
+    
+    def setup(self) -> Optional[str]:
+        """Pick the best available backend; returns its name (or None)"""
+        if load_pigpio():
+            try:
+                pi = pigpio.pi()
+                if pi.connected:
+                    pi.set_mode(self.pin, pigpio.OUTPUT)
+                    pi.wave_clear()
+                    self._pi = pi
+                    self._high_wave = self._create_wave([pigpio.pulse(1 << self.pin, 0, self.TICK_US)])
+                    self._low_wave = self._create_wave([pigpio.pulse(0, 1 << self.pin, self.TICK_US)])
+                    self.backend = 'pigpio'
+                    return self.backend
+                logger.info("🎵 pigpiod not running - using software PWM for tones")
+            except Exception as e:
+                logger.warning("⚠️ pigpio setup failed, using software PWM: %s", e)
+        
+        if GPIO_AVAILABLE:
+            try:
+                self._pwm = GPIO.PWM(self.pin, 1000)
+                self.backend = 'pwm'
+            except Exception as e:
+                logger.warning("⚠️ GPIO.PWM unavailable, tones disabled: %s", e)
+        return self.backend
+    
+    def _create_wave(self, pulses: list) -> int:
+        self._pi.wave_add_generic(pulses)
+        return self._pi.wave_create()
+    
+    def _tone_wave(self, frequency: int) -> int:
+        """Get (or build once) a single-period square wave for a frequency"""
+        if frequency not in self._tone_waves:
+            half_period = max(1, int(500000 / frequency))
+            self._tone_waves[frequency] = self._create_wave([
+                pigpio.pulse(1 << self.pin, 0, half_period),
+                pigpio.pulse(0, 1 << self.pin, half_period),
+            ])
+        return self._tone_waves[frequency]
+    
+    @staticmethod
+    def _loop(wave_id: int, count: int) -> list:
+        """wave_chain entry playing a wave `count` times (pigpio loop syntax)"""
+        count = max(1, min(count, 65535))
+        return [255, 0, wave_id, 255, 1, count & 0xFF, count >> 8]
+    
+    def prepare(self, pattern) -> None:
+        """Precompute the pigpio wave chain for a pattern (no-op for other backends)"""
+        if self.backend != 'pigpio' or pattern.name in self._chains:
+            return
+        ticks_per_second = 1000000 // self.TICK_US
+        chain = []
+        duration = 0.0
+        for on_time, off_time, frequency in pattern.steps * pattern.repeat:
+            if frequency:
+                chain += self._loop(self._tone_wave(frequency), round(on_time * frequency))
+            else:
+                chain += self._loop(self._high_wave, round(on_time * ticks_per_second))
+            if off_time > 0:
+                chain += self._loop(self._low_wave, round(off_time * ticks_per_second))
+            duration += on_time + off_time
+        self._chains[pattern.name] = (chain, duration)
+    
+    def start_chain(self, pattern) -> float:
+        """Start a precomputed chain in hardware; returns how long it will play"""
+        self.prepare(pattern)
+        chain, duration = self._chains[pattern.name]
+        self._pi.wave_chain(chain)
+        return duration
+    
+    def tone(self, frequency: int):
+        """Software PWM: start/retune the tone"""
+        self._pwm.ChangeFrequency(frequency)
+        self._pwm.start(self.DUTY_CYCLE)
+    
+    def stop(self):
+        """Silence the buzzer (any backend)"""
+        if self.backend == 'pigpio':
+            self._pi.wave_tx_stop()
+            self._pi.write(self.pin, 0)
+        elif self.backend == 'pwm':
+            self._pwm.stop()
+
+
+class BuzzerPattern:
+    """
+    Declarative buzzer pattern
+    steps: list of (on_seconds, off_seconds) or (on_seconds, off_seconds, frequency_hz) tuples,
+           played in order. Steps without a frequency are plain on/off beeps.
+    repeat: how many times the whole step list is played
+    priority: a playing pattern can only be preempted by one of equal or higher priority
+    """
+    
+    def __init__(self, name: str, steps: list, repeat: int = 1, priority: int = 0):
+        self.name = name
+        # Normalize to (on, off, frequency)
+        self.steps = [tuple(step) + (None,) * (3 - len(step)) for step in steps]
+        self.repeat = repeat
+        self.priority = priority
+    
+    @property
+    def has_tones(self) -> bool:
+        return any(frequency for _, _, frequency in self.steps)
+    
+    def __repr__(self):
+        return f"BuzzerPattern({self.name!r}, repeat={self.repeat}, priority={self.priority})"
+
+
 class BuzzerController:
-    """Handles buzzer on GPIO17 for dispense notifications"""
+    """
+    Handles buzzer on GPIO17 for dispense notifications
+    A single worker thread owns the pin and plays one pattern at a time.
+    New patterns preempt the current one (by priority) instead of spawning more threads.
+    Tones come from ToneEngine (pigpio waveforms or software PWM) when available.
+    """
     
     BUZZER_PIN = 17  # GPIO17
+    USE_TONES = True  # Set to False for an active (self-oscillating) buzzer
     
-    def __init__(self, demo_mode=False):
+    # Built-in patterns - each alert type has its own melody
+    PATTERNS = {
+        # Rising C-E-G chime, 3 times (~6 seconds like the old 1s ON / 1s OFF x3)
+        'dispense': BuzzerPattern('dispense', [(0.2, 0.05, 523), (0.2, 0.05, 659), (0.5, 1.0, 784)],
+                                  repeat=3, priority=1),
+        # Falling A-F two-tone, for dispenses that land on the red-LED angles (150°, 180°)
+        'refill_low': BuzzerPattern('refill_low', [(0.4, 0.1, 880), (0.4, 0.8, 698)],
+                                    repeat=3, priority=2),
+        # Fast high triple chirp, for SMS that could not be delivered
+        'sms_failure': BuzzerPattern('sms_failure', [(0.08, 0.08, 1760)] * 3 + [(0.08, 0.6, 1760)],
+                                     repeat=2, priority=1),
+        'short_beep': BuzzerPattern('short_beep', [(0.2, 0.0)], priority=0),
+    }
+    
+    def __init__(self, demo_mode=False, defer_init=False):
         self.demo_mode = demo_mode
         self.setup_complete = False
+        self._cond = threading.Condition()
+        self._pending = None  # Next pattern to play
+        self._current = None  # Pattern being played right now
+        self._interrupt = False  # Set to stop the current pattern early
+        self._worker = None
+        self.tone_engine = ToneEngine(self.BUZZER_PIN)
         
-        if not demo_mode and GPIO_AVAILABLE:
+        if not defer_init:
+            self.initialize()
+    
+    def initialize(self):
+        """Set up the buzzer pin and start the pattern worker"""
+        if not self.demo_mode and load_gpio():
             self._setup_buzzer()
     
     def _setup_buzzer(self):
-        """Setup buzzer GPIO pin"""
+        """Setup buzzer GPIO pin and start the pattern worker"""
         try:
             # GPIO mode should already be set globally, but ensure it's set
             if GPIO_AVAILABLE:
@@ -1511,56 +1952,133 @@ class BuzzerController:
             
             GPIO.setup(self.BUZZER_PIN, GPIO.OUT)
             GPIO.output(self.BUZZER_PIN, GPIO.LOW)  # Start with buzzer off
+            
+            if self.USE_TONES and self.tone_engine.setup():
+                # Precompute waveforms up front so playing a melody costs nothing later
+                for pattern in self.PATTERNS.values():
+                    self.tone_engine.prepare(pattern)
+                logger.info("🎵 Buzzer tones enabled (%s)", self.tone_engine.backend)
+            
+            self._worker = threading.Thread(target=self._run, name="buzzer", daemon=True)
+            self._worker.start()
             self.setup_complete = True
-            logger.info(f"🔔 Buzzer initialized on GPIO{self.BUZZER_PIN}")
+            logger.info("🔔 Buzzer initialized on GPIO%s", self.BUZZER_PIN)
         except Exception as e:
-            logger.error(f"❌ Error setting up buzzer: {e}")
+            logger.error("❌ Error setting up buzzer: %s", e)
             import traceback
             traceback.print_exc()
             self.setup_complete = False
     
-    def play_dispense_notification(self):
-        """Alias for sound_dispense_notification for compatibility"""
-        self.sound_dispense_notification()
-    
-    def sound_dispense_notification(self):
+    def play(self, pattern: BuzzerPattern) -> bool:
         """
-        Sound buzzer for dispense notification
-        Pattern: 1 second ON, 1 second OFF, repeat 3 times (total 6 seconds)
-        Runs asynchronously so it doesn't block other operations
+        Queue a pattern to play (non-blocking)
+        Preempts the current pattern and replaces a queued one unless either has a higher priority.
+        Returns False if the pattern was rejected.
         """
         if self.demo_mode:
-            logger.info("🔔 Buzzer (DEMO): Sounding dispense notification (1s ON, 1s OFF x3)")
-            return
+            logger.info("🔔 Buzzer (DEMO): Playing %s", pattern)
+            return True
         
         if not self.setup_complete:
-            logger.warning("⚠️ Buzzer not set up, skipping notification")
-            return
+            logger.warning("⚠️ Buzzer not set up, skipping notification", extra=rate_limited(60))
+            return False
         
-        # Run in background thread so it doesn't block
-        def _sound_pattern():
+        with self._cond:
+            current = self._current
+            for other in (current, self._pending):
+                if other is not None and other.priority > pattern.priority:
+                    logger.info("🔔 Buzzer: %s ignored, %s has higher priority", pattern.name, other.name)
+                    return False
+            self._pending = pattern
+            self._interrupt = current is not None
+            self._cond.notify_all()
+        return True
+    
+    def cancel(self):
+        """Stop the current pattern and drop any pending one"""
+        with self._cond:
+            self._pending = None
+            self._interrupt = self._current is not None
+            self._cond.notify_all()
+    
+    def _run(self):
+        """Worker thread - plays patterns one at a time"""
+        while True:
+            with self._cond:
+                while self._pending is None:
+                    self._cond.wait()
+                pattern = self._pending
+                self._pending = None
+                self._interrupt = False
+                self._current = pattern
             try:
-                logger.info("🔔 Buzzer: Starting dispense notification (1s ON, 1s OFF x3)")
-                for i in range(3):
-                    # Turn buzzer ON
-                    GPIO.output(self.BUZZER_PIN, GPIO.HIGH)
-                    logger.info(f"🔔 Buzzer: ON (beep {i+1}/3)")
-                    time.sleep(1.0)  # 1 second ON
-                    
-                    # Turn buzzer OFF
-                    GPIO.output(self.BUZZER_PIN, GPIO.LOW)
-                    logger.info(f"🔔 Buzzer: OFF (pause {i+1}/3)")
-                    if i < 2:  # Don't wait after last beep
-                        time.sleep(1.0)  # 1 second OFF
-                
-                logger.info("🔔 Buzzer: Notification complete")
+                self._play_pattern(pattern)
             except Exception as e:
-                logger.error(f"❌ Error in buzzer pattern: {e}")
+                logger.error("❌ Error in buzzer pattern: %s", e)
+            finally:
+                if self.tone_engine.backend:
+                    self.tone_engine.stop()
+                GPIO.output(self.BUZZER_PIN, GPIO.LOW)
+                with self._cond:
+                    self._current = None
+    
+    def _wait(self, seconds: float) -> bool:
+        """Sleep for up to `seconds`; returns True if the pattern was interrupted"""
+        if seconds <= 0:
+            return self._interrupt
+        with self._cond:
+            return self._cond.wait_for(lambda: self._interrupt, timeout=seconds)
+    
+    def _play_pattern(self, pattern: BuzzerPattern):
+        """Play one pattern, stopping early if interrupted"""
+        logger.info("🔔 Buzzer: Starting %s", pattern.name)
+        
+        if self.tone_engine.backend == 'pigpio':
+            # Whole pattern runs from a precomputed DMA wave chain - just wait for it
+            duration = self.tone_engine.start_chain(pattern)
+            if self._wait(duration):
+                logger.info("🔔 Buzzer: %s preempted", pattern.name)
+            else:
+                logger.info("🔔 Buzzer: %s complete", pattern.name)
+            return
         
-        # Run in background thread
-        import threading
-        thread = threading.Thread(target=_sound_pattern, daemon=True)
-        thread.start()
+        use_pwm = self.tone_engine.backend == 'pwm'
+        last_step = len(pattern.steps) - 1
+        for i in range(pattern.repeat):
+            for j, (on_time, off_time, frequency) in enumerate(pattern.steps):
+                if use_pwm and frequency:
+                    self.tone_engine.tone(frequency)
+                else:
+                    GPIO.output(self.BUZZER_PIN, GPIO.HIGH)
+                if self._wait(on_time):
+                    logger.info("🔔 Buzzer: %s preempted", pattern.name)
+                    return
+                if use_pwm and frequency:
+                    self.tone_engine.stop()
+                else:
+                    GPIO.output(self.BUZZER_PIN, GPIO.LOW)
+                if i == pattern.repeat - 1 and j == last_step:
+                    break  # Don't wait after the last beep
+                if self._wait(off_time):
+                    logger.info("🔔 Buzzer: %s preempted", pattern.name)
+                    return
+        logger.info("🔔 Buzzer: %s complete", pattern.name)
+    
+    def play_dispense_notification(self):
+        """Alias for sound_dispense_notification for compatibility"""
+        self.sound_dispense_notification()
+    
+    def sound_dispense_notification(self, refill_low: bool = False):
+        """
+        Sound buzzer for dispense notification (~6 seconds)
+        refill_low: servo1 landed on a red-LED angle - play the refill melody instead
+        Runs on the buzzer worker thread so it doesn't block other operations
+        """
+        self.play(self.PATTERNS['refill_low' if refill_low else 'dispense'])
+    
+    def sound_sms_failure(self):
+        """Sound the SMS failure alert (safe to call from any thread)"""
+        self.play(self.PATTERNS['sms_failure'])
 
 
 class LEDController:
@@ -1569,14 +2087,25 @@ class LEDController:
     LED_GREEN_PIN = 22  # GPIO22 - GREEN LED - ON for positions 0°, 30°, 60°, 90°, 120° (lots of medicine remaining)
     LED_RED_PIN = 27    # GPIO27 - RED LED - ON for positions 150°, 180° (low medicine)
     MIN_HOLD_TIME = 4.0  # Minimum time (seconds) LED must stay on (3-5 seconds as requested)
+    GREEN_ANGLES = (0, 30, 60, 90, 120)  # Lots of medicine remaining
+    RED_ANGLES = (150, 180)  # Low medicine - time to refill
     
-    def __init__(self, demo_mode=False):
+    def __init__(self, demo_mode=False, defer_init=False):
         self.demo_mode = demo_mode
         self.setup_complete = False
         self._led_turned_on_time = None  # Track when LED was turned on
         self._current_led_state = None  # Track current LED state ('green', 'red', 'off')
+        self._requested_angle = None  # Latest servo1 angle (applied once hold time allows)
+        self._loop = None  # Event loop used to schedule hold-time rechecks
+        self._recheck_handle = None  # Pending hold-time recheck (asyncio.TimerHandle)
+        self._state_listeners = []  # Callbacks notified when the LED state changes
         
-        if not demo_mode and GPIO_AVAILABLE:
+        if not defer_init:
+            self.initialize()
+    
+    def initialize(self):
+        """Set up the LED GPIO pins"""
+        if not self.demo_mode and load_gpio():
             self._initialize_leds()
     
     def _initialize_leds(self):
@@ -1595,13 +2124,59 @@ class LEDController:
             GPIO.output(self.LED_GREEN_PIN, GPIO.LOW)
             GPIO.output(self.LED_RED_PIN, GPIO.LOW)
             self.setup_complete = True
-            logger.info(f"✅ LEDs initialized: GPIO22 (GREEN - lots of medicine), GPIO27 (RED - low medicine)")
+            logger.info("✅ LEDs initialized: GPIO22 (GREEN - lots of medicine), GPIO27 (RED - low medicine)")
         except Exception as e:
-            logger.error(f"❌ Error setting up LEDs: {e}")
+            logger.error("❌ Error setting up LEDs: %s", e)
             import traceback
             traceback.print_exc()
             self.setup_complete = False
     
+    def get_state(self) -> Optional[str]:
+        """Get current LED state ('green', 'red', 'off' or None before first update)"""
+        return self._current_led_state
+    
+    def attach_loop(self, loop):
+        """Set the event loop used for hold-time rechecks (call from main)"""
+        self._loop = loop
+    
+    def add_state_listener(self, callback):
+        """Register callback(state, angle) called whenever the LED state changes"""
+        self._state_listeners.append(callback)
+    
+    def on_servo_position(self, servo_id: str, angle: float):
+        """ServoController position listener - updates LEDs immediately when servo1 moves"""
+        if servo_id == 'servo1':
+            self.update_leds(angle)
+    
+    def _schedule_recheck(self, delay: float):
+        """
+        Re-run update_leds once the hold time has elapsed (replaces the old 1 Hz poll)
+        Safe to call from any thread - scheduling always happens on the event loop
+        """
+        if self._loop is None:
+            return
+        
+        def _schedule():
+            if self._recheck_handle is not None:
+                self._recheck_handle.cancel()
+            self._recheck_handle = self._loop.call_later(delay, self._recheck)
+        
+        self._loop.call_soon_threadsafe(_schedule)
+    
+    def _recheck(self):
+        """Apply the latest requested angle after a hold-time deferral"""
+        self._recheck_handle = None
+        if self._requested_angle is not None:
+            self.update_leds(self._requested_angle)
+    
+    def _notify_state_change(self, angle_int: int):
+        """Notify state listeners of the new LED state"""
+        for callback in self._state_listeners:
+            try:
+                callback(self._current_led_state, angle_int)
+            except Exception as e:
+                logger.error("❌ Error in LED state listener: %s", e)
+    
     def update_leds(self, servo1_angle: float, force_update: bool = False):
         """Update LEDs based on servo1 position
         
@@ -1615,20 +2190,21 @@ class LEDController:
         """
         if self.demo_mode:
             angle_int = int(round(servo1_angle))
-            if angle_int in [0, 30, 60, 90, 120]:
-                logger.info(f"💡 LED (DEMO): GREEN (GPIO22) ON, RED (GPIO27) OFF - Position: {angle_int}°")
-            elif angle_int in [150, 180]:
-                logger.info(f"💡 LED (DEMO): RED (GPIO27) ON, GREEN (GPIO22) OFF - Position: {angle_int}°")
+            if angle_int in self.GREEN_ANGLES:
+                logger.info("💡 LED (DEMO): GREEN (GPIO22) ON, RED (GPIO27) OFF - Position: %s°", angle_int)
+            elif angle_int in self.RED_ANGLES:
+                logger.info("💡 LED (DEMO): RED (GPIO27) ON, GREEN (GPIO22) OFF - Position: %s°", angle_int)
             else:
-                logger.info(f"💡 LED (DEMO): Both OFF - Position: {angle_int}°")
+                logger.info("💡 LED (DEMO): Both OFF - Position: %s°", angle_int)
             return
         
         if not self.setup_complete:
-            logger.warning("⚠️ LEDs not set up - cannot update")
+            logger.warning("⚠️ LEDs not set up - cannot update", extra=rate_limited(60))
             return
         
+        self._requested_angle = servo1_angle
+        
         try:
-            import time
             current_time = time.time()
             
             # Round to nearest integer for angle comparison
@@ -1640,9 +2216,9 @@ class LEDController:
             
             # Determine what the LED state should be for this angle
             desired_state = None
-            if angle_int in [0, 30, 60, 90, 120]:
+            if angle_int in self.GREEN_ANGLES:
                 desired_state = 'green'
-            elif angle_int in [150, 180]:
+            elif angle_int in self.RED_ANGLES:
                 desired_state = 'red'
             else:
                 desired_state = 'off'
@@ -1669,7 +2245,8 @@ class LEDController:
                             # Switching between green and red - allow immediate switch
                             needs_update = True
                         else:
-                            # Don't update yet - minimum hold time not met
+                            # Don't update yet - minimum hold time not met, recheck when it is
+                            self._schedule_recheck(self.MIN_HOLD_TIME - time_since_turned_on)
                             return
             
             # If angle changed but state is same (e.g., 0° -> 30°, both green), update timestamp but keep LED on
@@ -1693,6 +2270,7 @@ class LEDController:
             
             # Update LEDs
             self._last_angle = angle_int
+            previous_state = self._current_led_state
             
             # Green LED (GPIO22): ON for 0°, 30°, 60°, 90°, 120°
             if desired_state == 'green':
@@ -1701,7 +2279,7 @@ class LEDController:
                 GPIO.output(self.LED_GREEN_PIN, GPIO.HIGH)  # Green ON (stays on for at least 3-5 seconds)
                 self._current_led_state = 'green'
                 self._led_turned_on_time = current_time
-                logger.info(f"💚 GREEN LED (GPIO22) ON, RED LED (GPIO27) OFF - Position: {angle_int}° (will stay on for at least {self.MIN_HOLD_TIME}s)")
+                logger.info("💚 GREEN LED (GPIO22) ON, RED LED (GPIO27) OFF - Position: %s° (will stay on for at least %ss)", angle_int, self.MIN_HOLD_TIME)
             
             # Red LED (GPIO27): ON for 150°, 180°
             elif desired_state == 'red':
@@ -1710,7 +2288,7 @@ class LEDController:
                 GPIO.output(self.LED_RED_PIN, GPIO.HIGH)    # Red ON (stays on for at least 3-5 seconds)
                 self._current_led_state = 'red'
                 self._led_turned_on_time = current_time
-                logger.info(f"❤️ RED LED (GPIO27) ON, GREEN LED (GPIO22) OFF - Position: {angle_int}° (will stay on for at least {self.MIN_HOLD_TIME}s)")
+                logger.info("❤️ RED LED (GPIO27) ON, GREEN LED (GPIO22) OFF - Position: %s° (will stay on for at least %ss)", angle_int, self.MIN_HOLD_TIME)
             
             # Any other angle: Both OFF (but only if minimum hold time passed)
             else:
@@ -1721,7 +2299,7 @@ class LEDController:
                     GPIO.output(self.LED_RED_PIN, GPIO.LOW)      # Red OFF
                     self._current_led_state = 'off'
                     self._led_turned_on_time = None
-                    logger.info(f"⚪ Both LEDs OFF - Position: {angle_int}° (not a standard position)")
+                    logger.info("⚪ Both LEDs OFF - Position: %s° (not a standard position)", angle_int)
                 else:
                     time_since_turned_on = current_time - self._led_turned_on_time
                     if time_since_turned_on >= self.MIN_HOLD_TIME:
@@ -1730,67 +2308,515 @@ class LEDController:
                         GPIO.output(self.LED_RED_PIN, GPIO.LOW)      # Red OFF
                         self._current_led_state = 'off'
                         self._led_turned_on_time = None
-                        logger.info(f"⚪ Both LEDs OFF - Position: {angle_int}° (not a standard position)")
+                        logger.info("⚪ Both LEDs OFF - Position: %s° (not a standard position)", angle_int)
                     else:
-                        # Keep current LED on until minimum hold time passes
-                        logger.debug(f"⏳ Keeping LED on (hold time: {time_since_turned_on:.1f}s / {self.MIN_HOLD_TIME}s)")
+                        # Keep current LED on until minimum hold time passes, recheck when it does
+                        logger.debug("⏳ Keeping LED on (hold time: %.1fs / %ss)", time_since_turned_on, self.MIN_HOLD_TIME)
+                        self._schedule_recheck(self.MIN_HOLD_TIME - time_since_turned_on)
+                        return
             
+            if self._current_led_state != previous_state:
+                self._notify_state_change(angle_int)
+        
         except Exception as e:
-            logger.error(f"❌ Error updating LEDs: {e}")
+            logger.error("❌ Error updating LEDs: %s", e)
             import traceback
             traceback.print_exc()
 
 
-# Initialize GPIO mode ONCE before any GPIO operations
-if GPIO_AVAILABLE:
-    try:
-        GPIO.setmode(GPIO.BCM)
-        logger.info("✅ GPIO mode set to BCM (initialized once)")
-    except Exception as e:
-        logger.error(f"❌ Error setting GPIO mode: {e}")
+# Global controllers (initialized once, not reset on connection) - built by create_app()
+servo_controller: Optional[ServoController] = None
+sms_controller: Optional[SMSController] = None
+lcd_controller: Optional[LCDController] = None  # LCD display controller
+led_controller: Optional[LEDController] = None  # LED level indicators
+buzzer_controller: Optional[BuzzerController] = None  # Buzzer for dispense notifications
+_controllers: Dict[str, Any] = {}  # Subsystem name -> controller
+schedule_store = ScheduleStore()  # Versioned schedules synced from the web app
+event_store = DispenseEventStore()  # On-device dispense history (opened in main)
+
+class WireCodec:
+    """Message encoding for one websocket subprotocol"""
+    
+    def __init__(self, subprotocol: str, object_name: str, dumps, loads, alt_dumps=None):
+        self.subprotocol = subprotocol
+        self.object_name = object_name  # What a message must decode to, for errors ("JSON object", "MessagePack map")
+        self.dumps = dumps  # dict -> str/bytes frame
+        self.loads = loads  # str/bytes frame -> object
+        self.alt_dumps = alt_dumps  # Other serialization clients commonly use (e.g. compact JSON)
+        # Request frame -> pre-serialized reply, answered by handle_client without parsing
+        self.fast_replies: Dict[Any, Any] = {}
+    
+    def add_fast_reply(self, request: dict, reply: dict):
+        """Answer this exact request frame with a fixed reply (no request_id, no parsing, no logging)"""
+        reply_frame = self.dumps(reply)
+        self.fast_replies[self.dumps(request)] = reply_frame
+        if self.alt_dumps is not None:
+            self.fast_replies[self.alt_dumps(request)] = reply_frame
+    
+    def __repr__(self):
+        return f"WireCodec({self.subprotocol!r})"
+
+
+JSON_CODEC = WireCodec('pillpal.json', 'JSON object', json.dumps, json.loads,
+                       alt_dumps=lambda obj: json.dumps(obj, separators=(',', ':')))  # JSON.stringify form
+
+# Compact binary encodings, offered only when the library is installed (preferred first).
+# The web app deliberately stays on JSON (it offers no subprotocol, so no decoder ships to the
+# browser); these are for other clients such as scripts and the relay. Compact records
+# (expand_records) work with every codec, JSON included.
+CODECS: Dict[str, WireCodec] = {}
+if MSGPACK_AVAILABLE:
+    CODECS['pillpal.msgpack'] = WireCodec(
+        'pillpal.msgpack', 'MessagePack map',
+        lambda obj: msgpack.packb(obj, use_bin_type=True),
+        lambda frame: msgpack.unpackb(frame, raw=False),
+    )
+if CBOR_AVAILABLE:
+    CODECS['pillpal.cbor'] = WireCodec('pillpal.cbor', 'CBOR map', cbor2.dumps, cbor2.loads)
+CODECS[JSON_CODEC.subprotocol] = JSON_CODEC
+
+# Subprotocols offered to clients, in order of preference (clients offering none get JSON)
+SUBPROTOCOLS = list(CODECS)
+
+
+def add_fast_reply(request: dict, reply: dict):
+    """Register a pre-serialized reply to a bare request frame for every codec"""
+    for codec in CODECS.values():
+        codec.add_fast_reply(request, reply)
+
+
+add_fast_reply({"type": "ping"}, {"type": "pong"})
+
+
+def select_subprotocol(*args):
+    """
+    Pick our preferred subprotocol among those the client offered; None (plain JSON) if none match
+    Without this, newer websockets releases reject clients that offer no subprotocol at all.
+    Called as (client_subprotocols, server_subprotocols) by the legacy server and as
+    (connection, client_subprotocols) by the newer one.
+    """
+    offered = args[0] if isinstance(args[0], (list, tuple)) else args[1]
+    for subprotocol in SUBPROTOCOLS:
+        if subprotocol in offered:
+            return subprotocol
+    return None
+
+
+def get_codec(websocket) -> WireCodec:
+    """Codec negotiated for a connection (JSON if the client asked for no subprotocol)"""
+    return CODECS.get(getattr(websocket, 'subprotocol', None), JSON_CODEC)
+
+
+def expand_records(value):
+    """
+    Expand field-keyed compact records {"fields": [...], "rows": [[...], ...]} into a list of dicts
+    Null cells mean "field absent", so consumers' .get() defaults still apply.
+    Plain lists of dicts are passed through unchanged
+    """
+    if isinstance(value, dict) and 'fields' in value and 'rows' in value:
+        fields = value['fields']
+        return [{field: cell for field, cell in zip(fields, row) if cell is not None}
+                for row in value['rows']]
+    return value
+
+
+# Protocol features advertised to clients in the server_info frame sent on connect
+SERVER_FEATURES = ['request_id', 'compact_records', 'schedule_sync', 'history', 'local_scheduler', 'sessions', 'modem_diagnostics', 'i2c_status']
+
+
+class BroadcastHub:
+    """
+    Fans out server-initiated events (button, dispense, LED, SIMCOM) to all connected clients
+    Each client gets a bounded outgoing queue drained by its own writer task, so one slow or
+    half-dead client never delays the event for everyone else. Events are serialized once per
+    negotiated codec, not once per client.
+    """
+    
+    QUEUE_SIZE = 32  # Max pending events per client before it is considered too slow
+    SLOW_CLIENT_CLOSE_CODE = 1013  # "Try again later"
+    
+    def __init__(self):
+        self.clients: Dict[Any, asyncio.Queue] = {}  # websocket -> outgoing queue
+        self._writers: Dict[Any, asyncio.Task] = {}  # websocket -> writer task
+        self._codecs: Dict[Any, WireCodec] = {}  # websocket -> negotiated codec
+        self._sessions: Dict[Any, Any] = {}  # websocket -> Session (clients that opted into sequencing)
+        self._sinks = []  # Callbacks that see every event, connected clients or not
+        self._loop = None  # Loop the clients live on (set on first register)
+    
+    def register(self, websocket, codec: WireCodec = JSON_CODEC):
+        """Start a writer task for a newly connected client"""
+        self._loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        self.clients[websocket] = queue
+        self._codecs[websocket] = codec
+        self._writers[websocket] = asyncio.create_task(self._writer(websocket, queue))
+    
+    def unregister(self, websocket):
+        """Stop the writer task and forget the client"""
+        self.clients.pop(websocket, None)
+        self._codecs.pop(websocket, None)
+        self._sessions.pop(websocket, None)
+        writer = self._writers.pop(websocket, None)
+        if writer and writer is not asyncio.current_task():
+            writer.cancel()
+    
+    async def _writer(self, websocket, queue: asyncio.Queue):
+        """Drain one client's queue in order"""
+        while True:
+            frame = await queue.get()
+            try:
+                await websocket.send(frame)
+            except Exception as e:
+                logger.info("🧹 Dropping client after send failure: %s", e)
+                self.unregister(websocket)
+                return
+    
+    def bind_session(self, websocket, session):
+        """Sequence this client's events through its session (None = plain client again)"""
+        if session is None:
+            self._sessions.pop(websocket, None)
+        elif websocket in self.clients:
+            self._sessions[websocket] = session
+    
+    def add_event_sink(self, callback):
+        """Register callback(event), called for every broadcast event"""
+        self._sinks.append(callback)
+    
+    def send(self, websocket, frame):
+        """Queue a frame for one client behind its pending events"""
+        queue = self.clients.get(websocket)
+        if queue is None:
+            return
+        try:
+            queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self._drop_slow_client(websocket)
+    
+    def _drop_slow_client(self, websocket):
+        """Disconnect a client whose queue is full (it stopped reading)"""
+        logger.warning("🐢 Client too slow (event queue full) - disconnecting", extra=rate_limited(10))
+        self.unregister(websocket)
+        asyncio.ensure_future(websocket.close(code=self.SLOW_CLIENT_CLOSE_CODE, reason="Client too slow"))
+    
+    def broadcast(self, event: dict) -> int:
+        """
+        Queue an event for every connected client (never blocks)
+        Must be called on the event loop; from other threads use loop.call_soon_threadsafe
+        Returns the number of clients the event was queued for
+        """
+        for sink in self._sinks:
+            sink(event)
+        if not self.clients:
+            return 0
+        
+        frames = {}  # codec -> frame, so each encoding is serialized once
+        delivered = 0
+        slow_clients = []
+        for websocket, queue in self.clients.items():
+            codec = self._codecs[websocket]
+            session = self._sessions.get(websocket)
+            if session is not None:
+                if session.websocket is not websocket:
+                    continue  # Catching up on its replay - the session buffered the event
+                frame = codec.dumps(session.stamp(event))  # Sequenced per session
+            else:
+                frame = frames.get(codec)
+                if frame is None:
+                    frame = frames[codec] = codec.dumps(event)
+            try:
+                queue.put_nowait(frame)
+                delivered += 1
+            except asyncio.QueueFull:
+                slow_clients.append(websocket)
+        
+        for websocket in slow_clients:
+            self._drop_slow_client(websocket)
+        
+        return delivered
+    
+    def broadcast_threadsafe(self, event: dict):
+        """Broadcast from a non-loop thread (GPIO callbacks, SMS thread, executor)"""
+        if self._loop is None:
+            return  # No client has ever connected - nobody to tell
+        self._loop.call_soon_threadsafe(self.broadcast, event)
+
+
+# Global broadcast hub - tracks connected clients and fans out events to them
+broadcast_hub = BroadcastHub()
+metrics.gauge('connections', 'Connected WebSocket clients', function=lambda: len(broadcast_hub.clients))
+
+
+class Session:
+    """One client's resumable stream: everything it is sent gets a seq and is kept for replay"""
+    
+    def __init__(self, session_id: str, replay_size: int):
+        self.id = session_id
+        self.seq = 0
+        self.buffer = deque(maxlen=replay_size)  # Sequenced messages, oldest first
+        self.websocket = None  # Attached connection; None while detached or catching up
+        self.codec = JSON_CODEC
+        self.detached_at = time.monotonic()
+    
+    def stamp(self, message: dict) -> dict:
+        self.seq += 1
+        message = {**message, "seq": self.seq}
+        self.buffer.append(message)
+        return message
+    
+    def missed(self, last_seq: int) -> list:
+        return [message for message in self.buffer if message['seq'] > last_seq]
+
+
+class SessionManager:
+    """
+    Resumable client sessions across tunnel drops
+    A client opts in with session_resume after server_info. From then on every reply and event
+    it is sent carries a per-session seq and goes into a bounded replay buffer - also while its
+    connection is down, so a dispense that finishes mid-outage is buffered instead of lost.
+    Resuming with the session_id and the last seq seen replays everything newer, then the new
+    connection takes over (a still-open old one is closed). Detached sessions expire after
+    SESSION_TTL. Fast replies (bare ping, get_pi_id) and server_info are not sequenced.
+    """
+    
+    REPLAY_SIZE = 100  # Messages kept per session
+    SESSION_TTL = 15 * 60  # Seconds a detached session can be resumed
+    MAX_SESSIONS = 32
+    
+    def __init__(self, hub: BroadcastHub):
+        self.hub = hub
+        self.sessions: Dict[str, Session] = {}
+        self._by_socket: Dict[Any, Session] = {}
+        hub.add_event_sink(self._buffer_detached)
+    
+    def _buffer_detached(self, event: dict):
+        """Hub sink: events for sessions without a live connection go straight to their buffer"""
+        for session in self.sessions.values():
+            # Also sessions whose connection the hub already dropped (slow client) but not yet released
+            if session.websocket is None or session.websocket not in self.hub.clients:
+                session.stamp(event)
+    
+    def _expire(self):
+        now = time.monotonic()
+        bound = set(map(id, self._by_socket.values()))
+        detached = sorted((s for s in self.sessions.values() if s.websocket is None and id(s) not in bound),
+                          key=lambda s: s.detached_at)
+        excess = len(self.sessions) - self.MAX_SESSIONS
+        for i, session in enumerate(detached):
+            if i < excess or now - session.detached_at > self.SESSION_TTL:
+                del self.sessions[session.id]
+    
+    async def resume(self, websocket, codec: WireCodec, session_id: Optional[str], last_seq: int,
+                     request_id=None) -> Session:
+        """Bind a connection to a new or existing session and replay what it missed"""
+        self._expire()
+        session = self.sessions.get(session_id) if session_id else None
+        resumed = session is not None
+        if session is None:
+            session = Session(secrets.token_urlsafe(16), self.REPLAY_SIZE)
+            self.sessions[session.id] = session
+            last_seq = 0
+        elif session.websocket is not None and session.websocket is not websocket:
+            # Client reconnected before the server noticed the old connection was dead
+            old = session.websocket
+            self._by_socket.pop(old, None)
+            self.hub.bind_session(old, None)
+            asyncio.ensure_future(old.close(code=1000, reason="Session resumed on another connection"))
+        
+        # Catching up: new events are buffered (not queued) until the replay below is done
+        session.websocket = None
+        self._by_socket[websocket] = session
+        self.hub.bind_session(websocket, session)
+        gap = resumed and bool(session.buffer) and session.buffer[0]['seq'] > last_seq + 1
+        SESSIONS_TOTAL.labels('gap' if gap else 'resumed' if resumed else 'new').inc()
+        
+        # current_seq, not seq: clients drop seq-stamped frames they have already seen, and a new
+        # session's numbering restarts below their last seq
+        reply = {"type": "session", "status": "success", "session_id": session.id, "resumed": resumed,
+                 "gap": gap, "current_seq": session.seq}
+        if request_id is not None:
+            reply["request_id"] = request_id
+        await websocket.send(codec.dumps(reply))
+        
+        replayed = 0
+        sent = last_seq
+        while True:
+            missed = session.missed(sent)
+            if not missed:
+                break
+            for message in missed:
+                await websocket.send(codec.dumps(message))
+                sent = message['seq']
+                replayed += 1
+        # No await since the last check: from here on the hub stamps and queues directly
+        session.websocket = websocket
+        session.codec = codec
+        if resumed:
+            logger.info("🔁 Session %s… resumed: replayed %s message(s)%s", session.id[:6], replayed,
+                        " (gap - some were dropped)" if gap else "")
+        return session
+    
+    def session_for(self, websocket) -> Optional[Session]:
+        return self._by_socket.get(websocket)
+    
+    def release(self, websocket):
+        """Connection closed: its session (if any) keeps buffering until resumed or expired"""
+        session = self._by_socket.pop(websocket, None)
+        if session is not None and session.websocket is websocket:
+            session.websocket = None
+            session.detached_at = time.monotonic()
+
+
+session_manager = SessionManager(broadcast_hub)
+metrics.gauge('sessions', 'Resumable client sessions (attached and detached)',
+              function=lambda: len(session_manager.sessions))
+
+
+async def send_reply(websocket, codec: WireCodec, message: dict, session: Optional[Session] = None):
+    """Send a reply - through the client's session (sequenced, replayable) if it has one"""
+    if session is None:
+        await websocket.send(codec.dumps(message))
+        return
+    message = session.stamp(message)
+    if session.websocket is not None:
+        # Through the hub queue, so replies and events arrive in seq order
+        broadcast_hub.send(session.websocket, session.codec.dumps(message))
+
+
+class HardwareReadiness:
+    """
+    Tracks background initialization of the hardware subsystems
+    The server listens before any device is up. Requests that need a device wait for it
+    (queued, not failed) and clients get a `readiness` event as each subsystem finishes.
+    """
+    
+    WAIT_TIMEOUT = 30.0  # Longest a request waits for its device before running anyway
+    
+    def __init__(self, hub: BroadcastHub):
+        self.hub = hub
+        self.states: Dict[str, str] = {}  # name -> 'initializing' / 'ready' / 'demo' / 'failed'
+        self._events: Dict[str, asyncio.Event] = {}
+    
+    def start(self, controllers: Dict[str, Any]) -> asyncio.Future:
+        """Initialize controllers concurrently in worker threads (call from the event loop)"""
+        for name in controllers:
+            self.states[name] = 'initializing'
+            self._events[name] = asyncio.Event()
+        return asyncio.gather(*(self._initialize(name, controller) for name, controller in controllers.items()))
+    
+    async def _initialize(self, name: str, controller):
+        started = time.monotonic()
+        try:
+            await asyncio.to_thread(controller.initialize)
+            state = 'demo' if controller.demo_mode else 'ready'
+        except Exception as e:
+            logger.error("❌ %s initialization failed: %s", name, e)
+            state = 'failed'
+        elapsed = time.monotonic() - started
+        
+        self.states[name] = state
+        self._events[name].set()
+        logger.info("🟢 %s %s after %.1fs", name, state, elapsed)
+        self.hub.broadcast({
+            "type": "readiness",
+            "subsystem": name,
+            "state": state,
+            "init_seconds": round(elapsed, 2),
+            "subsystems": self.snapshot()
+        })
+    
+    def snapshot(self) -> dict:
+        return dict(self.states)
+    
+    async def wait(self, names):
+        """Wait until the named subsystems finished initializing (unknown names don't wait)"""
+        pending = [self._events[name] for name in names if name in self._events and not self._events[name].is_set()]
+        if not pending:
+            return
+        logger.debug("⏳ Request waiting for %s", ', '.join(n for n in names if self.states.get(n) == 'initializing'))
+        try:
+            await asyncio.wait_for(asyncio.gather(*(event.wait() for event in pending)), self.WAIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("⚠️ Still waiting for %s after %ss - running request anyway",
+                           ', '.join(n for n in names if self.states.get(n) == 'initializing'), self.WAIT_TIMEOUT)
 
-# Global controllers (initialized once, not reset on connection)
-servo_controller = ServoController(demo_mode=False)  # Set to True for testing
-sms_controller = SMSController(demo_mode=False, serial_port='/dev/ttyS0', baudrate=115200)  # Set demo_mode=True for testing without SIMCOM
-lcd_controller = LCDController(demo_mode=False)  # LCD display controller
-led_controller = LEDController(demo_mode=False)  # LED level indicators
-buzzer_controller = BuzzerController(demo_mode=False)  # Buzzer for dispense notifications
 
-# Global WebSocket connections for button press notifications
-active_websockets = set()
+hardware_readiness = HardwareReadiness(broadcast_hub)
 
 
 class ButtonMonitor:
-    """Monitors GPIO26 button for press events"""
+    """Monitors GPIO26 button for press events (edge-triggered, no polling)"""
     
     BUTTON_PIN = 26  # GPIO26
     DEBOUNCE_TIME = 0.05  # 50ms debounce
+    BOUNCE_TIME_MS = 50  # Hardware debounce passed to GPIO.add_event_detect
+    POLL_INTERVAL = 0.01  # Only used if edge detection is unavailable
     
     def __init__(self):
         self.last_press_time = 0
         self.setup_complete = False
+        self.edge_detect_active = False
+        self._loop = None
         
         if GPIO_AVAILABLE:
             try:
                 GPIO.setmode(GPIO.BCM)
                 GPIO.setup(self.BUTTON_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
                 self.setup_complete = True
-                logger.info(f"✅ GPIO26 button initialized (pin {self.BUTTON_PIN})")
+                logger.info("✅ GPIO26 button initialized (pin %s)", self.BUTTON_PIN)
             except Exception as e:
-                logger.error(f"❌ Error setting up GPIO26: {e}")
+                logger.error("❌ Error setting up GPIO26: %s", e)
                 self.setup_complete = False
         else:
             logger.warning("⚠️ GPIO not available - button monitoring disabled")
     
-    async def monitor_button(self):
-        """Monitor button in background and send events to connected clients"""
-        global active_websockets  # Declare global variable
+    def _on_edge(self, channel):
+        """
+        Falling-edge callback - runs in the RPi.GPIO event thread, NOT the event loop.
+        Only hands the press over to the loop; all websocket work happens there.
+        """
+        self._loop.call_soon_threadsafe(self._handle_press, time.time())
+    
+    def _handle_press(self, current_time: float):
+        """Handle a debounced button press on the event loop"""
+        # Software debounce on top of the hardware bouncetime
+        if current_time - self.last_press_time <= self.DEBOUNCE_TIME:
+            return
+        self.last_press_time = current_time
+        logger.info("🔘 GPIO26 button PRESSED!", extra=rate_limited(1))
         
+        # Send button press event to all connected clients
+        delivered = broadcast_hub.broadcast({
+            "type": "button_press",
+            "pressed": True,
+            "timestamp": current_time
+        })
+        logger.debug("📤 Button press queued for %s client(s)", delivered)
+    
+    async def monitor_button(self):
+        """
+        Monitor button and send events to connected clients
+        Uses GPIO edge detection (interrupt-driven) so the event loop is idle between presses.
+        Falls back to polling only if edge detection cannot be registered.
+        """
         if not self.setup_complete:
             logger.warning("⚠️ Button monitoring not started - GPIO not available")
             return
         
-        logger.info("🔘 Starting GPIO26 button monitoring...")
+        self._loop = asyncio.get_running_loop()
+        
+        try:
+            GPIO.add_event_detect(self.BUTTON_PIN, GPIO.FALLING,
+                                  callback=self._on_edge, bouncetime=self.BOUNCE_TIME_MS)
+            self.edge_detect_active = True
+            logger.info("🔘 GPIO26 button monitoring started (edge-triggered, %sms debounce)", self.BOUNCE_TIME_MS)
+        except Exception as e:
+            # Some kernels/RPi.GPIO versions refuse edge detection ("Failed to add edge detection")
+            logger.warning("⚠️ Edge detection unavailable (%s) - falling back to polling", e)
+            await self._poll_button()
+    
+    async def _poll_button(self):
+        """Fallback: poll the button pin (only used when edge detection fails)"""
+        logger.info("🔘 Starting GPIO26 button monitoring (polling)...")
         last_state = GPIO.HIGH
         
         while True:
@@ -1799,85 +2825,183 @@ class ButtonMonitor:
                 
                 # Button pressed (LOW when pressed with PUD_UP)
                 if current_state == GPIO.LOW and last_state == GPIO.HIGH:
-                    current_time = time.time()
-                    # Debounce check
-                    if current_time - self.last_press_time > self.DEBOUNCE_TIME:
-                        self.last_press_time = current_time
-                        logger.info("🔘 GPIO26 button PRESSED!")
-                        
-                        # Send button press event to all connected clients
-                        button_message = json.dumps({
-                            "type": "button_press",
-                            "pressed": True,
-                            "timestamp": current_time
-                        })
-                        
-                        # Send to all active WebSocket connections
-                        disconnected = set()
-                        # Make a copy of active_websockets to avoid modification during iteration
-                        websockets_to_notify = list(active_websockets)
-                        logger.info(f"📤 Sending button press to {len(websockets_to_notify)} client(s)")
-                        
-                        for ws in websockets_to_notify:
-                            try:
-                                await ws.send(button_message)
-                                logger.info("📤 Button press sent to client")
-                            except Exception as e:
-                                logger.error(f"❌ Error sending button press: {e}")
-                                disconnected.add(ws)
-                        
-                        # Remove disconnected clients
-                        active_websockets -= disconnected
-                        if disconnected:
-                            logger.info(f"🧹 Removed {len(disconnected)} disconnected client(s)")
+                    self._handle_press(time.time())
                 
                 last_state = current_state
-                await asyncio.sleep(0.01)  # Check every 10ms
-                
+                await asyncio.sleep(self.POLL_INTERVAL)
+            
             except Exception as e:
-                logger.error(f"❌ Error in button monitoring: {e}")
+                logger.error("❌ Error in button monitoring: %s", e, extra=rate_limited(10))
                 await asyncio.sleep(0.1)
+    
+    def stop(self):
+        """Remove edge detection (called on shutdown)"""
+        if self.edge_detect_active:
+            try:
+                GPIO.remove_event_detect(self.BUTTON_PIN)
+            except Exception as e:
+                logger.debug("Could not remove edge detection: %s", e)
+            self.edge_detect_active = False
 
 
 # Global button monitor
-button_monitor = ButtonMonitor()
+button_monitor: Optional[ButtonMonitor] = None  # Built by create_app()
 
 
-async def handle_dispense(servo_id: str, medication: str, target_angle: float = None) -> dict:
+class ClientLiveness:
+    """Liveness state and round-trip times for one connection"""
+    
+    RTT_SAMPLES = 20  # Recent ping round-trips kept per client
+    
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.address = websocket.remote_address
+        self.connected_at = time.time()
+        self.last_seen = time.monotonic()  # Last inbound frame or pong
+        self.rtts = deque(maxlen=self.RTT_SAMPLES)  # Seconds
+        self.pings_sent = 0
+        self.pongs_received = 0
+        self.missed_pongs = 0  # Consecutive pings that timed out
+    
+    def stats(self) -> dict:
+        rtt_ms = None
+        if self.rtts:
+            samples = [rtt * 1000 for rtt in self.rtts]
+            rtt_ms = {
+                "last": round(samples[-1], 1),
+                "min": round(min(samples), 1),
+                "avg": round(sum(samples) / len(samples), 1),
+                "max": round(max(samples), 1),
+            }
+        return {
+            "client": ":".join(str(part) for part in self.address[:2]) if self.address else "unknown",
+            "connected_seconds": round(time.time() - self.connected_at),
+            "idle_seconds": round(time.monotonic() - self.last_seen, 1),
+            "pings_sent": self.pings_sent,
+            "pongs_received": self.pongs_received,
+            "missed_pongs": self.missed_pongs,
+            "rtt_ms": rtt_ms,
+        }
+
+
+class LivenessMonitor:
+    """
+    Server-driven protocol ping/pong for every connected client
+    Measures the round-trip time of each ping and evicts clients that stop answering
+    (half-open connections through the tunnel) so broadcasts stop queueing for them.
+    Clients that are quiet but still answer pings are kept - they are waiting for events.
+    """
+    
+    MAX_MISSED_PONGS = 2  # Evict after this many consecutive unanswered pings
+    EVICT_CLOSE_CODE = 1011  # Same code websockets uses for its own keepalive timeout
+    
+    def __init__(self, hub: BroadcastHub):
+        self.hub = hub
+        self.clients: Dict[Any, ClientLiveness] = {}
+    
+    def add(self, websocket) -> ClientLiveness:
+        client = self.clients[websocket] = ClientLiveness(websocket)
+        return client
+    
+    def remove(self, websocket):
+        self.clients.pop(websocket, None)
+    
+    def stats(self) -> list:
+        return [client.stats() for client in self.clients.values()]
+    
+    async def run(self, interval: float, timeout: float):
+        """Ping every client each interval (all clients in parallel)"""
+        while True:
+            await asyncio.sleep(interval)
+            clients = list(self.clients.values())
+            if clients:
+                await asyncio.gather(*(self._ping(client, timeout) for client in clients))
+    
+    async def _ping(self, client: ClientLiveness, timeout: float):
+        client.pings_sent += 1
+        started = time.monotonic()
+        try:
+            pong_waiter = await client.websocket.ping()
+            await asyncio.wait_for(pong_waiter, timeout)
+        except asyncio.TimeoutError:
+            client.missed_pongs += 1
+            logger.debug("💤 No pong from %s (%s missed)", client.address, client.missed_pongs)
+            if client.missed_pongs >= self.MAX_MISSED_PONGS:
+                self._evict(client)
+            return
+        except Exception:
+            return  # Connection already closing - handle_client cleans up
+        
+        now = time.monotonic()
+        client.rtts.append(now - started)
+        client.last_seen = now
+        client.pongs_received += 1
+        client.missed_pongs = 0
+    
+    def _evict(self, client: ClientLiveness):
+        logger.warning("💀 Evicting unresponsive client %s (%s pings unanswered)",
+                       client.address, client.missed_pongs, extra=rate_limited(10))
+        self.remove(client.websocket)
+        self.hub.unregister(client.websocket)
+        asyncio.ensure_future(client.websocket.close(code=self.EVICT_CLOSE_CODE, reason="Ping timeout"))
+
+
+liveness_monitor = LivenessMonitor(broadcast_hub)
+
+
+async def handle_dispense(servo_id: str, medication: str, target_angle: float = None,
+                          schedule: Optional[dict] = None) -> dict:
     """
     Handle dispense command
     Moves servo1 to target_angle if provided (progressive dispense), otherwise 30 degrees from current position
     After main servo completes, shows confirmation dialog for servo2 medicine dispense
     Servo2 stays at 0° until user confirms
+    The outcome is recorded in the dispense history (schedule = the schedule it belongs to, if any)
     """
+    started = time.monotonic()
     try:
-        logger.info(f"Dispensing {medication} via {servo_id}")
+        logger.info("Dispensing %s via %s", medication, servo_id)
         if target_angle is not None:
-            logger.info(f"🎯 Progressive dispense: target_angle={target_angle}°")
+            logger.debug("🎯 Progressive dispense: target_angle=%s°", target_angle)
+        
+        broadcast_hub.broadcast({
+            "type": "dispense_status",
+            "stage": "started",
+            "servo_id": servo_id,
+            "medication": medication
+        })
         
         # Move main servo (servo1) to target_angle or 30 degrees from current position
-        success = servo_controller.dispense(servo_id, target_angle=target_angle)
+        # Servo moves sleep while the servo travels - run them off the event loop
+        success = await asyncio.to_thread(servo_controller.dispense, servo_id, target_angle=target_angle)
         
         if success:
-            # Update LEDs after dispense (led_controller is global)
+            # LEDs were already updated by the servo position listener (see main)
             current_servo1_angle = servo_controller.get_position('servo1')
-            if current_servo1_angle is not None:
-                led_controller.update_leds(current_servo1_angle)
             
-            # Sound buzzer notification (non-blocking, runs in background thread)
-            buzzer_controller.sound_dispense_notification()
+            # Sound buzzer notification (non-blocking, runs on the buzzer worker thread)
+            refill_low = current_servo1_angle is not None and int(round(current_servo1_angle)) in LEDController.RED_ANGLES
+            buzzer_controller.sound_dispense_notification(refill_low=refill_low)
             
             # Check if servo1 is at 180° (needs confirmation before resetting)
             is_at_180 = current_servo1_angle and int(current_servo1_angle) >= 180
             
             if is_at_180:
-                logger.info("🔄 Servo1 is at 180° - waiting for confirmation before resetting")
-                logger.info("💊 User must confirm to reset servo1 to 0° and move servo2 to 100°")
+                logger.debug("🔄 Servo1 is at 180° - waiting for confirmation before resetting")
+                logger.debug("💊 User must confirm to reset servo1 to 0° and move servo2 to 100°")
             else:
-                logger.info("🎯 Main dispense complete, showing medicine dispense confirmation dialog")
-                logger.info("💊 Servo2 will stay at 3° until user confirms")
+                logger.debug("🎯 Main dispense complete, showing medicine dispense confirmation dialog")
+                logger.debug("💊 Servo2 will stay at 3° until user confirms")
             
-            return {
+            broadcast_hub.broadcast({
+                "type": "dispense_status",
+                "stage": "completed",
+                "servo_id": servo_id,
+                "medication": medication,
+                "servo1_angle": float(current_servo1_angle) if current_servo1_angle is not None else 0.0
+            })
+            
+            result = {
                 "status": "success",
                 "servo_id": servo_id,
                 "medication": medication,
@@ -1888,108 +3012,137 @@ async def handle_dispense(servo_id: str, medication: str, target_angle: float =
                 "servo1_angle": float(current_servo1_angle) if current_servo1_angle is not None else 0.0  # Current servo1 angle for tracking
             }
         else:
-            return {
+            broadcast_hub.broadcast({
+                "type": "dispense_status",
+                "stage": "failed",
+                "servo_id": servo_id,
+                "medication": medication
+            })
+            result = {
                 "status": "error",
                 "servo_id": servo_id,
                 "medication": medication,
                 "message": "Failed to dispense"
             }
     except Exception as e:
-        logger.error(f"Error in handle_dispense: {e}")
-        return {
+        logger.error("Error in handle_dispense: %s", e)
+        result = {
             "status": "error",
             "message": str(e)
         }
+    
+    event_store.record('dispense', servo_id, result, started, schedule, medication=medication,
+                       servo1_angle=servo_controller.get_position('servo1'))
+    return result
 
 
-async def handle_servo2_dispense() -> dict:
+async def handle_servo2_dispense(schedule: Optional[dict] = None) -> dict:
     """
     Handle servo2 medicine dispense confirmation
     Moves servo2 from 3° to 100° (counter-clockwise) FAST, stays for 2 seconds, then returns to 3°
     If servo1 is at 180°, also resets servo1 to 0° after confirmation
     Only called when user confirms "Yes" to dispense medicine OR automatically for force dispense
+    The outcome is recorded in the dispense history
     """
+    started = time.monotonic()
     try:
         logger.info("✅ Medicine dispense confirmed (user or auto)")
         
         # Show DISPENSING on LCD immediately
         lcd_controller.show_dispensing(duration=7.0)  # Show for 7 seconds (covers servo2 movement)
+        broadcast_hub.broadcast({"type": "dispense_status", "stage": "medicine_dispensing"})
         
         # Check if servo1 is at 180° and needs to be reset
         current_servo1_angle = servo_controller.get_position('servo1')
         is_at_180 = current_servo1_angle and int(current_servo1_angle) >= 180
         
         if is_at_180:
-            logger.info("🔄 Servo1 is at 180° - will reset to 0° after servo2 completes")
+            logger.debug("🔄 Servo1 is at 180° - will reset to 0° after servo2 completes")
         
         # Wait 1 second after servo1 movement before moving servo2
-        logger.info("⏱️  Waiting 1 second after servo1 movement before moving servo2...")
+        logger.debug("⏱️  Waiting 1 second after servo1 movement before moving servo2...")
         await asyncio.sleep(1.0)
         
         # Move servo2 from 3° to 100° (COUNTER-CLOCKWISE, FAST)
-        logger.info("🎯 Moving servo2 from 3° to 100° (COUNTER-CLOCKWISE, FAST - quick dispense)")
-        servo2_success = servo_controller.move_servo2_to_100()
+        logger.debug("🎯 Moving servo2 from 3° to 100° (COUNTER-CLOCKWISE, FAST - quick dispense)")
+        servo2_success = await asyncio.to_thread(servo_controller.move_servo2_to_100)
         
         if servo2_success:
             # Wait 4 seconds at 100° (increased from 2 seconds to prevent overheating)
-            logger.info("⏱️  Servo2 at 100°, waiting 2 seconds before returning to 3° (fast dispense)")
+            logger.debug("⏱️  Servo2 at 100°, waiting 2 seconds before returning to 3° (fast dispense)")
             await asyncio.sleep(2.0)
             
             # Return servo2 to 3° (slowly)
-            reset_success = servo_controller.reset_servo2()
+            reset_success = await asyncio.to_thread(servo_controller.reset_servo2)
             
             # If servo1 is at 180°, reset it to 0° now
             if is_at_180:
                 logger.info("🔄 Resetting servo1 from 180° to 0° (after confirmation)")
-                channel = servo_controller.servos.get('servo1', 4)
-                if servo_controller.kit:
-                    servo_controller.kit.servo[channel].angle = 0
-                    servo_controller.servo_positions['servo1'] = 0.0
-                    time.sleep(0.6)
-                    servo_controller._save_positions()
-                    logger.info("✅ Servo1 reset to 0°")
+                await asyncio.to_thread(servo_controller.reset_servo1)
+            
+            broadcast_hub.broadcast({
+                "type": "dispense_status",
+                "stage": "medicine_dispensed",
+                "servo1_reset": is_at_180
+            })
             
             if reset_success:
-                return {
+                result = {
                     "status": "success",
                     "message": "Medicine dispensed successfully",
                     "servo1_reset": is_at_180
                 }
             else:
-                return {
+                result = {
                     "status": "partial_success",
                     "message": "Medicine dispensed but servo2 did not return to 3°",
                     "servo1_reset": is_at_180
                 }
         else:
-            return {
+            result = {
                 "status": "error",
                 "message": "Failed to dispense medicine"
             }
     except Exception as e:
-        logger.error(f"Error in handle_servo2_dispense: {e}")
-        return {
+        logger.error("Error in handle_servo2_dispense: %s", e)
+        result = {
             "status": "error",
             "message": str(e)
         }
+    
+    event_store.record('servo2_dispense', 'servo2', result, started, schedule,
+                       servo1_angle=servo_controller.get_position('servo1'))
+    return result
 
 
 async def handle_sms(phone_numbers: list, message: str) -> dict:
     """Handle SMS sending command - runs in background thread to not block other operations"""
     try:
-        logger.info(f"📱 Queueing SMS to {phone_numbers} (non-blocking)")
+        logger.info("📱 Queueing SMS to %s (non-blocking)", phone_numbers)
         
         # Run SMS sending in background thread so it doesn't block servo operations
-        import threading
         def send_sms_background():
+            success = False
+            started = time.monotonic()
             try:
                 success = sms_controller.send_sms(phone_numbers, message)
                 if success:
-                    logger.info(f"✅ SMS sent successfully to {phone_numbers}")
+                    logger.info("✅ SMS sent successfully to %s", phone_numbers)
                 else:
-                    logger.warning(f"⚠️ SMS failed to send to {phone_numbers}")
+                    logger.warning("⚠️ SMS failed to send to %s", phone_numbers)
             except Exception as e:
-                logger.error(f"❌ Error in background SMS sending: {e}")
+                logger.error("❌ Error in background SMS sending: %s", e)
+            SMS_SECONDS.observe(time.monotonic() - started)
+            SMS_TOTAL.labels('success' if success else 'failure').inc()
+            if not success:
+                buzzer_controller.sound_sms_failure()
+            # Report the outcome (and current modem status) to all clients via the hub
+            broadcast_hub.broadcast_threadsafe({
+                "type": "sms_status",
+                "success": success,
+                "recipients": len(phone_numbers),
+                **sms_controller.get_status()
+            })
         
         # Start SMS in background thread (non-blocking)
         sms_thread = threading.Thread(target=send_sms_background, daemon=True)
@@ -2003,7 +3156,7 @@ async def handle_sms(phone_numbers: list, message: str) -> dict:
             "message": "SMS queued for sending (non-blocking)"
         }
     except Exception as e:
-        logger.error(f"Error in handle_sms: {e}")
+        logger.error("Error in handle_sms: %s", e)
         return {
             "status": "error",
             "success": False,  # Frontend checks for this
@@ -2011,17 +3164,401 @@ async def handle_sms(phone_numbers: list, message: str) -> dict:
         }
 
 
+class Field:
+    """Schema entry for one message field"""
+    
+    def __init__(self, types, required: bool = False, default=None, coerce=None):
+        self.types = types if isinstance(types, tuple) else (types,)
+        self.required = required
+        self.default = default
+        self.coerce = coerce  # Optional normalizer applied before the type check
+    
+    def describe(self) -> str:
+        return " or ".join(t.__name__ for t in self.types)
+
+
+def compile_schema(schema: Optional[Dict[str, Field]]):
+    """
+    Turn a {name: Field} schema into a validator function (done once at registration)
+    The validator returns the message params, or raises ValueError with a client-facing message
+    """
+    fields = [(name, field.types, field.required, field.default, field.coerce, field.describe())
+              for name, field in (schema or {}).items()]
+    
+    def validate(data: dict) -> dict:
+        params = {}
+        for name, types, required, default, coerce, description in fields:
+            value = data.get(name)
+            if value is None:
+                if required:
+                    raise ValueError(f"Missing required field '{name}'")
+                params[name] = default
+                continue
+            if coerce is not None:
+                value = coerce(value)
+            if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+                raise ValueError(f"Invalid '{name}': expected {description}")
+            params[name] = value
+        return params
+    
+    return validate
+
+
+class Route:
+    """A registered message type"""
+    
+    def __init__(self, message_type: str, handler, validate, lock: Optional[str], requires: tuple = ()):
+        self.message_type = message_type
+        self.handler = handler
+        self.validate = validate
+        self.lock = lock  # Name of the lock group to serialize on, None = run concurrently
+        self.requires = requires  # Hardware subsystems that must be initialized first
+
+
+class MessageRouter:
+    """
+    Dispatches websocket messages to handlers registered by type
+    Each route has a precompiled schema and a concurrency policy:
+      - lock='servo' (etc.): requests sharing a lock name run one at a time, in arrival order
+      - lock=None: request runs immediately, concurrently with everything else
+      - requires=('servo',): request waits until those subsystems finished initializing
+    Replies echo the request's request_id so clients can pipeline requests.
+    """
+    
+    def __init__(self):
+        self.routes: Dict[str, Route] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+    
+    def route(self, message_type: str, schema: Optional[Dict[str, Field]] = None, lock: Optional[str] = None,
+              requires: tuple = ()):
+        """Decorator registering an async handler(params) -> dict for a message type"""
+        def decorator(handler):
+            self.routes[message_type] = Route(message_type, handler, compile_schema(schema), lock, requires)
+            return handler
+        return decorator
+    
+    def _get_lock(self, name: str) -> asyncio.Lock:
+        lock = self._locks.get(name)
+        if lock is None:
+            lock = self._locks[name] = asyncio.Lock()
+        return lock
+    
+    async def dispatch(self, route: Route, params: dict) -> dict:
+        """Run a validated request under its route's concurrency policy"""
+        if route.requires:
+            await hardware_readiness.wait(route.requires)
+        if route.lock is None:
+            return await route.handler(params)
+        async with self._get_lock(route.lock):
+            return await route.handler(params)
+    
+    async def call(self, message_type: str, data: dict) -> dict:
+        """Validate and dispatch a request raised on the Pi itself (same path as a client's)"""
+        route = self.routes[message_type]
+        result = await self.dispatch(route, route.validate(data))
+        REQUESTS_TOTAL.labels(message_type, result.get('status', 'ok')).inc()
+        return result
+
+
+router = MessageRouter()
+
+
+def resolve_schedule(date: Optional[str], time_str: Optional[str], time_frame: Optional[str],
+                     medication: Optional[str] = None) -> Optional[dict]:
+    """Schedule a dispense belongs to: the synced entry if one matches, else the request's own fields"""
+    if not (date and time_str):
+        return None
+    for schedule in schedule_store.schedules.values():
+        if (schedule.get('date') == date and schedule.get('time') == time_str
+                and schedule.get('time_frame') == time_frame
+                and (medication is None or schedule.get('medication') == medication)):
+            return schedule
+    return {"date": date, "time": time_str, "time_frame": time_frame, "medication": medication}
+
+
+@router.route('dispense', lock='servo', requires=('servo', 'buzzer'), schema={
+    'servo_id': Field(str, required=True),
+    'medication': Field(str, default='Unknown'),
+    'target_angle': Field((int, float)),  # Progressive dispense: target angle from frontend
+    'date': Field(str),  # Date of schedule (YYYY-MM-DD)
+    'time': Field(str),  # Time of schedule (HH:MM)
+    'time_frame': Field(str),  # Time frame (morning/afternoon/evening)
+    'force': Field(bool, default=False),  # Force dispense: dispense even if the slot is already done
+})
+async def route_dispense(params: dict) -> dict:
+    servo_id = params['servo_id']
+    logger.debug("🎯 Dispense command received: servo_id='%s', medication='%s'", servo_id, params['medication'])
+    # One dispense per dose slot, whether the web app or the Pi's local scheduler triggers it
+    slot = None
+    if params['date'] and params['time'] and params['time_frame']:
+        slot = slot_key(params['date'], params['time'], params['time_frame'])
+    if slot and not params['force'] and local_scheduler.is_done(slot):
+        logger.info("⏭️ %s was already dispensed - ignoring duplicate dispense", slot)
+        return {"status": "duplicate", "servo_id": servo_id, "message": f"{slot} was already dispensed"}
+    if params['target_angle'] is not None:
+        logger.debug("🎯 Progressive dispense: target_angle=%s°", params['target_angle'])
+    
+    # Don't mark as dispensed here - only mark when servo2 actually moves (user confirms)
+    # This allows the schedule to show again if user clicks "No"
+    started = time.monotonic()
+    schedule = resolve_schedule(params['date'], params['time'], params['time_frame'], params['medication'])
+    result = await handle_dispense(servo_id, params['medication'], params['target_angle'], schedule)
+    DISPENSE_SECONDS.labels(servo_id).observe(time.monotonic() - started)
+    DISPENSE_TOTAL.labels(servo_id, result.get('status', 'unknown')).inc()
+    if slot and result.get('status') == 'success':
+        local_scheduler.mark_done(slot)
+    return result
+
+
+@router.route('servo2_dispense', lock='servo', requires=('servo', 'lcd'), schema={
+    # Date/time/time_frame are optional (for LCD tracking)
+    'date': Field(str),
+    'time': Field(str),
+    'time_frame': Field(str),
+})
+async def route_servo2_dispense(params: dict) -> dict:
+    logger.debug("🎯 Servo2 dispense confirmation received")
+    started = time.monotonic()
+    result = await handle_servo2_dispense(resolve_schedule(params['date'], params['time'], params['time_frame']))
+    DISPENSE_SECONDS.labels('servo2').observe(time.monotonic() - started)
+    DISPENSE_TOTAL.labels('servo2', result.get('status', 'unknown')).inc()
+    
+    # Mark schedule as dispensed on LCD only when servo2 actually moves (user confirmed)
+    # Force dispense or manual dispense without schedule info still shows DISPENSING
+    # (already shown in handle_servo2_dispense; LCD moves on when the timeout expires)
+    if result.get('status') == 'success' and params['date'] and params['time'] and params['time_frame']:
+        lcd_controller.mark_dispensed(params['date'], params['time'], params['time_frame'])
+    return result
+
+
+@router.route('send_sms', requires=('sms', 'buzzer'), schema={
+    'phone_numbers': Field(list, default=[], coerce=lambda v: [v] if isinstance(v, str) else v),
+    'message': Field(str, default=''),
+})
+async def route_send_sms(params: dict) -> dict:
+    return await handle_sms(params['phone_numbers'], params['message'])
+
+
+@router.route('check_simcom_status', requires=('sms',))
+async def route_check_simcom_status(params: dict) -> dict:
+    status = sms_controller.get_status()
+    return {
+        "status": "success",
+        "type": "simcom_status",
+        "sim_inserted": status.get("sim_inserted", False),
+        "signal_strength": status.get("signal_strength", 0),
+        "connected": status.get("connected", False)
+    }
+
+
+@router.route('modem_diagnostics', requires=('sms',), schema={
+    'checks': Field(list, default=[], coerce=lambda v: [v] if isinstance(v, str) else v),  # Check names, [] = all
+})
+async def route_modem_diagnostics(params: dict) -> dict:
+    if sms_controller.demo_mode:
+        return {"status": "error", "type": "modem_diagnostics", "message": "Modem diagnostics unavailable in demo mode"}
+    try:
+        select_plan(params['checks'])
+    except ValueError as e:
+        return {"status": "error", "type": "modem_diagnostics", "message": str(e)}
+    try:
+        # Reuses the server's open port; runs after any SMS currently being sent
+        report = await asyncio.to_thread(sms_controller.diagnose, params['checks'])
+    except Exception as e:
+        logger.error("❌ Modem diagnostics failed: %s", e)
+        return {"status": "error", "type": "modem_diagnostics", "message": str(e)}
+    logger.info("🩺 Modem diagnostics: %s (%.0f ms, %s round trips)", report['summary'], report['elapsed_ms'], report['round_trips'])
+    return {"status": "success", "type": "modem_diagnostics", "report": report}
+
+
+@router.route('update_schedules', lock='lcd', requires=('lcd',), schema={
+    # List of schedule dicts, or compact records {"fields": [...], "rows": [[...], ...]}
+    'schedules': Field(list, default=[], coerce=expand_records),
+})
+async def route_update_schedules(params: dict) -> dict:
+    # Full schedule push - diffed against the store, so an unchanged list is a no-op
+    schedules = params['schedules']
+    logger.debug("📅 Received schedule update: %s schedule(s)", len(schedules))
+    changed = schedule_store.replace(schedules)
+    return {
+        "status": "success",
+        "message": f"Schedules updated: {len(schedules)} schedule(s)",
+        "version": schedule_store.version,
+        "changed": changed
+    }
+
+
+def _schedule_conflict(base_version: int) -> dict:
+    return {
+        "status": "error",
+        "type": "schedule_conflict",
+        "message": f"Schedule version conflict: client has v{base_version}, Pi has v{schedule_store.version}",
+        "version": schedule_store.version
+    }
+
+
+@router.route('schedule_upsert', lock='lcd', requires=('lcd',), schema={
+    'schedules': Field(list, required=True, coerce=expand_records),
+    'base_version': Field(int),  # Version the delta was computed against (omit = unconditional)
+})
+async def route_schedule_upsert(params: dict) -> dict:
+    if not schedule_store.check_version(params['base_version']):
+        return _schedule_conflict(params['base_version'])
+    changed = schedule_store.upsert(params['schedules'])
+    return {"status": "success", "version": schedule_store.version, "changed": changed}
+
+
+@router.route('schedule_delete', lock='lcd', requires=('lcd',), schema={
+    'keys': Field(list, required=True, coerce=lambda v: [v] if isinstance(v, str) else v),
+    'base_version': Field(int),
+})
+async def route_schedule_delete(params: dict) -> dict:
+    if not schedule_store.check_version(params['base_version']):
+        return _schedule_conflict(params['base_version'])
+    changed = schedule_store.delete(params['keys'])
+    return {"status": "success", "version": schedule_store.version, "changed": changed}
+
+
+@router.route('schedule_snapshot')
+async def route_schedule_snapshot(params: dict) -> dict:
+    return {"status": "success", "type": "schedule_snapshot", **schedule_store.snapshot()}
+
+
+@router.route('history_query', schema={
+    'limit': Field(int, default=50),
+    'before_ts': Field((int, float)),  # Cursor from the previous page's next_cursor
+    'before_id': Field(int),
+    'since': Field((int, float)),  # Unix time range
+    'until': Field((int, float)),
+    'schedule_key': Field(str),
+    'servo_id': Field(str),
+    'status': Field(str),
+    'compact': Field(bool, default=False),  # Reply with {fields, rows} instead of one object per event
+})
+async def route_history_query(params: dict) -> dict:
+    if not event_store.is_open:
+        return {"status": "error", "type": "history", "message": "Dispense history is not enabled on this Pi"}
+    page = await asyncio.to_thread(event_store.query, **params)
+    return {"status": "success", "type": "history", **page}
+
+
+@router.route('scheduler_config', schema={
+    'enabled': Field(bool),
+    'automatic': Field(bool),  # Web app's dispense mode: automatic also moves servo2
+    'phone_numbers': Field(list, coerce=lambda v: [v] if isinstance(v, str) else v),
+})
+async def route_scheduler_config(params: dict) -> dict:
+    local_scheduler.configure(**params)
+    return {"status": "success", "type": "scheduler_status", **local_scheduler.status()}
+
+
+@router.route('scheduler_status')
+async def route_scheduler_status(params: dict) -> dict:
+    return {"status": "success", "type": "scheduler_status", **local_scheduler.status()}
+
+
+@router.route('scheduler_ack', schema={
+    'keys': Field(list, required=True, coerce=lambda v: [v] if isinstance(v, str) else v),
+})
+async def route_scheduler_ack(params: dict) -> dict:
+    # The web app logged these local dispenses to its own history
+    return {"status": "success", "acknowledged": local_scheduler.acknowledge(params['keys'])}
+
+
+@router.route('ping')
+async def route_ping(params: dict) -> dict:
+    # Pings carrying a request_id (bare pings are answered in handle_client's fast path)
+    return {"type": "pong", "status": "success"}
+
+
+@router.route('liveness_stats')
+async def route_liveness_stats(params: dict) -> dict:
+    return {"status": "success", "type": "liveness_stats", "clients": liveness_monitor.stats()}
+
+
+@router.route('i2c_status', schema={
+    'rescan': Field(bool, default=False),  # Probe the bus again instead of returning the cached scan
+})
+async def route_i2c_status(params: dict) -> dict:
+    if params['rescan']:
+        await asyncio.to_thread(i2c_bus.scan, True)  # Probes interleave with LCD and servo transactions
+    lcd_address = lcd_controller.address if lcd_controller else None
+    return {
+        "status": "success",
+        "type": "i2c_status",
+        **i2c_bus.report(),
+        "lcd_address": f"0x{lcd_address:02X}" if lcd_address is not None else None,
+    }
+
+
+@router.route('loop_stalls', schema={
+    'top': Field(int, default=10),
+})
+async def route_loop_stalls(params: dict) -> dict:
+    return {"status": "success", "type": "loop_stalls", **loop_watchdog.report(params['top'])}
+
+
+def pi_id_response() -> dict:
+    return {
+        "type": "pi_id",
+        "pi_unique_id": get_pi_unique_id(),
+        "status": "success"
+    }
+
+
+@router.route('get_pi_id')
+async def route_get_pi_id(params: dict) -> dict:
+    # Requests with a request_id; bare ones use the fast reply registered in main()
+    return pi_id_response()
+
+
+async def _run_request(websocket, codec: WireCodec, route: Route, params: dict, request_id,
+                       session: Optional[Session] = None):
+    """Run one request and send its reply (one task per request, so replies can be out of order)"""
+    try:
+        result = await router.dispatch(route, params)
+    except Exception as e:
+        logger.error("Error processing %s: %s", route.message_type, e)
+        result = {"status": "error", "message": str(e)}
+    
+    REQUESTS_TOTAL.labels(route.message_type, result.get('status', 'ok')).inc()
+    if request_id is not None:
+        result = {**result, "request_id": request_id}
+    logger.debug("📤 Sending result: %s", result)
+    try:
+        # With a session the reply survives a dropped connection (replayed on resume)
+        await send_reply(websocket, codec, result, session)
+    except Exception as e:
+        logger.warning("⚠️ Could not send %s result (client gone?): %s", route.message_type, e)
+
+
 async def handle_client(websocket, path=None):
     """
     Handle WebSocket client connections
     IMPORTANT: Does NOT reset servos on connection/disconnection
     FIXED: path=None for newer websockets library compatibility
+    Messages are validated and dispatched through `router`; each request runs in its own
+    task so a slow hardware command never blocks queries on the same connection.
+    Frames use the codec negotiated via the websocket subprotocol (JSON by default).
+    session_resume is handled inline (not routed): it binds the connection to a session and
+    replays missed messages before any later request on the connection is read.
     """
     client_address = websocket.remote_address
-    logger.info(f"Client connected from {client_address}")
+    codec = get_codec(websocket)
+    CONNECTIONS_TOTAL.inc()
+    logger.info("Client connected from %s (%s)", client_address, codec.subprotocol)
     
-    # Add to active connections for button press notifications
-    active_websockets.add(websocket)
+    # Register with the broadcast hub for button/dispense/LED/SIMCOM events
+    broadcast_hub.register(websocket, codec)
+    liveness = liveness_monitor.add(websocket)
+    await websocket.send(codec.dumps({
+        "type": "server_info",
+        "features": SERVER_FEATURES,
+        "encodings": SUBPROTOCOLS,
+        "readiness": hardware_readiness.snapshot()
+    }))
+    in_flight = set()  # Keep references to running request tasks
+    session = None  # Set once the client sends session_resume
     
     # CRITICAL: Don't reset servos here!
     # The servo_controller maintains positions across connections
@@ -2029,136 +3566,479 @@ async def handle_client(websocket, path=None):
     
     try:
         async for message in websocket:
+            liveness.last_seen = time.monotonic()
+            fast_reply = codec.fast_replies.get(message)
+            if fast_reply is not None:
+                # Bare ping / get_pi_id: answer from a pre-serialized frame without parsing or logging
+                await websocket.send(fast_reply)
+                continue
+            
+            request_id = None
             try:
-                logger.info(f"📨 Raw message received: {message}")
-                data = json.loads(message)
+                logger.debug("📨 Raw message received: %s", message)
+                data = codec.loads(message)
+                if not isinstance(data, dict):
+                    raise ValueError(f"Message must be a {codec.object_name}")
                 message_type = data.get('type')
-                logger.info(f"📋 Parsed message type: {message_type}, full data: {data}")
-                
-                if message_type == 'dispense':
-                    # Handle dispense command
-                    servo_id = data.get('servo_id')
-                    medication = data.get('medication', 'Unknown')
-                    target_angle = data.get('target_angle')  # Progressive dispense: target angle from frontend
-                    date = data.get('date')  # Date of schedule (YYYY-MM-DD)
-                    time_str = data.get('time')  # Time of schedule (HH:MM)
-                    time_frame = data.get('time_frame')  # Time frame (morning/afternoon/evening)
-                    
-                    logger.info(f"🎯 Dispense command received: servo_id='{servo_id}', medication='{medication}'")
-                    if target_angle is not None:
-                        logger.info(f"🎯 Progressive dispense: target_angle={target_angle}°")
-                    logger.info(f"🔧 Available servos: {list(servo_controller.servos.keys())}")
-                    logger.info(f"🔧 Demo mode: {servo_controller.demo_mode}")
-                    logger.info(f"🔧 PCA9685 kit: {servo_controller.kit is not None}")
-                    
-                    result = await handle_dispense(servo_id, medication, target_angle)
-                    
-                    # Don't mark as dispensed here - only mark when servo2 actually moves (user confirms)
-                    # This allows the schedule to show again if user clicks "No"
-                    
-                    logger.info(f"📤 Sending result: {result}")
-                    await websocket.send(json.dumps(result))
-                    
-                elif message_type == 'servo2_dispense':
-                    # Handle second servo dispense confirmation
-                    logger.info("🎯 Servo2 dispense confirmation received")
-                    
-                    # Get date/time/time_frame from data if provided (for LCD tracking)
-                    date = data.get('date')
-                    time_str = data.get('time')
-                    time_frame = data.get('time_frame')
-                    
-                    result = await handle_servo2_dispense()
-                    
-                    # Mark schedule as dispensed on LCD only when servo2 actually moves (user confirmed)
-                    if result.get('status') == 'success' and date and time_str and time_frame:
-                        lcd_controller.mark_dispensed(date, time_str, time_frame)
-                    elif result.get('status') == 'success':
-                        # Force dispense or manual dispense without schedule info - still show DISPENSING
-                        # (already shown in handle_servo2_dispense, but ensure it updates after)
-                        pass
-                    
-                    # Update LCD after dispense to show next nearest time
-                    # This happens automatically when DISPENSING timeout expires
-                    
-                    logger.info(f"📤 Sending result: {result}")
-                    await websocket.send(json.dumps(result))
-                    
-                elif message_type == 'send_sms':
-                    # Handle SMS command
-                    phone_numbers = data.get('phone_numbers', [])
-                    if isinstance(phone_numbers, str):
-                        phone_numbers = [phone_numbers]
-                    sms_message = data.get('message', '')
-                    
-                    result = await handle_sms(phone_numbers, sms_message)
-                    await websocket.send(json.dumps(result))
+                request_id = data.get('request_id')
+                logger.debug("📋 Parsed message type: %s, full data: %s", message_type, data)
                 
-                elif message_type == 'check_simcom_status':
-                    # Handle SIMCOM status check
-                    status = sms_controller.get_status()
-                    await websocket.send(json.dumps({
-                        "status": "success",
-                        "type": "simcom_status",
-                        "sim_inserted": status.get("sim_inserted", False),
-                        "signal_strength": status.get("signal_strength", 0),
-                        "connected": status.get("connected", False)
-                    }))
-                    
-                elif message_type == 'update_schedules':
-                    # Handle schedule update for LCD display
-                    schedules = data.get('schedules', [])
-                    logger.info(f"📅 Received schedule update: {len(schedules)} schedule(s)")
-                    lcd_controller.update_schedules(schedules)
-                    await websocket.send(json.dumps({
-                        "status": "success",
-                        "message": f"Schedules updated: {len(schedules)} schedule(s)"
-                    }))
+                if message_type == 'session_resume':
+                    last_seq = data.get('last_seq') or 0
+                    session_id = data.get('session_id')
+                    if not isinstance(last_seq, int) or isinstance(last_seq, bool) or last_seq < 0:
+                        raise ValueError("Field 'last_seq' must be a non-negative integer")
+                    if session_id is not None and not isinstance(session_id, str):
+                        raise ValueError("Field 'session_id' must be a string")
+                    session = await session_manager.resume(websocket, codec, session_id, last_seq, request_id)
+                    REQUESTS_TOTAL.labels(message_type, 'success').inc()
+                    continue
                 
-                elif message_type == 'get_pi_id':
-                    # Handle Pi unique ID request
-                    pi_unique_id = get_pi_unique_id()
-                    logger.info(f"🔍 Pi unique ID requested: {pi_unique_id}")
-                    await websocket.send(json.dumps({
-                        "type": "pi_id",
-                        "pi_unique_id": pi_unique_id,
-                        "status": "success"
-                    }))
+                route = router.routes.get(message_type)
+                if route is None:
+                    logger.warning("Unknown message type: %s", message_type, extra=rate_limited(60))
+                    raise ValueError(f"Unknown message type: {message_type}")
                 
-                else:
-                    logger.warning(f"Unknown message type: {message_type}")
-                    await websocket.send(json.dumps({
-                        "status": "error",
-                        "message": f"Unknown message type: {message_type}"
-                    }))
-                    
+                params = route.validate(data)
+                task = asyncio.create_task(_run_request(websocket, codec, route, params, request_id, session))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+            
             except json.JSONDecodeError as e:
-                logger.error(f"Invalid JSON received: {e}")
-                await websocket.send(json.dumps({
+                logger.error("Invalid JSON received: %s", e)
+                # Unsolicited error (no request_id was readable): clients must not match it to a request
+                await websocket.send(codec.dumps({
+                    "type": "error",
                     "status": "error",
                     "message": "Invalid JSON format"
                 }))
             except Exception as e:
-                logger.error(f"Error processing message: {e}")
-                await websocket.send(json.dumps({
-                    "status": "error",
-                    "message": str(e)
-                }))
-                
+                logger.error("Error processing message: %s", e, extra=rate_limited(10))
+                error = {"status": "error", "message": str(e)}
+                if request_id is not None:
+                    error["request_id"] = request_id
+                else:
+                    error["type"] = "error"  # Unsolicited, like the invalid JSON reply
+                await send_reply(websocket, codec, error, session)
+    
     except websockets.exceptions.ConnectionClosed:
-        logger.info(f"Client {client_address} disconnected")
+        logger.info("Client %s disconnected", client_address)
         # CRITICAL: Don't reset servos on disconnect!
         # Servos maintain their position
-        
+        # In-flight hardware requests are allowed to finish (never stop a servo mid-move)
+    
     except Exception as e:
-        logger.error(f"Error in handle_client: {e}")
+        logger.error("Error in handle_client: %s", e)
     finally:
-        # Remove from active connections
-        active_websockets.discard(websocket)
-        logger.info(f"Connection closed for {client_address}")
+        # Remove from broadcast hub and liveness tracking
+        broadcast_hub.unregister(websocket)
+        liveness_monitor.remove(websocket)
+        session_manager.release(websocket)
+        logger.info("Connection closed for %s", client_address)
         # CRITICAL: Don't reset servos here either!
 
 
+def slot_key(date: str, time_str: str, time_frame: str) -> str:
+    """Key for one dose slot (the bundle of a time frame on a date) - also used by the LCD's dispensed set"""
+    return f"{date}_{time_str}_{time_frame}"
+
+
+class LocalScheduler:
+    """
+    Dispenses scheduled doses on the Pi itself when the web app doesn't (tab closed, tunnel down)
+    Synced schedules are grouped into dose slots (date + time + time frame; a frame's medications
+    dispense together, like the web app's bundles) and kept in a heap keyed on due time, so run()
+    just sleeps until the earliest slot. The web app gets GRACE_SECONDS to dispense a slot itself
+    (its dispense request marks the slot done); after that the Pi runs the same pipeline: the
+    dispense route (servo, buzzer, history), SMS to the configured numbers and, in automatic mode,
+    servo2. Whoever comes second for a slot gets a "duplicate" reply.
+    Local dispenses stay in `unreconciled` until the web app acknowledges them (scheduler_ack).
+    Config, done slots, unreconciled dispenses and the last schedules survive restarts (STATE_FILE).
+    """
+    
+    STATE_FILE = "/home/justin/pillpal/scheduler_state.json"
+    GRACE_SECONDS = 90  # The web app dispenses at the top of the minute - give it time first
+    MISSED_AFTER = 15 * 60  # Slots overdue by more than this (Pi was off) are skipped, not dispensed late
+    KEEP_DONE_SECONDS = 3 * 24 * 3600
+    SERVO2_DELAY = 1.0  # Same pause as the web app's automatic mode
+    TIME_FRAME_LABELS = {'morning': 'Morning', 'afternoon': 'Afternoon', 'evening': 'Evening'}
+    # Servo1 angle per slot, matching the web app's getAngleForTimeFrame (date.weekday(): 5 = Saturday, 6 = Sunday)
+    SLOT_ANGLES = {
+        5: {'morning': 30, 'afternoon': 60, 'evening': 90},
+        6: {'morning': 120, 'afternoon': 150, 'evening': 180},
+    }
+    
+    def __init__(self):
+        self.enabled = True
+        self.automatic = False  # Also move servo2 (web app's automatic mode); manual leaves it to the user
+        self.phone_numbers: list = []
+        self.done: Dict[str, float] = {}  # slot key -> when it was dispensed (by either side)
+        self.unreconciled: Dict[str, dict] = {}  # slot key -> local dispense the web app hasn't logged yet
+        self._slots: Dict[str, dict] = {}
+        self._heap = []  # (due time, slot key); stale entries are skipped when they surface
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks = set()
+        self._pending_state: Optional[str] = None  # Latest snapshot not yet on disk
+        self._writer: Optional[asyncio.Task] = None
+        self._write_lock = threading.Lock()  # flush() on shutdown may overlap a worker-thread write
+    
+    def load(self) -> list:
+        """Restore persisted state, returns the schedules saved with it"""
+        try:
+            with open(self.STATE_FILE, 'r') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            logger.error("❌ Could not load scheduler state: %s", e)
+            return []
+        self.enabled = state.get('enabled', True)
+        self.automatic = state.get('automatic', False)
+        self.phone_numbers = state.get('phone_numbers', [])
+        self.done = state.get('done', {})
+        self.unreconciled = state.get('unreconciled', {})
+        return state.get('schedules', [])
+    
+    def _save(self):
+        """Snapshot the state and write it from a worker thread (saves made meanwhile are coalesced)"""
+        cutoff = time.time() - self.KEEP_DONE_SECONDS
+        self.done = {key: at for key, at in self.done.items() if at >= cutoff}
+        # Serialized here, on the loop thread, so the writer never sees a dict being modified
+        self._pending_state = json.dumps({
+            "enabled": self.enabled,
+            "automatic": self.automatic,
+            "phone_numbers": self.phone_numbers,
+            "done": self.done,
+            "unreconciled": self.unreconciled,
+            "schedules": list(schedule_store.schedules.values()),
+        })
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()  # No event loop to block
+            return
+        if self._writer is None:
+            self._writer = loop.create_task(self._write_pending())
+    
+    async def _write_pending(self):
+        try:
+            while self._pending_state is not None:
+                state, self._pending_state = self._pending_state, None
+                await asyncio.to_thread(self._write, state)
+        finally:
+            self._writer = None
+    
+    def flush(self):
+        """Write a save that is still queued (on shutdown)"""
+        state, self._pending_state = self._pending_state, None
+        if state is not None:
+            self._write(state)
+    
+    def _write(self, state: str):
+        """Atomic replace: a power cut mid-write leaves the previous file, not a truncated one"""
+        temp_file = self.STATE_FILE + '.tmp'
+        try:
+            with self._write_lock:
+                with open(temp_file, 'w') as f:
+                    f.write(state)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_file, self.STATE_FILE)
+        except OSError as e:
+            logger.error("❌ Could not save scheduler state: %s", e, extra=rate_limited(60))
+    
+    def configure(self, enabled: Optional[bool] = None, automatic: Optional[bool] = None,
+                  phone_numbers: Optional[list] = None):
+        if enabled is not None:
+            self.enabled = enabled
+        if automatic is not None:
+            self.automatic = automatic
+        if phone_numbers is not None:
+            self.phone_numbers = phone_numbers
+        self._save()
+        self._wake()
+    
+    def is_done(self, key: str) -> bool:
+        return key in self.done
+    
+    def mark_done(self, key: str):
+        self.done[key] = time.time()
+        self._save()
+    
+    def acknowledge(self, keys: list) -> int:
+        acked = [key for key in keys if self.unreconciled.pop(key, None) is not None]
+        if acked:
+            self._save()
+        return len(acked)
+    
+    @staticmethod
+    def _due(date: Optional[str], time_str: Optional[str]) -> Optional[float]:
+        try:
+            return datetime.strptime(f"{date} {time_str[:5]}", "%Y-%m-%d %H:%M").timestamp()
+        except (TypeError, ValueError):
+            return None
+    
+    def on_schedules_changed(self, upserted: Dict[str, dict], removed: list, version: int):
+        """schedule_store listener: regroup slots, push new/moved ones onto the heap"""
+        slots = {}
+        for schedule in schedule_store.schedules.values():
+            date, time_str, time_frame = schedule.get('date'), schedule.get('time'), schedule.get('time_frame')
+            due = self._due(date, time_str)
+            if due is None or not time_frame:
+                continue
+            key = slot_key(date, time_str, time_frame)
+            slot = slots.setdefault(key, {"key": key, "date": date, "time": time_str, "time_frame": time_frame,
+                                          "medications": [], "due": due})
+            medication = schedule.get('medication')
+            if medication and medication not in slot['medications']:
+                slot['medications'].append(medication)
+        
+        for key, slot in slots.items():
+            previous = self._slots.get(key)
+            if previous is None or previous['due'] != slot['due']:
+                heapq.heappush(self._heap, (slot['due'], key))
+        self._slots = slots
+        if len(self._heap) > 2 * len(slots) + 16:
+            self._heap = [(slot['due'], key) for key, slot in slots.items()]
+            heapq.heapify(self._heap)
+        self._save()
+        self._wake()
+    
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+    
+    def next_slot(self) -> Optional[dict]:
+        pending = [slot for key, slot in self._slots.items()
+                   if key not in self.done and slot['due'] + self.GRACE_SECONDS > time.time()]
+        return min(pending, key=lambda slot: slot['due'], default=None)
+    
+    def status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "automatic": self.automatic,
+            "sms_recipients": len(self.phone_numbers),
+            "grace_seconds": self.GRACE_SECONDS,
+            "slots": len(self._slots),
+            "next_slot": self.next_slot(),
+            "local_dispenses": list(self.unreconciled.values()),
+        }
+    
+    async def run(self):
+        """Fire due slots (start once from main)"""
+        self._wakeup = asyncio.Event()
+        while True:
+            self._wakeup.clear()
+            timeout = None
+            now = time.time()
+            while self._heap:
+                due, key = self._heap[0]
+                slot = self._slots.get(key)
+                if slot is None or slot['due'] != due or key in self.done:
+                    heapq.heappop(self._heap)  # Removed, moved or already dispensed
+                    continue
+                fire_at = due + self.GRACE_SECONDS
+                if fire_at > now:
+                    timeout = fire_at - now
+                    break
+                heapq.heappop(self._heap)
+                if now - due > self.MISSED_AFTER:
+                    logger.warning("⏭️ Scheduler: skipping %s (%.0f min overdue)", key, (now - due) / 60)
+                elif self.enabled:
+                    task = asyncio.create_task(self._dispense(slot))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+    
+    def _angle(self, slot: dict) -> Optional[int]:
+        weekday = datetime.strptime(slot['date'], "%Y-%m-%d").weekday()
+        return self.SLOT_ANGLES.get(weekday, {}).get(slot['time_frame'])
+    
+    async def _dispense(self, slot: dict):
+        """Run the web app's dispense flow for one slot on the Pi"""
+        key = slot['key']
+        medications = ', '.join(slot['medications']) or 'Scheduled dose'
+        where = {"date": slot['date'], "time": slot['time'], "time_frame": slot['time_frame']}
+        logger.info("⏰ Scheduler: %s was not dispensed by the web app - dispensing on the Pi (%s)", key, medications)
+        
+        result = await router.call('dispense', {"servo_id": "servo1", "medication": medications,
+                                                "target_angle": self._angle(slot), **where})
+        if result.get('status') == 'duplicate':
+            return  # The web app got there while we waited for the servo lock
+        record = {"key": key, **where, "medications": slot['medications'], "dispensed_at": time.time(),
+                  "status": result.get('status'), "servo1_angle": result.get('servo1_angle')}
+        
+        if result.get('status') == 'success':
+            if self.phone_numbers:
+                label = self.TIME_FRAME_LABELS.get(slot['time_frame'], slot['time_frame'])
+                verb = 'is' if len(slot['medications']) <= 1 else 'are'
+                await router.call('send_sms', {"phone_numbers": self.phone_numbers,
+                                               "message": f"The {medications} for {label} {verb} ready to dispense."})
+            if self.automatic:
+                await asyncio.sleep(self.SERVO2_DELAY)
+                servo2 = await router.call('servo2_dispense', where)
+                record["servo2_status"] = servo2.get('status')
+        else:
+            logger.error("❌ Scheduler: local dispense of %s failed: %s", key, result.get('message'))
+        
+        self.unreconciled[key] = record
+        self._save()
+        broadcast_hub.broadcast({"type": "local_dispense", **record})
+
+
+local_scheduler = LocalScheduler()
+
+
+async def serve_metrics(host: str, port: int):
+    """
+    Minimal HTTP/1.1 server for GET /metrics (runs in the same event loop as the websocket server)
+    Each scrape is answered and the connection closed; anything else gets a 404.
+    """
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b'\r\n', b'\n', b''):
+                pass  # Headers are not needed
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                body = metrics.render().encode()
+                LOOP_LAG_MAX_SECONDS.set(0)  # Max is per scrape interval
+                status, content_type = '200 OK', 'text/plain; version=0.0.4; charset=utf-8'
+            else:
+                body, status, content_type = b'Not Found\n', '404 Not Found', 'text/plain'
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except Exception as e:
+            logger.debug("Metrics request failed: %s", e)
+        finally:
+            writer.close()
+    
+    server = await asyncio.start_server(handle, host, port)
+    logger.info("📈 Metrics on http://%s:%s/metrics", host, port)
+    return server
+
+
+class LoopWatchdog:
+    """
+    Measures event loop lag and finds the code that blocks the loop
+    A loop task wakes every INTERVAL and records a heartbeat; lag is how late it woke up.
+    A sampling thread checks the heartbeat and, while the loop is overdue by more than
+    STALL_THRESHOLD, grabs the loop thread's stack from sys._current_frames(). Samples are
+    counted per stack, so the blocking hot paths show up with how long they block.
+    """
+    
+    INTERVAL = 0.5  # Heartbeat period (seconds)
+    STALL_THRESHOLD = 0.2  # Overdue by more than this = stalled
+    SAMPLE_INTERVAL = 0.05  # How often the sampling thread checks the heartbeat
+    STACK_DEPTH = 12  # Frames kept per sampled stack
+    MAX_STACKS = 200  # Distinct stacks kept (new ones are dropped beyond this)
+    
+    def __init__(self):
+        self.stacks: Dict[tuple, int] = {}  # stack (frame tuples, oldest first) -> samples
+        self.stalls = 0  # Stall episodes seen
+        self.max_lag = 0.0
+        self._stacks_lock = threading.Lock()  # stacks is updated by the sampling thread, read on the loop
+        self._expected = None  # Monotonic time the heartbeat is due
+        self._loop_thread = None
+        self._in_stall = False
+        self._stall_frame = None  # Innermost frame of the current stall's first sample
+        self._sampler = None
+    
+    async def run(self):
+        """Heartbeat task (start once from main)"""
+        loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._expected = time.monotonic() + self.INTERVAL
+        if self._sampler is None:
+            self._sampler = threading.Thread(target=self._sample, name="loop-watchdog", daemon=True)
+            self._sampler.start()
+        while True:
+            await asyncio.sleep(self.INTERVAL)
+            now = time.monotonic()
+            lag = max(0.0, now - self._expected)
+            self._expected = now + self.INTERVAL
+            
+            LOOP_LAG_SECONDS.observe(lag)
+            if lag > LOOP_LAG_MAX_SECONDS.value:
+                LOOP_LAG_MAX_SECONDS.set(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if self._in_stall:
+                self._in_stall = False
+                logger.warning("🐌 Event loop was blocked for %.2fs in %s", lag, self._stall_frame,
+                               extra=rate_limited(10))
+    
+    def _sample(self):
+        """Sampling thread: capture the loop thread's stack while the heartbeat is overdue"""
+        while True:
+            time.sleep(self.SAMPLE_INTERVAL)
+            expected = self._expected
+            if expected is None or time.monotonic() - expected < self.STALL_THRESHOLD:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = tuple((f.filename.rsplit('/', 1)[-1], f.lineno, f.name)
+                          for f in traceback.extract_stack(frame, limit=self.STACK_DEPTH))
+            del frame
+            if not self._in_stall:
+                self._in_stall = True
+                self._stall_frame = self._format_frame(stack[-1])
+                self.stalls += 1
+                LOOP_STALLS_TOTAL.inc()
+            with self._stacks_lock:
+                if stack not in self.stacks and len(self.stacks) >= self.MAX_STACKS:
+                    continue
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            BLOCKING_SAMPLES_TOTAL.labels(self._format_frame(stack[-1])).inc()
+    
+    @staticmethod
+    def _format_frame(frame: tuple) -> str:
+        filename, lineno, name = frame
+        return f"{filename}:{lineno} {name}"
+    
+    def report(self, top: int = 10) -> dict:
+        """Most-sampled blocking stacks (each sample ~ SAMPLE_INTERVAL of blocked loop)"""
+        with self._stacks_lock:
+            stacks = list(self.stacks.items())
+        ranked = sorted(stacks, key=lambda item: item[1], reverse=True)[:top]
+        return {
+            "stalls": self.stalls,
+            "max_lag_seconds": round(self.max_lag, 3),
+            "sample_interval": self.SAMPLE_INTERVAL,
+            "stacks": [
+                {"samples": samples, "frames": [self._format_frame(frame) for frame in stack]}
+                for stack, samples in ranked
+            ]
+        }
+
+
+loop_watchdog = LoopWatchdog()
+
+
+async def sync_leds_at_startup():
+    """Set the LEDs for servo1's restored position once both subsystems are up"""
+    await hardware_readiness.wait(('servo', 'led'))
+    try:
+        current_angle = servo_controller.get_position('servo1')
+        if current_angle is not None:
+            logger.info("🔍 Reading servo1 angle at startup: %s°", current_angle)
+            # Force update LEDs at startup (bypass the angle check to ensure LEDs are set)
+            led_controller.update_leds(current_angle, force_update=True)
+            logger.info("💡 LEDs initialized and set for servo1 position: %s°", current_angle)
+        else:
+            logger.info("🔍 Servo1 angle not available at startup, setting LEDs for 0°")
+            led_controller.update_leds(0.0, force_update=True)
+            logger.info("💡 LEDs initialized and set for servo1 position: 0°")
+    except Exception as e:
+        logger.warning("⚠️ Could not initialize LEDs: %s", e)
+        import traceback
+        traceback.print_exc()
+
+
 async def lcd_update_task():
     """Periodically update LCD display (every 10 seconds to always show closest time)"""
     while True:
@@ -2166,11 +4046,29 @@ async def lcd_update_task():
             await asyncio.sleep(10)  # Update every 10 seconds to always show closest time
             lcd_controller.update_periodic()
         except Exception as e:
-            logger.error(f"❌ Error in LCD update task: {e}")
+            logger.error("❌ Error in LCD update task: %s", e)
             await asyncio.sleep(10)
 
 
+def _read_first_line(path: str) -> str:
+    with open(path, 'r') as f:
+        return f.readline().strip()
+
+
+_pi_unique_id: Optional[str] = None  # Computed once, see get_pi_unique_id
+
+
 def get_pi_unique_id() -> str:
+    """
+    Unique ID for this Raspberry Pi (memoized - computed on first call, normally at startup)
+    """
+    global _pi_unique_id
+    if _pi_unique_id is None:
+        _pi_unique_id = _compute_pi_unique_id()
+    return _pi_unique_id
+
+
+def _compute_pi_unique_id() -> str:
     """
     Generate a unique ID for this Raspberry Pi based on CPU serial number.
     This ID is persistent across reboots and uniquely identifies the Pi.
@@ -2183,10 +4081,10 @@ def get_pi_unique_id() -> str:
             with open(PI_ID_FILE, 'r') as f:
                 existing_id = f.read().strip()
                 if existing_id:
-                    logger.info(f"📋 Using existing Pi unique ID from file: {existing_id}")
+                    logger.debug("📋 Using existing Pi unique ID from file: %s", existing_id)
                     return existing_id
         except Exception as e:
-            logger.warning(f"⚠️ Could not read Pi ID file: {e}")
+            logger.warning("⚠️ Could not read Pi ID file: %s", e)
     
     # Generate new ID based on CPU serial number
     try:
@@ -2197,127 +4095,461 @@ def get_pi_unique_id() -> str:
                     serial = line.split(':')[1].strip()
                     # Create hash from serial for consistent ID
                     pi_id = hashlib.md5(serial.encode()).hexdigest()
-                    logger.info(f"🔑 Generated new Pi unique ID from serial: {pi_id}")
+                    logger.info("🔑 Generated new Pi unique ID from serial: %s", pi_id)
                     
                     # Save to file for persistence
                     try:
                         os.makedirs(os.path.dirname(PI_ID_FILE), exist_ok=True)
                         with open(PI_ID_FILE, 'w') as f:
                             f.write(pi_id)
-                        logger.info(f"💾 Saved Pi unique ID to {PI_ID_FILE}")
+                        logger.info("💾 Saved Pi unique ID to %s", PI_ID_FILE)
                     except Exception as e:
-                        logger.warning(f"⚠️ Could not save Pi ID to file: {e}")
+                        logger.warning("⚠️ Could not save Pi ID to file: %s", e)
                     
                     return pi_id
     except Exception as e:
-        logger.error(f"❌ Error generating Pi unique ID: {e}")
+        logger.error("❌ Error generating Pi unique ID: %s", e)
     
-    # Fallback: use hostname + MAC address
+    # Fallback: use hostname + MAC address (read from /proc and /sys, no subprocesses)
     try:
-        hostname = subprocess.check_output(['hostname'], text=True).strip()
-        mac_result = subprocess.check_output(['cat', '/sys/class/net/eth0/address'], text=True).strip()
+        hostname = _read_first_line('/proc/sys/kernel/hostname')
+        mac_result = _read_first_line('/sys/class/net/eth0/address')
         fallback_id = hashlib.md5(f"{hostname}{mac_result}".encode()).hexdigest()
-        logger.warning(f"⚠️ Using fallback Pi unique ID: {fallback_id}")
+        logger.warning("⚠️ Using fallback Pi unique ID: %s", fallback_id)
         return fallback_id
     except Exception as e:
-        logger.error(f"❌ Error generating fallback Pi ID: {e}")
+        logger.error("❌ Error generating fallback Pi ID: %s", e)
         # Last resort: random ID (not ideal, but better than nothing)
         import random
         random_id = hashlib.md5(str(random.random()).encode()).hexdigest()
-        logger.error(f"❌ Using random Pi ID (not persistent): {random_id}")
+        logger.error("❌ Using random Pi ID (not persistent): %s", random_id)
         return random_id
 
 
-async def led_update_task():
-    """Periodically update LEDs based on servo1 angle (every 1 second)"""
-    logger.info("💡 LED update task started - checking servo1 angle every 1 second")
-    while True:
+class RelayedWebSocket:
+    """
+    One browser connection carried over the relay link
+    Quacks like a websockets connection (async iteration, send, close, ping, remote_address,
+    subprotocol), so handle_client, the broadcast hub and the liveness monitor serve it
+    exactly like a direct client.
+    """
+    
+    # Frames queued before a session counts as stalled. Well above max_queue: bursts arrive all at
+    # once off the shared link, where a direct client would have them spread over its TCP buffers
+    MAX_BACKLOG = 256
+    
+    def __init__(self, relay: 'RelayClient', sid: str, subprotocol: Optional[str], remote: Optional[str]):
+        self.relay = relay
+        self.sid = sid
+        self.subprotocol = subprotocol
+        self.remote_address = (remote or 'relay', sid)
+        self.closed = False
+        self.close_code = None
+        self._incoming = asyncio.Queue()  # Frames from the browser; None = closed
+    
+    def __aiter__(self):
+        return self
+    
+    async def __anext__(self):
+        frame = await self._incoming.get()
+        if frame is None:
+            raise StopAsyncIteration
+        return frame
+    
+    def feed(self, frame):
+        """
+        Queue a frame from the relay without waiting - the link is shared, so a session that is
+        MAX_BACKLOG frames behind is disconnected (the browser reconnects and resumes) instead of
+        holding up every other session's frames
+        """
+        if self.closed:
+            return
+        if self._incoming.qsize() >= self.MAX_BACKLOG:
+            logger.warning("🐢 Relayed client %s too slow (%s frames queued) - disconnecting", self.sid,
+                           self._incoming.qsize(), extra=rate_limited(10))
+            code = BroadcastHub.SLOW_CLIENT_CLOSE_CODE
+            self.closed_by_peer(code)  # Closed now, so later frames for it are dropped here
+            self.relay._spawn(self.relay.send_control({"op": "close", "sid": self.sid, "code": code,
+                                                       "reason": "Client too slow"}))
+            return
+        self._incoming.put_nowait(frame)
+    
+    def closed_by_peer(self, code: int):
+        if not self.closed:
+            self.closed = True
+            self.close_code = code
+            self._incoming.put_nowait(None)
+    
+    async def send(self, frame):
+        if self.closed:
+            raise ConnectionError(f"Relayed connection {self.sid} is closed")
+        await self.relay.send_frame(self.sid, frame)
+    
+    async def ping(self):
+        # Liveness of the part the Pi owns: the relay link (the relay pings the browsers)
+        return await self.relay.ping()
+    
+    async def close(self, code: int = 1000, reason: str = ''):
+        if self.closed:
+            return
+        self.closed_by_peer(code)
+        await self.relay.send_control({"op": "close", "sid": self.sid, "code": code, "reason": reason})
+
+
+class RelayClient:
+    """
+    Outbound relay mode: the Pi dials a relay and browsers connect to the relay instead of a tunnel
+    No inbound port, tunnel hop or pi-url lookup - the relay URL is fixed. One persistent
+    connection (permessage-deflate with the default window, which suits many sessions sharing
+    one stream) carries every browser session. Browsers connect to <relay>/<pi_id>.
+    Wire format on the relay link:
+    - control frames are JSON text starting with '{' and carry an "op":
+        Pi -> relay  hello {pi_id, token, subprotocols}; close {sid, code, reason}
+        relay -> Pi  open {sid, subprotocol, remote}; close {sid, code}; error {message}
+    - data frames are "<sid>\\n<payload>" (text) or b"<sid>\\n" + payload (binary), so payloads
+      are forwarded without re-encoding
+    Sessions get their own RelayedWebSocket and run through handle_client; after a relay drop
+    the link is re-dialled with backoff and browsers resume their sessions (see SessionManager).
+    """
+    
+    RECONNECT_DELAYS = (1, 2, 5, 10, 30)  # Seconds before each retry (last one repeats)
+    
+    def __init__(self, url: str, token: str = ''):
+        self.url = url
+        self.token = token
+        self.upstream = None
+        self.sessions: Dict[str, RelayedWebSocket] = {}
+        self._tasks = set()
+    
+    @property
+    def connected(self) -> bool:
+        return self.upstream is not None
+    
+    async def run(self):
+        """Keep the relay link up forever"""
+        failures = 0
+        while True:
+            try:
+                async with websockets.connect(
+                    self.url,
+                    max_size=server_config.max_size,
+                    ping_interval=server_config.ping_interval,
+                    ping_timeout=server_config.ping_timeout,
+                    close_timeout=server_config.close_timeout,
+                ) as upstream:
+                    failures = 0
+                    await self._serve(upstream)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("🛰️ Relay link to %s failed: %s", self.url, e, extra=rate_limited(60))
+            finally:
+                self.upstream = None
+                for ws in list(self.sessions.values()):
+                    ws.closed_by_peer(1001)
+                self.sessions.clear()
+            
+            delay = self.RECONNECT_DELAYS[min(failures, len(self.RECONNECT_DELAYS) - 1)]
+            failures += 1
+            await asyncio.sleep(delay)
+    
+    async def _serve(self, upstream):
+        await upstream.send(json.dumps({
+            "op": "hello",
+            "pi_id": get_pi_unique_id(),
+            "token": self.token,
+            "subprotocols": SUBPROTOCOLS,
+        }))
+        self.upstream = upstream
+        RELAY_CONNECTS_TOTAL.inc()
+        logger.info("🛰️ Connected to relay %s", self.url)
+        
+        async for frame in upstream:
+            if isinstance(frame, str) and frame.startswith('{'):
+                self._control(json.loads(frame))
+                continue
+            
+            sep = '\n' if isinstance(frame, str) else b'\n'
+            sid, _, payload = frame.partition(sep)
+            if isinstance(sid, bytes):
+                sid = sid.decode()
+            ws = self.sessions.get(sid)
+            if ws is not None:
+                ws.feed(payload)
+        logger.info("🛰️ Relay link closed (%s)", getattr(upstream, 'close_code', None))
+    
+    def _control(self, message: dict):
+        op = message.get('op')
+        sid = str(message.get('sid'))
+        if op == 'open':
+            ws = self.sessions[sid] = RelayedWebSocket(self, sid, message.get('subprotocol'), message.get('remote'))
+            self._spawn(self._run_session(ws))
+        elif op == 'close':
+            ws = self.sessions.pop(sid, None)
+            if ws is not None:
+                ws.closed_by_peer(message.get('code') or 1000)
+        elif op == 'error':
+            logger.error("❌ Relay rejected this Pi: %s", message.get('message'))
+        else:
+            logger.debug("Unknown relay op: %s", op)
+    
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _run_session(self, ws: RelayedWebSocket):
         try:
-            await asyncio.sleep(1.0)  # Check every 1 second
-            # Get current servo1 angle
-            current_angle = servo_controller.get_position('servo1')
-            if current_angle is not None:
-                # Update LEDs based on current angle
-                # The update_leds function will only write to GPIO if angle/state changed
-                led_controller.update_leds(current_angle)
-            else:
-                logger.warning("⚠️ LED task: Could not get servo1 angle")
-        except Exception as e:
-            logger.error(f"❌ Error in LED update task: {e}")
-            import traceback
-            traceback.print_exc()
-            await asyncio.sleep(1.0)
+            await handle_client(ws)
+        finally:
+            if self.sessions.pop(ws.sid, None) is not None and not ws.closed:
+                try:
+                    await ws.close(code=1011, reason="Server error")
+                except Exception:
+                    pass
+    
+    async def send_frame(self, sid: str, frame):
+        upstream = self.upstream
+        if upstream is None:
+            raise ConnectionError("Relay link is down")
+        if isinstance(frame, str):
+            await upstream.send(f"{sid}\n{frame}")
+        else:
+            await upstream.send(sid.encode() + b'\n' + frame)
+    
+    async def send_control(self, message: dict):
+        if self.upstream is not None:
+            await self.upstream.send(json.dumps(message))
+    
+    async def ping(self):
+        if self.upstream is None:
+            raise ConnectionError("Relay link is down")
+        return await self.upstream.ping()
+
+
+relay_client: Optional[RelayClient] = None
+
+
+class ServerConfig:
+    """
+    websockets.serve() settings, overridable with PILLPAL_* environment variables
+    Tuned for small JSON frames through a Cloudflare/ngrok tunnel: bounded per-client
+    memory, server-driven pings (sent by LivenessMonitor, which also measures RTT)
+    instead of client keepalive messages, and a small
+    permessage-deflate window (context takeover kept, so repeated keys still compress).
+    """
+    
+    # Deflate window/memory sizes: ~2 KiB window and memLevel 4 instead of zlib's 32 KiB / 8
+    DEFLATE_WINDOW_BITS = 11
+    DEFLATE_MEM_LEVEL = 4
+    
+    def __init__(self, env=None):
+        env = os.environ if env is None else env
+        self.host = env.get('PILLPAL_HOST', '0.0.0.0')  # Listen on all interfaces
+        self.port = int(env.get('PILLPAL_PORT', 8765))
+        self.max_size = int(env.get('PILLPAL_MAX_SIZE', 256 * 1024))  # Largest accepted frame (full schedule push is a few KiB)
+        self.max_queue = int(env.get('PILLPAL_MAX_QUEUE', 16))  # Incoming frames buffered per client
+        self.write_limit = int(env.get('PILLPAL_WRITE_LIMIT', 32 * 1024))  # Outgoing buffer high-water mark
+        self.ping_interval = float(env.get('PILLPAL_PING_INTERVAL', 20))  # Server ping every N seconds
+        self.ping_timeout = float(env.get('PILLPAL_PING_TIMEOUT', 20))  # Close if no pong within N seconds
+        self.close_timeout = float(env.get('PILLPAL_CLOSE_TIMEOUT', 5))
+        self.compression = env.get('PILLPAL_COMPRESSION', 'tuned')  # tuned / default / off
+        self.metrics_port = int(env.get('PILLPAL_METRICS_PORT', 9108))  # HTTP /metrics, 0 = disabled
+        self.event_db = env.get('PILLPAL_EVENT_DB', '/home/justin/pillpal/dispense_events.db')  # '' = no history
+        self.relay_url = env.get('PILLPAL_RELAY_URL', '')  # Dial out to this relay ('' = tunnel/inbound only)
+        self.relay_token = env.get('PILLPAL_RELAY_TOKEN', '')
+    
+    def serve_kwargs(self) -> dict:
+        """Keyword arguments for websockets.serve()"""
+        kwargs = {
+            'subprotocols': SUBPROTOCOLS,
+            'select_subprotocol': select_subprotocol,
+            'max_size': self.max_size,
+            'max_queue': self.max_queue,
+            'write_limit': self.write_limit,
+            'ping_interval': None,  # LivenessMonitor sends the pings (see main)
+            'close_timeout': self.close_timeout,
+        }
+        if self.compression == 'off':
+            kwargs['compression'] = None
+        elif self.compression == 'tuned' and DEFLATE_TUNING_AVAILABLE:
+            kwargs['compression'] = None  # Replaced by the explicitly configured extension below
+            kwargs['extensions'] = [ServerPerMessageDeflateFactory(
+                server_max_window_bits=self.DEFLATE_WINDOW_BITS,
+                client_max_window_bits=self.DEFLATE_WINDOW_BITS,
+                compress_settings={'memLevel': self.DEFLATE_MEM_LEVEL},
+            )]
+        return kwargs
+    
+    def describe(self) -> str:
+        compression = self.compression if self.compression != 'tuned' or DEFLATE_TUNING_AVAILABLE else 'default'
+        return (f"max_size={self.max_size} max_queue={self.max_queue} write_limit={self.write_limit} "
+                f"ping={self.ping_interval:g}s/{self.ping_timeout:g}s compression={compression}")
+
+
+server_config = ServerConfig()
+
+
+def create_app(demo_mode: bool = False, log_profile: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Build the server: configure logging and create the controllers and button monitor
+    Importing this module has no side effects - this is where they happen (main() calls it).
+    Hardware drivers are imported later, in each controller's initialize().
+    demo_mode=True builds every controller in demo mode (benchmarks, tools without hardware).
+    Returns the controllers by subsystem name.
+    """
+    global _log_listener, _controllers, button_monitor
+    global servo_controller, sms_controller, lcd_controller, led_controller, buzzer_controller
+    if _log_listener is None:
+        _log_listener = configure_logging(log_profile)
+    
+    # Set demo_mode=True for testing without hardware/SIMCOM
+    servo_controller = ServoController(demo_mode=demo_mode, defer_init=True)
+    sms_controller = SMSController(demo_mode=demo_mode, serial_port='/dev/ttyS0', baudrate=115200, defer_init=True)
+    lcd_controller = LCDController(demo_mode=demo_mode, defer_init=True)
+    led_controller = LEDController(demo_mode=demo_mode, defer_init=True)
+    buzzer_controller = BuzzerController(demo_mode=demo_mode, defer_init=True)
+    if not demo_mode:
+        load_gpio()  # The button is set up right away (RPi.GPIO itself imports quickly)
+    button_monitor = ButtonMonitor()
+    
+    _controllers = {
+        'servo': servo_controller,
+        'sms': sms_controller,
+        'lcd': lcd_controller,
+        'led': led_controller,
+        'buzzer': buzzer_controller,
+    }
+    return _controllers
+
+
+def wire_listeners(loop):
+    """Connect controllers, the schedule store and the broadcast hub (call once, on the running loop)"""
+    # Drive LEDs from servo position changes (no polling); hold times use loop timers
+    led_controller.attach_loop(loop)
+    servo_controller.add_position_listener(led_controller.on_servo_position)
+    led_controller.add_state_listener(
+        lambda state, angle: broadcast_hub.broadcast_threadsafe({
+            "type": "led_status",
+            "state": state,
+            "servo1_angle": float(angle)
+        })
+    )
+    logger.info("💡 LEDs follow servo1 position changes (event-driven)")
+    
+    # The LCD follows schedule changes as deltas; other clients learn the new version
+    schedule_store.add_listener(lambda upserted, removed, version: lcd_controller.apply_schedule_delta(upserted, removed))
+    schedule_store.add_listener(
+        lambda upserted, removed, version: broadcast_hub.broadcast({"type": "schedule_version", "version": version})
+    )
+    schedule_store.add_listener(local_scheduler.on_schedules_changed)
+
+
+_background_tasks = set()  # Strong references to main's tasks (the event loop only keeps weak ones)
+
+
+def start_background(awaitable) -> asyncio.Future:
+    """Run a coroutine or future for the server's lifetime (cancelled when main exits)"""
+    task = asyncio.ensure_future(awaitable)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
 
 
 async def main():
     """Main function - initializes all controllers and starts server"""
+    global relay_client
+    if not _controllers:
+        create_app()
     logger.info("=" * 50)
     logger.info("🚀 Starting PillPal Raspberry Pi Server")
     logger.info("=" * 50)
     
-    # Generate Pi unique ID on startup (if not already generated)
+    # Generate Pi unique ID once on startup; get_pi_id is then served from memory
     try:
         pi_unique_id = get_pi_unique_id()
-        logger.info(f"🆔 Pi Unique ID: {pi_unique_id}")
+        add_fast_reply({"type": "get_pi_id"}, pi_id_response())
+        logger.info("🆔 Pi Unique ID: %s", pi_unique_id)
     except Exception as e:
-        logger.error(f"❌ Failed to generate Pi unique ID: {e}")
+        logger.error("❌ Failed to generate Pi unique ID: %s", e)
     
     # Log initialization status
-    logger.info(f"📊 Initialization Status:")
-    logger.info(f"   - GPIO Available: {GPIO_AVAILABLE}")
-    logger.info(f"   - PCA9685 Available: {PCA9685_AVAILABLE}")
-    logger.info(f"   - LCD Available: {LCD_AVAILABLE}")
-    logger.info(f"   - Serial Available: {SERIAL_AVAILABLE}")
-    logger.info(f"   - Servo Controller: {'Demo' if servo_controller.demo_mode else 'Active'}")
-    logger.info(f"   - SMS Controller: {'Demo' if sms_controller.demo_mode else 'Active'}")
-    logger.info(f"   - LCD Controller: {'Demo' if lcd_controller.demo_mode else 'Active'}")
-    logger.info(f"   - LED Controller: {'Demo' if led_controller.demo_mode else 'Active'}, Setup: {led_controller.setup_complete}")
-    logger.info(f"   - Buzzer Controller: {'Demo' if buzzer_controller.demo_mode else 'Active'}, Setup: {buzzer_controller.setup_complete}")
+    logger.info("📊 Initialization Status:")
+    logger.info("   - Wire encodings: %s", ', '.join(SUBPROTOCOLS))
+    logger.info("   - Controllers: initializing in the background (see readiness messages)")
     logger.info("=" * 50)
-    """Start the WebSocket server"""
-    host = "0.0.0.0"  # Listen on all interfaces
-    port = 8765
+    host = server_config.host
+    port = server_config.port
     
     logger.info("=" * 50)
     logger.info("PillPal WebSocket Server Starting...")
-    logger.info(f"Listening on {host}:{port}")
+    logger.info("Listening on %s:%s", host, port)
+    logger.info("Connection settings: %s", server_config.describe())
     logger.info("Servo positions will be maintained (not reset)")
     logger.info("=" * 50)
     
-    # Initialize LEDs based on current servo1 position at startup
-    # This ensures LEDs are set correctly when server starts
-    try:
-        current_angle = servo_controller.get_position('servo1')
-        if current_angle is not None:
-            logger.info(f"🔍 Reading servo1 angle at startup: {current_angle}°")
-            # Force update LEDs at startup (bypass the angle check to ensure LEDs are set)
-            led_controller.update_leds(current_angle, force_update=True)
-            logger.info(f"💡 LEDs initialized and set for servo1 position: {current_angle}°")
-        else:
-            logger.info("🔍 Servo1 angle not available at startup, setting LEDs for 0°")
-            led_controller.update_leds(0.0, force_update=True)
-            logger.info("💡 LEDs initialized and set for servo1 position: 0°")
-    except Exception as e:
-        logger.warning(f"⚠️ Could not initialize LEDs: {e}")
-        import traceback
-        traceback.print_exc()
+    wire_listeners(asyncio.get_running_loop())
     
-    # Start button monitoring in background
-    button_task = asyncio.create_task(button_monitor.monitor_button())
+    # Restore the last synced schedules so the LCD and local scheduler work before the web app reconnects
+    saved_schedules = local_scheduler.load()
+    if saved_schedules and not schedule_store.schedules:
+        schedule_store.replace(saved_schedules)
+        logger.info("📅 Restored %s schedule(s) from the last session", len(saved_schedules))
+    
+    # On-device dispense history (history_query works even when the cloud database is unreachable)
+    if server_config.event_db:
+        try:
+            event_store.open(server_config.event_db)
+        except (OSError, sqlite3.Error) as e:
+            logger.error("❌ Could not open dispense history %s: %s", server_config.event_db, e)
+    
+    # Bring up all hardware concurrently; requests needing a device wait for it
+    start_background(hardware_readiness.start(_controllers))
+    start_background(sync_leds_at_startup())
+    
+    # Start button monitoring (edge-triggered - registers a GPIO callback and returns)
+    start_background(button_monitor.monitor_button())
     
     # Start LCD periodic update task
-    lcd_task = asyncio.create_task(lcd_update_task())
+    start_background(lcd_update_task())
+    
+    # Dispense due doses on the Pi when the web app doesn't
+    start_background(local_scheduler.run())
+    
+    # Ping clients, measure RTT and evict the ones that stopped answering
+    start_background(liveness_monitor.run(server_config.ping_interval, server_config.ping_timeout))
     
-    # Start LED periodic update task (checks servo1 angle every 1 second)
-    # This task will maintain LEDs - it only updates GPIO if angle changes
-    # LEDs will stay ON as long as angle doesn't change
-    led_task = asyncio.create_task(led_update_task())
-    logger.info("💡 LED periodic task started - will maintain LEDs based on servo1 angle")
+    # Event loop lag and blocking-call detection (pillpal_loop_* metrics, loop_stalls message)
+    start_background(loop_watchdog.run())
+    
+    # Prometheus-style /metrics endpoint on its own port, same event loop
+    metrics_server = None
+    if server_config.metrics_port:
+        try:
+            metrics_server = await serve_metrics(host, server_config.metrics_port)
+        except OSError as e:
+            logger.error("❌ Could not start metrics endpoint on port %s: %s", server_config.metrics_port, e)
+    
+    # Outbound relay link (browsers reach the Pi through the relay, no tunnel needed)
+    if server_config.relay_url:
+        relay_client = RelayClient(server_config.relay_url, server_config.relay_token)
+        start_background(relay_client.run())
+        logger.info("🛰️ Relay mode: dialling %s", server_config.relay_url)
     
     # Start WebSocket server
-    async with websockets.serve(handle_client, host, port):
-        logger.info(f"WebSocket server running on ws://{host}:{port}")
-        await asyncio.Future()  # Run forever
+    try:
+        async with websockets.serve(handle_client, host, port, **server_config.serve_kwargs()):
+            logger.info("WebSocket server running on ws://%s:%s", host, port)
+            await asyncio.Future()  # Run forever
+    finally:
+        button_monitor.stop()
+        if metrics_server is not None:
+            metrics_server.close()
+            await metrics_server.wait_closed()
+        for task in list(_background_tasks):
+            task.cancel()
+        await asyncio.gather(*_background_tasks, return_exceptions=True)
+        local_scheduler.flush()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the PillPal relay (for testing the Pi server's outbound relay mode)
+
+The Pi dials ws://<host>:<port>/pi and browsers connect to ws://<host>:<port>/<pi_id>.
+Every browser connection is multiplexed over the Pi's single link using the wire format
+described in RelayClient (pi_websocket_server_PCA9685.py): JSON control frames starting
+with '{' and "<sid>\\n<payload>" data frames.
+
+Usage:
+    python3 relay_standin.py --port 8780
+    PILLPAL_RELAY_URL=ws://localhost:8780/pi python3 pi_websocket_server_PCA9685.py
+    # then point the web app (or wscat) at ws://localhost:8780/<pi_id>
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+
+import websockets
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - relay - %(levelname)s - %(message)s')
+logger = logging.getLogger('relay')
+
+
+class PiLink:
+    """One connected Pi and the browser sessions multiplexed over its link"""
+    
+    def __init__(self, upstream, pi_id: str, subprotocols: list):
+        self.upstream = upstream
+        self.pi_id = pi_id
+        self.subprotocols = subprotocols
+        self.browsers = {}  # sid -> browser connection
+        self._sids = itertools.count(1)
+    
+    def open(self, browser) -> str:
+        sid = str(next(self._sids))
+        self.browsers[sid] = browser
+        return sid
+    
+    async def forward(self, sid: str, frame):
+        if isinstance(frame, str):
+            await self.upstream.send(f"{sid}\n{frame}")
+        else:
+            await self.upstream.send(sid.encode() + b'\n' + frame)
+
+
+class Relay:
+    def __init__(self, token: str = ''):
+        self.token = token
+        self.pis = {}  # pi_id -> PiLink
+    
+    def select_subprotocol(self, *args):
+        """Offer browsers what their Pi supports (same two call signatures as the Pi server)"""
+        if isinstance(args[0], (list, tuple)):
+            offered, supported = args[0], [p for link in self.pis.values() for p in link.subprotocols]
+        else:
+            offered = args[1]
+            link = self.pis.get(args[0].request.path.strip('/'))
+            supported = link.subprotocols if link else []
+        for subprotocol in supported:
+            if subprotocol in offered:
+                return subprotocol
+        return None
+    
+    async def handle(self, websocket, path=None):
+        if path is None:
+            path = websocket.request.path
+        name = path.strip('/')
+        if name == 'pi':
+            await self._serve_pi(websocket)
+        else:
+            await self._serve_browser(websocket, name)
+    
+    async def _serve_pi(self, upstream):
+        hello = json.loads(await upstream.recv())
+        if hello.get('op') != 'hello' or (self.token and hello.get('token') != self.token):
+            await upstream.send(json.dumps({"op": "error", "message": "Bad hello or token"}))
+            await upstream.close(code=1008, reason="Unauthorized")
+            return
+        
+        link = PiLink(upstream, hello['pi_id'], hello.get('subprotocols') or [])
+        old = self.pis.get(link.pi_id)
+        self.pis[link.pi_id] = link
+        if old is not None:
+            await old.upstream.close(code=1000, reason="Replaced by a new link")
+        logger.info("🛰️ Pi %s connected from %s", link.pi_id, upstream.remote_address)
+        
+        try:
+            # Frames are forwarded in order on this one reader (a slow browser delays the others -
+            # fine for local testing)
+            async for frame in upstream:
+                if isinstance(frame, str) and frame.startswith('{'):
+                    message = json.loads(frame)
+                    if message.get('op') == 'close':
+                        browser = link.browsers.pop(str(message.get('sid')), None)
+                        if browser is not None:
+                            await browser.close(code=message.get('code') or 1000, reason=message.get('reason') or '')
+                    continue
+                
+                sep = '\n' if isinstance(frame, str) else b'\n'
+                sid, _, payload = frame.partition(sep)
+                browser = link.browsers.get(sid if isinstance(sid, str) else sid.decode())
+                if browser is not None:
+                    try:
+                        await browser.send(payload)
+                    except websockets.exceptions.ConnectionClosed:
+                        pass  # Its handler reports the close to the Pi
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            if self.pis.get(link.pi_id) is link:
+                del self.pis[link.pi_id]
+            for browser in list(link.browsers.values()):
+                await browser.close(code=1001, reason="Pi disconnected")
+            logger.info("🛰️ Pi %s disconnected", link.pi_id)
+    
+    async def _serve_browser(self, browser, pi_id: str):
+        link = self.pis.get(pi_id)
+        if link is None:
+            await browser.close(code=1013, reason="Pi not connected")
+            return
+        
+        sid = link.open(browser)
+        remote = browser.remote_address[0] if browser.remote_address else None
+        logger.info("🌐 Browser %s -> Pi %s (session %s)", remote, pi_id, sid)
+        try:
+            await link.upstream.send(json.dumps({
+                "op": "open", "sid": sid, "subprotocol": browser.subprotocol, "remote": remote
+            }))
+            async for frame in browser:
+                await link.forward(sid, frame)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            if link.browsers.pop(sid, None) is not None:
+                try:
+                    await link.upstream.send(json.dumps({"op": "close", "sid": sid, "code": browser.close_code or 1001}))
+                except websockets.exceptions.ConnectionClosed:
+                    pass
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8780)
+    parser.add_argument('--token', default='', help='Require this token in the Pi hello')
+    args = parser.parse_args()
+    
+    relay = Relay(args.token)
+    async with websockets.serve(relay.handle, args.host, args.port, select_subprotocol=relay.select_subprotocol):
+        logger.info("Relay stand-in on ws://%s:%s (Pi: /pi, browsers: /<pi_id>)", args.host, args.port)
+        await asyncio.Future()
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
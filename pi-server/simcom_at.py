@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+AT command client for the SIMCOM modem (SIM800L/SIM900A) shared by the server and the SIMCOM tools
+
+Reads are event-driven: a command returns as soon as the modem's final result code (OK, ERROR,
++CME/+CMS ERROR) or the SMS '>' prompt arrives, instead of sleeping fixed amounts and polling.
+Nothing in the input buffer is thrown away: unsolicited result codes (URCs such as +CMTI,
++CREG, RING, "SMS Ready") that arrive between or during commands are dispatched to handlers
+registered with on_urc() and can be waited for with wait_urc().
+
+Usage:
+    from simcom_at import open_modem
+    at = open_modem('/dev/ttyS0')          # Probes baud rates until the modem answers AT
+    print(at.sim_status(), at.signal_quality(), at.registration())
+    response = at.command('AT+CSCA?')
+    if response.ok:
+        print(response.fields('+CSCA:'))
+    at.send_sms('+639171234567', 'Hello')
+
+Only pyserial is needed, and only by open_modem(); ATClient works with any object that has
+pyserial's read/write/in_waiting/timeout.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger('simcom_at')
+
+CTRL_Z = b'\x1A'  # Submits an SMS body
+ESC = b'\x1B'  # Aborts SMS input after the '>' prompt
+
+FINAL_OK = 'OK'
+FINAL_ERRORS = ('ERROR', '+CME ERROR:', '+CMS ERROR:', 'NO CARRIER', 'BUSY', 'NO ANSWER', 'NO DIALTONE')
+PROMPT = '>'
+
+# Lines the modem sends on its own; while a command runs, lines starting with the command's
+# own prefix (e.g. +CREG for AT+CREG?) are still treated as its response
+URC_PREFIXES = (
+    '+CMTI:', '+CMT:', '+CDS:', '+CREG:', '+CGREG:', '+CPIN:', '+CFUN:', '+CLIP:', '+CRING:',
+    '+CUSD:', '+CSQN:', '+CTZV:', '*PSUTTZ:', 'DST:', 'RING', 'Call Ready', 'SMS Ready',
+    'RDY', 'NORMAL POWER DOWN', 'UNDER-VOLTAGE', 'OVER-VOLTAGE',
+)
+TWO_LINE_URCS = ('+CMT:', '+CDS:')  # Header line followed by the message text
+
+# Network registration states (+CREG <stat>): 1 = home network, 5 = roaming
+REGISTRATION_STATES = {
+    0: 'not registered',
+    1: 'registered (home)',
+    2: 'searching',
+    3: 'registration denied',
+    4: 'unknown',
+    5: 'registered (roaming)',
+}
+REGISTERED = (1, 5)
+
+BAUD_RATES = (115200, 9600, 57600, 38400)  # Most SIMCOM modules ship at 115200
+
+
+def parse_fields(value: str) -> List[str]:
+    """Split an AT response value on commas outside quotes, unquoting each field"""
+    fields = []
+    current = []
+    quoted = False
+    for char in value:
+        if char == '"':
+            quoted = not quoted
+        elif char == ',' and not quoted:
+            fields.append(''.join(current).strip())
+            current = []
+        else:
+            current.append(char)
+    fields.append(''.join(current).strip())
+    return fields
+
+
+def command_prefix(command: str) -> Optional[str]:
+    """Response prefix of an extended command: 'AT+CREG?' -> '+CREG', 'AT' -> None"""
+    body = command[2:] if command[:2].upper() == 'AT' else command
+    if not body or body[0] not in '+*^$':
+        return None
+    end = 1
+    while end < len(body) and (body[end].isalnum() or body[end] == '_'):
+        end += 1
+    return body[:end].upper()
+
+
+class ATResponse:
+    """Result of one AT command"""
+    
+    def __init__(self, command: str):
+        self.command = command
+        self.lines: List[str] = []  # Information lines (no echo, URCs or result code)
+        self.final: Optional[str] = None  # OK / error line / '>' / None on timeout
+        self.elapsed = 0.0  # Seconds from write to result code
+    
+    @property
+    def ok(self) -> bool:
+        return self.final == FINAL_OK
+    
+    @property
+    def prompt(self) -> bool:
+        return self.final == PROMPT
+    
+    @property
+    def timed_out(self) -> bool:
+        return self.final is None
+    
+    @property
+    def error(self) -> Optional[str]:
+        """The error result code (or 'timeout'), None on success"""
+        if self.final is None:
+            return 'timeout'
+        if self.final in (FINAL_OK, PROMPT):
+            return None
+        return self.final
+    
+    def value(self, prefix: str) -> Optional[str]:
+        """Text after prefix on the first line that has it: value('+CSQ:') -> '20,0'"""
+        for line in self.lines:
+            if line.startswith(prefix):
+                return line[len(prefix):].strip()
+        return None
+    
+    def fields(self, prefix: str) -> List[str]:
+        value = self.value(prefix)
+        return parse_fields(value) if value is not None else []
+    
+    @property
+    def text(self) -> str:
+        """Response as the modem printed it (minus echo and URCs)"""
+        return '\n'.join(self.lines + ([self.final] if self.final else []))
+    
+    def __str__(self) -> str:
+        return self.text
+    
+    def __repr__(self) -> str:
+        return f"ATResponse({self.command!r}, final={self.final!r}, lines={self.lines!r}, {self.elapsed:.3f}s)"
+
+
+class ATClient:
+    """
+    Talks AT to a modem over an open serial port
+    Commands themselves are not thread-safe: threads sharing a client hold client.lock across
+    each exchange (the server's SMS threads and modem diagnostics do).
+    """
+    
+    READ_TIMEOUT = 0.1  # Serial read timeout - upper bound on how late a deadline is noticed
+    URC_HISTORY = 32
+    
+    def __init__(self, ser):
+        self.ser = ser
+        self.ser.timeout = self.READ_TIMEOUT
+        self.lock = threading.RLock()
+        self._buffer = bytearray()
+        self._handlers: Dict[str, List[Callable[[str], None]]] = {}
+        self.urcs = deque(maxlen=self.URC_HISTORY)  # (monotonic time, line) of recent URCs
+    
+    # --- reading ---------------------------------------------------------
+    
+    def _fill(self) -> bool:
+        """Read what the modem has sent (waits up to READ_TIMEOUT for the first byte)"""
+        data = self.ser.read(self.ser.in_waiting or 1)
+        if data:
+            self._buffer += data
+            return True
+        return False
+    
+    def _next_line(self, deadline: float, prompt: bool = False) -> Optional[str]:
+        """Next non-empty line (or the '>' prompt when expected); None once deadline passes"""
+        while True:
+            newline = self._buffer.find(b'\n')
+            while newline >= 0:
+                line = bytes(self._buffer[:newline]).decode('utf-8', errors='ignore').strip()
+                del self._buffer[:newline + 1]
+                if line:
+                    return line
+                newline = self._buffer.find(b'\n')
+            
+            if prompt and self._buffer.lstrip(b'\r\n').startswith(b'>'):
+                # The prompt is "> " with no line ending
+                self._buffer.clear()
+                return PROMPT
+            
+            if time.monotonic() >= deadline:
+                return None
+            self._fill()
+    
+    def _is_urc(self, line: str) -> bool:
+        return line.startswith(URC_PREFIXES)
+    
+    def _dispatch_urc(self, line: str, deadline: float):
+        if line.startswith(TWO_LINE_URCS):
+            text = self._next_line(max(deadline, time.monotonic() + 1.0))
+            if text is not None:
+                line = f"{line}\n{text}"
+        self.urcs.append((time.monotonic(), line))
+        logger.debug("URC: %s", line)
+        for prefix, handlers in self._handlers.items():
+            if line.startswith(prefix):
+                for handler in handlers:
+                    try:
+                        handler(line)
+                    except Exception as e:
+                        logger.warning("URC handler for %s failed: %s", prefix, e)
+    
+    def on_urc(self, prefix: str, handler: Callable[[str], None]):
+        """Call handler(line) for every URC starting with prefix (e.g. '+CMTI:')"""
+        self._handlers.setdefault(prefix, []).append(handler)
+    
+    def drain(self):
+        """Dispatch whatever the modem has already sent (URCs) without waiting"""
+        while self.ser.in_waiting:
+            self._fill()
+        deadline = time.monotonic()
+        while True:
+            line = self._next_line(deadline)
+            if line is None:
+                return
+            if self._is_urc(line):
+                self._dispatch_urc(line, deadline)
+            else:
+                logger.debug("Discarding stray line: %s", line)
+    
+    def wait_urc(self, prefix: str, timeout: float) -> Optional[str]:
+        """Wait for the next URC starting with prefix; None on timeout"""
+        deadline = time.monotonic() + timeout
+        while True:
+            line = self._next_line(deadline)
+            if line is None:
+                return None
+            if not self._is_urc(line):
+                logger.debug("Discarding stray line: %s", line)
+                continue
+            self._dispatch_urc(line, deadline)
+            if line.startswith(prefix):
+                return self.urcs[-1][1]
+    
+    # --- commands --------------------------------------------------------
+    
+    def write(self, data: bytes):
+        self.ser.write(data)
+    
+    def command(self, command: str, timeout: float = 5.0, expect_prompt: bool = False) -> ATResponse:
+        """
+        Send one command and read its response up to the final result code
+        expect_prompt=True also stops at the '>' prompt (AT+CMGS). A serial failure is
+        reported as the response's final line instead of raising. Commands concatenated with
+        ';' run in one round trip and return all their lines in one response.
+        """
+        response = ATResponse(command)
+        # Concatenated commands (AT+CSQ;+CREG?) answer with one line per part, then one OK
+        prefixes = tuple(prefix for prefix in map(command_prefix, command.split(';')) if prefix)
+        started = time.monotonic()
+        deadline = started + timeout
+        try:
+            self.drain()
+            self.write(f"{command}\r".encode())
+            while True:
+                line = self._next_line(deadline, prompt=expect_prompt)
+                if line is None:
+                    break
+                if line == command:
+                    continue  # Echo (ATE1)
+                if line == PROMPT or line == FINAL_OK or line.startswith(FINAL_ERRORS):
+                    response.final = line
+                    break
+                if self._is_urc(line) and not line.upper().startswith(prefixes):
+                    self._dispatch_urc(line, deadline)
+                    continue
+                response.lines.append(line)
+        except OSError as e:  # pyserial's SerialException is an OSError
+            response.final = f"ERROR: {e}"
+        response.elapsed = time.monotonic() - started
+        logger.debug("%s -> %s (%.3fs)", command, response.final, response.elapsed)
+        return response
+    
+    def send_body(self, text: str, timeout: float = 30.0) -> ATResponse:
+        """After the '>' prompt: send the SMS body, submit with Ctrl+Z and wait for +CMGS/OK"""
+        response = ATResponse('<sms body>')
+        started = time.monotonic()
+        deadline = started + timeout
+        try:
+            self.write(text.encode('utf-8') + CTRL_Z)
+            while True:
+                line = self._next_line(deadline)
+                if line is None:
+                    break
+                if line == FINAL_OK or line.startswith(FINAL_ERRORS):
+                    response.final = line
+                    break
+                if line.startswith('+CMGS:'):
+                    response.lines.append(line)
+                elif self._is_urc(line):
+                    self._dispatch_urc(line, deadline)
+                # Anything else is the echoed body
+        except OSError as e:
+            response.final = f"ERROR: {e}"
+        response.elapsed = time.monotonic() - started
+        return response
+    
+    def cancel(self) -> bool:
+        """Abort any SMS input in progress and check the modem answers again"""
+        try:
+            self.write(ESC)
+        except OSError:
+            return False
+        return self.sync(attempts=2, timeout=1.0)
+    
+    def sync(self, attempts: int = 3, timeout: float = 1.0) -> bool:
+        """Send AT until the modem answers OK (resynchronizes after garbage or a stuck prompt)"""
+        for attempt in range(attempts):
+            if self.command('AT', timeout=timeout).ok:
+                return True
+            try:
+                self.write(ESC)
+            except OSError:
+                return False
+        return False
+    
+    # --- parsed queries ----------------------------------------------------
+    
+    def sim_status(self) -> Optional[str]:
+        """'READY', 'SIM PIN', 'SIM PUK', ... or None if the modem reports no SIM / no answer"""
+        response = self.command('AT+CPIN?')
+        return response.value('+CPIN:') if response.ok else None
+    
+    def signal_quality(self) -> Optional[Tuple[int, int]]:
+        """(rssi 0-31 or 99 = unknown, bit error rate) or None"""
+        fields = self.command('AT+CSQ').fields('+CSQ:')
+        try:
+            return int(fields[0]), int(fields[1])
+        except (IndexError, ValueError):
+            return None
+    
+    def registration(self, command: str = 'CREG') -> Optional[int]:
+        """Network registration state (see REGISTRATION_STATES), CREG or CGREG; None if unknown"""
+        fields = self.command(f'AT+{command}?').fields(f'+{command}:')
+        # Query response is <n>,<stat>[,<lac>,<ci>]
+        try:
+            return int(fields[1])
+        except (IndexError, ValueError):
+            return None
+    
+    def wait_registered(self, timeout: float) -> Optional[int]:
+        """
+        Wait for network registration using +CREG URCs (enabled here with AT+CREG=1)
+        Returns the last known state - in REGISTERED on success.
+        """
+        started = time.monotonic()
+        deadline = started + timeout
+        self.command('AT+CREG=1', timeout=2)
+        stat = self.registration()
+        if stat not in REGISTERED:
+            # A URC drained by the commands above may already report the change
+            seen = [line for at, line in self.urcs if at >= started and line.startswith('+CREG:')]
+            if seen:
+                stat = self._creg_urc_stat(seen[-1], stat)
+        while stat not in REGISTERED:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            urc = self.wait_urc('+CREG:', remaining)
+            if urc is None:
+                break
+            stat = self._creg_urc_stat(urc, stat)
+        return stat
+    
+    @staticmethod
+    def _creg_urc_stat(urc: str, default: Optional[int]) -> Optional[int]:
+        # URC is +CREG: <stat>[,<lac>,<ci>] (the query response has <n> first)
+        try:
+            return int(parse_fields(urc[len('+CREG:'):])[0])
+        except ValueError:
+            return default
+    
+    def service_center(self) -> Optional[str]:
+        """SMS service center number from AT+CSCA?, None if unset or unknown"""
+        fields = self.command('AT+CSCA?').fields('+CSCA:')
+        return (fields[0] or None) if fields else None
+    
+    def send_sms(self, number: str, text: str, prompt_timeout: float = 10.0,
+                 send_timeout: float = 30.0) -> ATResponse:
+        """
+        Send one text-mode SMS (AT+CMGF=1 must already be set)
+        Returns the submit response: ok with a '+CMGS: <ref>' line on success. Without a
+        prompt, input is aborted and the AT+CMGS response is returned.
+        """
+        prompt = self.command(f'AT+CMGS="{number}"', timeout=prompt_timeout, expect_prompt=True)
+        if not prompt.prompt:
+            self.cancel()
+            return prompt
+        response = self.send_body(text, timeout=send_timeout)
+        if response.timed_out:
+            self.cancel()
+        return response
+
+
+def open_modem(port: str, baudrates=BAUD_RATES, attempts: int = 3, timeout: float = 1.0) -> Optional[ATClient]:
+    """Open port at the first baud rate the modem answers AT on; None if none does"""
+    import serial
+    
+    for baud in baudrates:
+        ser = None
+        try:
+            ser = serial.Serial(port=port, baudrate=baud, timeout=ATClient.READ_TIMEOUT, write_timeout=3)
+            client = ATClient(ser)
+            if client.sync(attempts=attempts, timeout=timeout):
+                logger.info("Modem on %s answering at %s baud", port, baud)
+                return client
+            logger.debug("No answer on %s at %s baud", port, baud)
+        except (OSError, ValueError) as e:
+            logger.debug("Could not open %s at %s baud: %s", port, baud, e)
+        if ser is not None:
+            ser.close()
+    return None
+
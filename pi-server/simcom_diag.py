@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+One-shot SIMCOM modem diagnostics with a JSON report
+
+Runs a declarative check plan (SIM, signal, registration, operator, SMS service center,
+SMS mode...) over one open port. Checks whose responses carry their own +XXX: prefix are
+concatenated into a single command line (AT+CPIN?;+CSQ;+CREG?...) so the whole plan takes a
+couple of round trips instead of one probe, sleep and read per check.
+
+Usage:
+    python3 simcom_diag.py                      # Finds the port, prints the report
+    python3 simcom_diag.py --port /dev/ttyS0 --only sim,signal,registration
+
+    from simcom_diag import run_plan
+    report = run_plan(at)                       # at: an open simcom_at.ATClient
+
+The running server exposes the same report through the 'modem_diagnostics' websocket
+message, on the port it already holds.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from simcom_at import (BAUD_RATES, REGISTERED, REGISTRATION_STATES, ATClient, ATResponse,
+                       command_prefix, open_modem)
+
+PASS, WARN, FAIL = 'pass', 'warn', 'fail'
+
+COMMON_PORTS = ('/dev/ttyUSB0', '/dev/ttyUSB1', '/dev/ttyAMA0', '/dev/ttyS0')
+
+MAX_LINE = 500  # SIM800 accepts up to 556 characters per command line
+
+Evaluation = Tuple[str, Any, str]  # (status, value, detail)
+
+
+class Check:
+    """One entry of a diagnostics plan"""
+    
+    def __init__(self, name: str, command: str, evaluate: Callable[[ATResponse], Evaluation],
+                 timeout: float = 5.0, batch: bool = True):
+        self.name = name
+        self.command = command
+        self.evaluate = evaluate
+        self.timeout = timeout
+        # Only commands answering with a +XXX: line can share a line with others - their
+        # replies are told apart by prefix (ATI and AT+CGMR print bare text)
+        self.batch = batch and command_prefix(command) is not None
+        self.prefix = f"{command_prefix(command)}:" if self.batch else None
+
+
+def _int(fields: List[str], index: int) -> Optional[int]:
+    try:
+        return int(fields[index])
+    except (IndexError, ValueError):
+        return None
+
+
+def check_text(response: ATResponse) -> Evaluation:
+    if not response.ok:
+        return WARN, None, f"No answer ({response.error})"
+    return PASS, ' '.join(response.lines), ''
+
+
+def check_sim(response: ATResponse) -> Evaluation:
+    status = response.value('+CPIN:')
+    if status == 'READY':
+        return PASS, status, 'SIM ready'
+    if status in ('SIM PIN', 'SIM PIN2'):
+        return WARN, status, 'SIM needs its PIN'
+    if status is None:
+        return FAIL, None, f"No SIM detected ({response.error or 'no +CPIN line'})"
+    return FAIL, status, 'SIM locked or not usable'
+
+
+def check_signal(response: ATResponse) -> Evaluation:
+    fields = response.fields('+CSQ:')
+    rssi, ber = _int(fields, 0), _int(fields, 1)
+    if rssi is None:
+        return FAIL, None, f"No signal report ({response.error or 'no +CSQ line'})"
+    value = {"rssi": rssi, "ber": ber, "dbm": None if rssi == 99 else -113 + 2 * rssi}
+    if rssi in (0, 99):
+        return FAIL, value, 'No signal'
+    if rssi < 10:
+        return WARN, value, f"Weak signal ({rssi}/31) - SMS may fail"
+    return PASS, value, f"{rssi}/31"
+
+
+def _registration(response: ATResponse, prefix: str, missing: str) -> Evaluation:
+    fields = response.fields(prefix)
+    # Query response is <n>,<stat>[,<lac>,<ci>]
+    stat = _int(fields, 1)
+    if stat is None:
+        return missing, None, f"No registration report ({response.error or 'no ' + prefix + ' line'})"
+    value = {"stat": stat, "state": REGISTRATION_STATES.get(stat, 'unknown'),
+             "lac": fields[2] if len(fields) > 2 else None, "ci": fields[3] if len(fields) > 3 else None}
+    if stat in REGISTERED:
+        return PASS, value, value['state']
+    return (WARN if stat == 2 else missing), value, value['state']
+
+
+def check_registration(response: ATResponse) -> Evaluation:
+    return _registration(response, '+CREG:', FAIL)
+
+
+def check_gprs_registration(response: ATResponse) -> Evaluation:
+    # SMS only needs CS registration; GPRS is informational
+    return _registration(response, '+CGREG:', WARN)
+
+
+def check_operator(response: ATResponse) -> Evaluation:
+    fields = response.fields('+COPS:')
+    if not fields:
+        return FAIL, None, f"No operator report ({response.error or 'no +COPS line'})"
+    operator = fields[2] if len(fields) > 2 else None
+    value = {"mode": _int(fields, 0), "operator": operator}
+    if not operator:
+        return WARN, value, 'No operator selected'
+    return PASS, value, operator
+
+
+def check_service_center(response: ATResponse) -> Evaluation:
+    fields = response.fields('+CSCA:')
+    number = fields[0] if fields else None
+    if not number:
+        return FAIL, None, 'SMS service center not set (fix_sms_service_center.py sets it)'
+    return PASS, {"number": number, "type": _int(fields, 1)}, number
+
+
+def check_sms_mode(response: ATResponse) -> Evaluation:
+    mode = _int(response.fields('+CMGF:'), 0)
+    if mode is None:
+        return FAIL, None, f"No SMS mode report ({response.error or 'no +CMGF line'})"
+    if mode != 1:
+        return WARN, mode, 'PDU mode - the server switches to text mode before sending'
+    return PASS, mode, 'text mode'
+
+
+def check_sms_storage(response: ATResponse) -> Evaluation:
+    fields = response.fields('+CPMS:')
+    used, total = _int(fields, 1), _int(fields, 2)
+    if used is None or total is None:
+        return WARN, None, f"No storage report ({response.error or 'no +CPMS line'})"
+    value = {"storage": fields[0], "used": used, "total": total}
+    if used >= total:
+        return WARN, value, 'SMS storage full - incoming messages are dropped'
+    return PASS, value, f"{used}/{total} used"
+
+
+def check_supply(response: ATResponse) -> Evaluation:
+    # +CBC: <bcs>,<bcl>,<voltage mV>; the SIM800L resets below ~3.4 V when transmitting
+    millivolts = _int(response.fields('+CBC:'), 2)
+    if millivolts is None:
+        return WARN, None, f"No supply report ({response.error or 'no +CBC line'})"
+    if millivolts < 3500:
+        return WARN, millivolts, f"Low supply ({millivolts} mV) - module may reset while sending"
+    return PASS, millivolts, f"{millivolts} mV"
+
+
+DEFAULT_PLAN = (
+    Check('modem', 'ATI', check_text, batch=False),
+    Check('firmware', 'AT+CGMR', check_text, batch=False),
+    Check('sim', 'AT+CPIN?', check_sim),
+    Check('signal', 'AT+CSQ', check_signal),
+    Check('registration', 'AT+CREG?', check_registration),
+    Check('gprs_registration', 'AT+CGREG?', check_gprs_registration),
+    Check('operator', 'AT+COPS?', check_operator, timeout=10.0),
+    Check('service_center', 'AT+CSCA?', check_service_center),
+    Check('sms_mode', 'AT+CMGF?', check_sms_mode),
+    Check('sms_storage', 'AT+CPMS?', check_sms_storage),
+    Check('supply', 'AT+CBC', check_supply),
+)
+
+
+def select_plan(names: Optional[List[str]] = None, plan=DEFAULT_PLAN) -> List[Check]:
+    """Checks of plan with the given names (all when names is empty); ValueError on unknown names"""
+    if not names:
+        return list(plan)
+    known = {check.name: check for check in plan}
+    unknown = [name for name in names if name not in known]
+    if unknown:
+        raise ValueError(f"Unknown check(s): {', '.join(map(str, unknown))} (known: {', '.join(known)})")
+    return [check for check in plan if check.name in names]
+
+
+def _batches(checks: List[Check]) -> List[List[Check]]:
+    """Group batchable checks into command lines that fit the modem's line buffer"""
+    batches, current, length = [], [], 2
+    for check in checks:
+        part = len(check.command) - 1  # 'AT+CSQ' joins as ';+CSQ'
+        if current and length + part > MAX_LINE:
+            batches.append(current)
+            current, length = [], 2
+        current.append(check)
+        length += part
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _run_batch(at: ATClient, checks: List[Check]) -> Tuple[Dict[str, ATResponse], int]:
+    """
+    Run checks as concatenated command lines; returns ({name: response}, round trips)
+    The modem stops at the first failing command, so on an error the check that got no line
+    takes the error and the rest go out on a new line.
+    """
+    responses = {}
+    round_trips = 0
+    pending = list(checks)
+    while pending:
+        line = 'AT' + ';'.join(check.command[2:] for check in pending)
+        batch = at.command(line, timeout=sum(check.timeout for check in pending))
+        round_trips += 1
+        for check in pending:
+            response = ATResponse(check.command)
+            response.lines = [text for text in batch.lines if text.startswith(check.prefix)]
+            response.elapsed = batch.elapsed
+            responses[check.name] = response
+        if batch.ok or batch.timed_out:
+            for check in pending:
+                responses[check.name].final = batch.final
+            break
+        # Checks before the failing one answered; the first one without a line failed
+        answered = 0
+        while answered < len(pending) and responses[pending[answered].name].lines:
+            responses[pending[answered].name].final = 'OK'
+            answered += 1
+        if answered < len(pending):
+            responses[pending[answered].name].final = batch.final
+            answered += 1
+        pending = pending[answered:]
+    return responses, round_trips
+
+
+def run_plan(at: ATClient, plan=DEFAULT_PLAN) -> dict:
+    """Run every check of plan on an open client and build the report (holds at.lock throughout)"""
+    checks = list(plan)
+    started = time.monotonic()
+    responses: Dict[str, ATResponse] = {}
+    round_trips = 0
+    
+    with at.lock:
+        for check in checks:
+            if not check.batch:
+                responses[check.name] = at.command(check.command, timeout=check.timeout)
+                round_trips += 1
+        for batch in _batches([check for check in checks if check.batch]):
+            batch_responses, trips = _run_batch(at, batch)
+            responses.update(batch_responses)
+            round_trips += trips
+        urcs = [line for at_time, line in at.urcs if at_time >= started]
+    
+    results = []
+    summary = {PASS: 0, WARN: 0, FAIL: 0}
+    for check in checks:
+        response = responses[check.name]
+        try:
+            status, value, detail = check.evaluate(response)
+        except Exception as e:
+            status, value, detail = FAIL, None, f"Could not evaluate: {e}"
+        summary[status] += 1
+        results.append({
+            "name": check.name,
+            "command": check.command,
+            "status": status,
+            "value": value,
+            "detail": detail,
+            "response": response.lines + ([response.final] if response.final else []),
+        })
+    
+    return {
+        "port": getattr(at.ser, 'port', None),
+        "baudrate": getattr(at.ser, 'baudrate', None),
+        "timestamp": datetime.now().isoformat(timespec='seconds'),
+        "elapsed_ms": round((time.monotonic() - started) * 1000, 1),
+        "round_trips": round_trips,
+        "ok": summary[FAIL] == 0,
+        "summary": summary,
+        "checks": results,
+        "urcs": urcs,
+    }
+
+
+def find_port() -> Optional[str]:
+    """First SIMCOM-looking serial port on this machine (same search order as the server)"""
+    for port in COMMON_PORTS:
+        if os.path.exists(port):
+            return port
+    try:
+        import serial.tools.list_ports
+        for port in serial.tools.list_ports.comports():
+            if 'USB' in port.device:
+                return port.device
+    except ImportError:
+        pass
+    return None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--port', help='Serial port (default: first of %s found)' % ', '.join(COMMON_PORTS))
+    parser.add_argument('--baud', type=int, help='Baud rate (default: probe %s)' % ', '.join(map(str, BAUD_RATES)))
+    parser.add_argument('--only', default='', help='Comma-separated check names: %s' % ', '.join(c.name for c in DEFAULT_PLAN))
+    parser.add_argument('--indent', type=int, default=2, help='JSON indent (0 for one line)')
+    args = parser.parse_args()
+    
+    try:
+        plan = select_plan([name.strip() for name in args.only.split(',') if name.strip()])
+    except ValueError as e:
+        parser.error(str(e))
+    
+    port = args.port or find_port()
+    if port is None:
+        print(json.dumps({"ok": False, "error": "No serial port found"}))
+        return 2
+    at = open_modem(port, (args.baud,) if args.baud else BAUD_RATES)
+    if at is None:
+        print(json.dumps({"ok": False, "port": port, "error": "Modem not answering AT"}))
+        return 2
+    
+    try:
+        report = run_plan(at, plan)
+    finally:
+        at.ser.close()
+    print(json.dumps(report, indent=args.indent or None))
+    return 0 if report['ok'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,31 +5,14 @@ Configures the SIMCOM module to use a specific phone number as the sender
 Note: This is carrier-dependent and may not work on all networks
 """
 
-import serial
-import time
 import sys
+import os
 
-def send_at_command(ser, command, timeout=5):
-    """Send AT command and get response"""
-    try:
-        ser.reset_input_buffer()
-        time.sleep(0.2)
-        ser.write(f"{command}\r\n".encode())
-        time.sleep(0.3)
-        
-        response = ""
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            if ser.in_waiting > 0:
-                chunk = ser.read(ser.in_waiting).decode('utf-8', errors='ignore')
-                response += chunk
-                if 'OK' in response or 'ERROR' in response:
-                    break
-            time.sleep(0.1)
-        
-        return response.strip()
-    except Exception as e:
-        return f"ERROR: {e}"
+try:
+    from simcom_at import open_modem
+except ImportError:  # Run from the repo root: the shared AT client lives in pi-server/
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pi-server'))
+    from simcom_at import open_modem
 
 def set_sender_number():
     """Set SMS sender number"""
@@ -48,22 +31,20 @@ def set_sender_number():
     print(f"Connecting to {port} at {baudrate} baud...")
     print()
     
-    try:
-        ser = serial.Serial(port=port, baudrate=baudrate, timeout=5, writeTimeout=5)
-        time.sleep(2)
-        print("✅ Connected")
-    except Exception as e:
-        print(f"❌ Connection failed: {e}")
+    at = open_modem(port, (baudrate,))
+    if at is None:
+        print("❌ Connection failed: module not answering AT")
         return False
+    print("✅ Connected")
     
     # Check current SIM card number
     print()
     print("STEP 1: Checking current SIM card number...")
     print("-" * 70)
-    response = send_at_command(ser, "AT+CNUM")
+    response = at.command("AT+CNUM")
     print(f"Response: {response}")
     
-    if "+CNUM:" in response:
+    if response.value("+CNUM:") is not None:
         print("   ✅ SIM card number detected")
     else:
         print("   ⚠️ Could not read SIM card number")
@@ -72,7 +53,7 @@ def set_sender_number():
     print()
     print("STEP 2: Checking phonebook...")
     print("-" * 70)
-    response = send_at_command(ser, "AT+CPBR=1")
+    response = at.command("AT+CPBR=1")
     print(f"Response: {response}")
     
     # Method 1: Try to set via phonebook (may not work on all carriers)
@@ -84,10 +65,10 @@ def set_sender_number():
     # Try to write sender number to phonebook position 1
     # Format: AT+CPBW=<index>,"<number>",<type>,"<name>"
     # Type 129 = national number with name
-    response = send_at_command(ser, f'AT+CPBW=1,"{sender_number}",129,"PillPal"', timeout=5)
+    response = at.command(f'AT+CPBW=1,"{sender_number}",129,"PillPal"', timeout=5)
     print(f"   Response: {response}")
     
-    if "OK" in response:
+    if response.ok:
         print("   ✅ Phonebook entry written (may not affect sender number)")
     else:
         print("   ⚠️ Phonebook write failed or not supported")
@@ -96,21 +77,21 @@ def set_sender_number():
     print()
     print("STEP 4: Checking SMS service center...")
     print("-" * 70)
-    response = send_at_command(ser, "AT+CSCA?")
+    response = at.command("AT+CSCA?")
     print(f"Response: {response}")
     
     # Method 3: Try AT+CSCS (character set) - doesn't change sender but ensures compatibility
     print()
     print("STEP 5: Setting character set...")
     print("-" * 70)
-    response = send_at_command(ser, 'AT+CSCS="GSM"')
+    response = at.command('AT+CSCS="GSM"')
     print(f"Response: {response}")
     
     # Method 4: Check if module supports setting own number
     print()
     print("STEP 6: Checking module capabilities...")
     print("-" * 70)
-    response = send_at_command(ser, "AT+CNUM")
+    response = at.command("AT+CNUM")
     print(f"Response: {response}")
     
     # Final summary
@@ -146,7 +127,7 @@ def set_sender_number():
     print("- This ensures 'PillPal' appears in the message even if sender shows differently")
     print()
     
-    ser.close()
+    at.ser.close()
     return True
 
 if __name__ == "__main__":
@@ -6,14 +6,78 @@ let reconnectAttempts = 0
 const MAX_RECONNECT_ATTEMPTS = Infinity // Keep trying to reconnect forever
 let buttonPressCallback: ((pressed: boolean) => void) | null = null
 let connectionStatusCallback: ((connected: boolean) => void) | null = null
-let messageHandlers: Map<string, (response: any) => void> = new Map()
-let keepAliveInterval: NodeJS.Timeout | null = null
-const KEEPALIVE_INTERVAL = 10000 // Send ping every 10 seconds to keep connection alive (very frequent to prevent 1-minute timeout)
+// In-flight requests keyed by request_id (the Pi echoes it in every reply, so replies can
+// arrive out of order and several requests of the same type can be in flight at once)
+interface PendingRequest {
+  type: string
+  resolve: (response: any) => void
+  timeout: NodeJS.Timeout
+}
+let pendingRequests: Map<string, PendingRequest> = new Map()
+let requestCounter = 0
+// No application-level keepalive: the Pi sends protocol-level pings every 20 s, which the
+// browser answers automatically and which keep the tunnel from idling the connection out
 let connectionCheckInterval: NodeJS.Timeout | null = null
 const CONNECTION_CHECK_INTERVAL = 5000 // Check connection every 5 seconds (very frequent to catch disconnections quickly)
 let urlRefreshInterval: NodeJS.Timeout | null = null
 const URL_REFRESH_INTERVAL = 60000 // Check for URL changes every 60 seconds
 let currentUrl: string | null = null
+// Protocol features advertised by the Pi in its server_info frame (empty for older servers)
+let serverFeatures: Set<string> = new Set()
+// Schedules the Pi has acknowledged (key -> serialized schedule) and the Pi's store version,
+// so updateLCDSchedules only sends deltas. Reset on every new connection.
+let syncedSchedules: Map<string, string> = new Map()
+let scheduleVersion: number | null = null
+// Local scheduler settings (resent on every connection) and the handler that logs doses the
+// Pi dispensed on its own while no browser was connected
+let schedulerConfig: {enabled?: boolean, automatic?: boolean, phoneNumbers?: string[]} | null = null
+let localDispenseCallback: ((dispense: PiLocalDispense) => Promise<void> | void) | null = null
+let reconcilingKeys: Set<string> = new Set()
+// Resumable session on the Pi: it numbers every reply/event (seq) and keeps recent ones, so
+// after a tunnel drop the reconnect replays what was missed - including replies to requests
+// still pending here. Kept across reconnects (unlike the state above).
+let sessionId: string | null = null
+let lastSeq = 0
+
+function nextRequestId(): string {
+  requestCounter++
+  return `${Date.now().toString(36)}-${requestCounter}`
+}
+
+// Send a request to the Pi and resolve with its reply (matched by request_id)
+function sendRequest(message: Record<string, any>, timeoutMs: number): Promise<any> {
+  return new Promise((resolve, reject) => {
+    const requestId = nextRequestId()
+    const timeout = setTimeout(() => {
+      console.error(` ${message.type} timeout - no response from Pi`)
+      pendingRequests.delete(requestId)
+      reject(new Error('Timeout - Pi did not respond'))
+    }, timeoutMs)
+
+    pendingRequests.set(requestId, { type: message.type, resolve, timeout })
+    ws!.send(JSON.stringify({ ...message, request_id: requestId }))
+  })
+}
+
+// Complete the pending request a reply belongs to. Returns false if it matched none.
+function resolvePendingRequest(response: any): boolean {
+  let requestId: string | undefined = response.request_id !== undefined ? String(response.request_id) : undefined
+  if (requestId === undefined) {
+    // Servers that echo request_id never reply without one - an uncorrelated message isn't ours
+    if (serverFeatures.has('request_id')) return false
+    // Older Pi servers don't echo request_id but always reply in arrival order
+    requestId = pendingRequests.keys().next().value
+  }
+  if (requestId === undefined) return false
+
+  const pending = pendingRequests.get(requestId)
+  if (!pending) return false
+  clearTimeout(pending.timeout)
+  pendingRequests.delete(requestId)
+  console.log(` ${pending.type} response received:`, response)
+  pending.resolve(response)
+  return true
+}
 
 // Verify Pi unique ID with server
 async function verifyPiUniqueId(piUniqueId: string): Promise<void> {
@@ -186,6 +250,11 @@ export async function connectToPi(): Promise<void> {
 
     try {
       console.log('🚀 Creating WebSocket with normalized URL:', PI_URL)
+      serverFeatures = new Set()
+      syncedSchedules = new Map()
+      scheduleVersion = null
+      // No subprotocol offered: the app stays on JSON on purpose (the Pi's msgpack/CBOR codecs are
+      // for other clients); payloads are kept small with compact records instead
       ws = new WebSocket(PI_URL)
     } catch (error) {
       console.error('❌ Failed to create WebSocket:', error)
@@ -229,34 +298,6 @@ export async function connectToPi(): Promise<void> {
         connectionStatusCallback(true)
       }
       
-      // Start keepalive ping to prevent connection timeout
-      if (keepAliveInterval) {
-        clearInterval(keepAliveInterval)
-      }
-      keepAliveInterval = setInterval(() => {
-        if (ws && ws.readyState === WebSocket.OPEN) {
-          try {
-            // Send ping message to keep connection alive
-            // Note: Server may not support ping, but sending it helps keep the connection active
-            ws.send(JSON.stringify({ type: 'ping' }))
-            // Don't log every ping to reduce console noise
-            // console.log('💓 Keepalive ping sent')
-          } catch (error) {
-            console.error('Error sending keepalive ping:', error)
-            // If ping fails, connection might be dead - trigger reconnect
-            if (ws) {
-              ws.close()
-            }
-          }
-        } else {
-          // Connection is closed, clear interval
-          if (keepAliveInterval) {
-            clearInterval(keepAliveInterval)
-            keepAliveInterval = null
-          }
-        }
-      }, KEEPALIVE_INTERVAL)
-      
       // Start connection health check (more frequent to catch disconnections quickly)
       if (connectionCheckInterval) {
         clearInterval(connectionCheckInterval)
@@ -328,12 +369,6 @@ export async function connectToPi(): Promise<void> {
         connectionStatusCallback(false)
       }
       
-      // Clear keepalive interval
-      if (keepAliveInterval) {
-        clearInterval(keepAliveInterval)
-        keepAliveInterval = null
-      }
-      
       // Clear connection check interval
       if (connectionCheckInterval) {
         clearInterval(connectionCheckInterval)
@@ -376,6 +411,12 @@ export async function connectToPi(): Promise<void> {
         console.log('📨 Parsed WebSocket message:', response)
         console.log('📨 Message type:', response.type || 'NO TYPE FIELD')
         
+        // Session frames are numbered: skip any already seen (e.g. replayed twice)
+        if (typeof response.seq === 'number') {
+          if (response.seq <= lastSeq) return
+          lastSeq = response.seq
+        }
+        
         // ALWAYS handle button press events first (highest priority)
         // Check for button_press type regardless of other handlers
         if (response.type === 'button_press') {
@@ -397,6 +438,37 @@ export async function connectToPi(): Promise<void> {
           return // Don't process ping/pong as regular messages
         }
         
+        // Capabilities the Pi sends right after connecting
+        if (response.type === 'server_info') {
+          serverFeatures = new Set(response.features || [])
+          console.log('ℹ️ Pi server features:', Array.from(serverFeatures))
+          if (serverFeatures.has('sessions')) {
+            resumePiSession().catch((error) => console.error('❌ Pi session resume failed:', error))
+          }
+          if (serverFeatures.has('local_scheduler')) {
+            syncPiScheduler().catch((error) => console.error('❌ Pi scheduler sync failed:', error))
+          }
+          return
+        }
+        
+        // The Pi's local scheduler dispensed a dose because no browser did
+        if (response.type === 'local_dispense') {
+          console.log(`⏰ Pi dispensed ${response.key} on its own (${response.status})`)
+          reconcileLocalDispenses([response]).catch((error) => console.error('❌ Local dispense reconcile failed:', error))
+          return
+        }
+        
+        // Pi hardware coming up in the background after a restart (requests wait for it on the Pi)
+        if (response.type === 'readiness') {
+          console.log(`🟢 Pi ${response.subsystem} ${response.state}`)
+          return
+        }
+        
+        // Another client changed the Pi's schedules - our next delta's base_version catches it
+        if (response.type === 'schedule_version') {
+          return
+        }
+        
         // Handle Pi unique ID response
         if (response.type === 'pi_id') {
           const piUniqueId = response.pi_unique_id
@@ -410,49 +482,23 @@ export async function connectToPi(): Promise<void> {
           return
         }
         
-        // Handle error responses for ping (server doesn't support ping, that's okay)
-        if (response.status === 'error' && response.message && response.message.includes('ping')) {
-          // Server doesn't support ping messages - that's fine, connection is still alive
-          console.log('Server doesn\'t support ping (connection still alive)')
-          return // Ignore this error, connection is working
+        // Replies to our requests carry the request_id we sent
+        if (response.request_id !== undefined) {
+          if (!resolvePendingRequest(response)) {
+            console.log('📨 Reply for unknown/expired request:', response.request_id)
+          }
+          return
         }
         
-        // Handle responses with explicit type field
-        if (response.type && messageHandlers.has(response.type)) {
-          const handler = messageHandlers.get(response.type)!
-          handler(response)
-          messageHandlers.delete(response.type) // Remove one-time handler
+        // Replies from older Pi servers have a status field but no request_id or type
+        if (response.status && !response.type && resolvePendingRequest(response)) {
           return
         }
         
-        // Handle responses without type field (legacy format or direct responses)
-        // Check if it looks like a dispense/servo2/sms response (has status field)
-        if (response.status && !response.type) {
-          // Try to match based on context - check registered handlers
-          // For dispense responses, check if we have a 'dispense' handler waiting
-          if (messageHandlers.has('dispense')) {
-            console.log('📨 Handling response as dispense (no type field)')
-            const handler = messageHandlers.get('dispense')!
-            handler(response)
-            messageHandlers.delete('dispense')
-            return
-          }
-          // For servo2 responses
-          if (messageHandlers.has('servo2_dispense')) {
-            console.log('📨 Handling response as servo2_dispense (no type field)')
-            const handler = messageHandlers.get('servo2_dispense')!
-            handler(response)
-            messageHandlers.delete('servo2_dispense')
-            return
-          }
-          // For SMS responses
-          if (messageHandlers.has('send_sms')) {
-            console.log('📨 Handling response as send_sms (no type field)')
-            const handler = messageHandlers.get('send_sms')!
-            handler(response)
-            messageHandlers.delete('send_sms')
-            return
-          }
+        // The Pi couldn't read one of our frames (no request_id to match it to)
+        if (response.type === 'error') {
+          console.error('❌ Pi rejected a message:', response.message)
+          return
         }
         
         // Log unhandled messages
@@ -469,12 +515,6 @@ export async function connectToPi(): Promise<void> {
 }
 
 export function disconnectFromPi() {
-  // Clear keepalive interval
-  if (keepAliveInterval) {
-    clearInterval(keepAliveInterval)
-    keepAliveInterval = null
-  }
-  
   // Clear connection check interval
   if (connectionCheckInterval) {
     clearInterval(connectionCheckInterval)
@@ -535,7 +575,7 @@ if (typeof window !== 'undefined') {
   };
 }
 
-export function dispenseToPi(servoId: string, medication: string, targetAngle?: number, date?: string, time?: string, timeFrame?: string): Promise<any> {
+export function dispenseToPi(servoId: string, medication: string, targetAngle?: number, date?: string, time?: string, timeFrame?: string, force: boolean = false): Promise<any> {
   return new Promise((resolve, reject) => {
     if (!ws || !connected) {
       console.error(' Cannot dispense: Not connected to Pi!')
@@ -573,26 +613,13 @@ export function dispenseToPi(servoId: string, medication: string, targetAngle?:
       message.time_frame = timeFrame
     }
     
-    // Include target angle if provided (for progressive dispense logic)
-    if (targetAngle !== undefined) {
-      message.target_angle = targetAngle
+    // Force dispense: dispense even if the Pi already marked this slot as done
+    if (force) {
+      message.force = true
     }
-
-    console.log('📤 Sending dispense command:', JSON.stringify(message))
-    ws!.send(JSON.stringify(message))
     
-    const timeout = setTimeout(() => {
-      console.error(' Dispense timeout - no response from Pi')
-      messageHandlers.delete('dispense')
-      reject(new Error('Timeout - Pi did not respond'))
-    }, 10000)
-    
-    // Register handler for dispense response (doesn't interfere with button press)
-    messageHandlers.set('dispense', (response: any) => {
-      clearTimeout(timeout)
-      console.log(' Dispense response received:', response)
-      resolve(response)
-    })
+    console.log('📤 Sending dispense command:', JSON.stringify(message))
+    sendRequest(message, 10000).then(resolve, reject)
   })
 }
 
@@ -613,27 +640,15 @@ export function sendSmsViaPi(phoneNumber: string | string[], message: string): P
     // Convert single phone number to array for consistent handling
     const phoneNumbers = Array.isArray(phoneNumber) ? phoneNumber : [phoneNumber]
 
-    const smsMessage = JSON.stringify({
+    const smsMessage = {
       type: 'send_sms',
       phone_numbers: phoneNumbers,  // Send as array
       message: message
-    })
+    }
 
     console.log('📤 Sending SMS via Pi:', phoneNumber)
-    ws!.send(smsMessage)
-    
-    const timeout = setTimeout(() => {
-      console.error(' SMS timeout - no response from Pi')
-      messageHandlers.delete('send_sms')
-      reject(new Error('Timeout - Pi did not respond'))
-    }, 15000) // Longer timeout for SMS (15 seconds)
-    
-    // Register handler for SMS response
-    messageHandlers.set('send_sms', (response: any) => {
-      clearTimeout(timeout)
-      console.log(' SMS response received:', response)
-      resolve(response)
-    })
+    // Longer timeout for SMS (15 seconds)
+    sendRequest(smsMessage, 15000).then(resolve, reject)
   })
 }
 
@@ -667,23 +682,8 @@ export function confirmServo2Dispense(date?: string, time?: string, timeFrame?:
       message.time_frame = timeFrame
     }
 
-    const messageStr = JSON.stringify(message)
-
-    console.log('📤 Sending servo2 dispense confirmation:', messageStr)
-    ws!.send(messageStr)
-    
-    const timeout = setTimeout(() => {
-      console.error(' Servo2 dispense timeout - no response from Pi')
-      messageHandlers.delete('servo2_dispense')
-      reject(new Error('Timeout - Pi did not respond'))
-    }, 10000)
-    
-    // Register handler for servo2 response
-    messageHandlers.set('servo2_dispense', (response: any) => {
-      clearTimeout(timeout)
-      console.log(' Servo2 dispense response received:', response)
-      resolve(response)
-    })
+    console.log('📤 Sending servo2 dispense confirmation:', JSON.stringify(message))
+    sendRequest(message, 10000).then(resolve, reject)
   })
 }
 
@@ -699,7 +699,71 @@ export function setConnectionStatusCallback(callback: ((connected: boolean) => v
   }
 }
 
-export function updateLCDSchedules(schedules: Array<{time: string, medication?: string, time_frame?: string, date?: string}>): Promise<any> {
+type LCDSchedule = {time: string, medication?: string, time_frame?: string, date?: string, id?: string | number}
+
+// Must match schedule_key() on the Pi
+function scheduleKey(s: LCDSchedule): string {
+  if (s.id !== undefined && s.id !== null) return String(s.id)
+  return [s.date, s.time, s.time_frame, s.medication].map(v => v || '').join('_')
+}
+
+function rememberSyncedSchedules(schedules: LCDSchedule[], version: number | undefined) {
+  syncedSchedules = new Map(schedules.map(s => [scheduleKey(s), JSON.stringify(s)]))
+  scheduleVersion = typeof version === 'number' ? version : null
+}
+
+// Full push - the Pi diffs it against its store, so an unchanged list is a no-op there too
+async function pushAllSchedules(schedules: LCDSchedule[]): Promise<any> {
+  // Field-keyed compact records send each field name once instead of once per schedule
+  const fields = ['id', 'time', 'medication', 'time_frame', 'date']  // id: both sides' schedule keys use it first
+  const message = {
+    type: 'update_schedules',
+    schedules: serverFeatures.has('compact_records')
+      ? { fields, rows: schedules.map(s => fields.map(f => (s as any)[f] ?? null)) }
+      : schedules
+  }
+
+  console.log('📤 Sending schedule update to LCD:', schedules)
+  const response = await sendRequest(message, 5000)
+  if (response.status === 'success') {
+    rememberSyncedSchedules(schedules, response.version)
+  }
+  return response
+}
+
+// Send only what changed since the last acknowledged version; falls back to a full push on conflict
+async function pushScheduleDelta(schedules: LCDSchedule[]): Promise<any> {
+  const current = new Map(schedules.map(s => [scheduleKey(s), s]))
+  const upserts = Array.from(current.entries())
+    .filter(([key, s]) => syncedSchedules.get(key) !== JSON.stringify(s))
+    .map(([, s]) => s)
+  const deletes = Array.from(syncedSchedules.keys()).filter(key => !current.has(key))
+
+  if (upserts.length === 0 && deletes.length === 0) {
+    return { status: 'success', version: scheduleVersion, changed: 0 }
+  }
+
+  console.log(`📤 Sending schedule delta to LCD: ${upserts.length} upsert(s), ${deletes.length} delete(s)`)
+  let response: any = null
+  if (upserts.length > 0) {
+    response = await sendRequest({ type: 'schedule_upsert', schedules: upserts, base_version: scheduleVersion }, 5000)
+    if (response.status === 'success') scheduleVersion = response.version
+  }
+  if (deletes.length > 0 && (!response || response.status === 'success')) {
+    response = await sendRequest({ type: 'schedule_delete', keys: deletes, base_version: scheduleVersion }, 5000)
+  }
+
+  if (response.type === 'schedule_conflict') {
+    console.log('🔄 Schedule version conflict - resending full schedule list')
+    return pushAllSchedules(schedules)
+  }
+  if (response.status === 'success') {
+    rememberSyncedSchedules(schedules, response.version)
+  }
+  return response
+}
+
+export function updateLCDSchedules(schedules: LCDSchedule[]): Promise<any> {
   return new Promise((resolve, reject) => {
     if (!ws || !connected) {
       console.error(' Cannot update LCD schedules: Not connected to Pi!')
@@ -713,25 +777,153 @@ export function updateLCDSchedules(schedules: Array<{time: string, medication?:
       return
     }
 
-    const message = JSON.stringify({
-      type: 'update_schedules',
-      schedules: schedules
-    })
+    const canSendDelta = serverFeatures.has('schedule_sync') && scheduleVersion !== null
+    const push = canSendDelta ? pushScheduleDelta(schedules) : pushAllSchedules(schedules)
+    push.then(resolve, reject)
+  })
+}
 
-    console.log('📤 Sending schedule update to LCD:', schedules)
-    ws!.send(message)
-    
-    const timeout = setTimeout(() => {
-      console.error(' LCD schedule update timeout - no response from Pi')
-      messageHandlers.delete('update_schedules')
-      reject(new Error('Timeout - Pi did not respond'))
-    }, 5000)
-    
-    // Register handler for update_schedules response
-    messageHandlers.set('update_schedules', (response: any) => {
-      clearTimeout(timeout)
-      console.log(' LCD schedule update response received:', response)
-      resolve(response)
-    })
+export type PiHistoryCursor = {before_ts: number, before_id: number}
+
+export type PiHistoryEvent = {
+  id: number
+  ts: number
+  action: 'dispense' | 'servo2_dispense'
+  servo_id: string
+  status: string
+  medication?: string
+  schedule_key?: string
+  date?: string
+  time?: string
+  time_frame?: string
+  servo1_angle?: number
+  duration_ms?: number
+  message?: string
+}
+
+// One page of the Pi's on-device dispense history, newest first.
+// Pass the previous page's next_cursor to get the next page (null = no more pages).
+export function queryPiHistory(options: {
+  limit?: number
+  cursor?: PiHistoryCursor | null
+  since?: number
+  until?: number
+  scheduleKey?: string
+  servoId?: string
+  status?: string
+} = {}): Promise<{events: PiHistoryEvent[], next_cursor: PiHistoryCursor | null}> {
+  return new Promise((resolve, reject) => {
+    if (!ws || !connected || ws.readyState !== WebSocket.OPEN) {
+      reject(new Error('Not connected to Pi!'))
+      return
+    }
+
+    if (!serverFeatures.has('history')) {
+      reject(new Error('Pi server has no dispense history'))
+      return
+    }
+
+    const message: any = {
+      type: 'history_query',
+      limit: options.limit ?? 50,
+      compact: serverFeatures.has('compact_records'),
+      ...(options.cursor || {})
+    }
+    if (options.since !== undefined) message.since = options.since
+    if (options.until !== undefined) message.until = options.until
+    if (options.scheduleKey) message.schedule_key = options.scheduleKey
+    if (options.servoId) message.servo_id = options.servoId
+    if (options.status) message.status = options.status
+
+    sendRequest(message, 10000).then((response) => {
+      if (response.status !== 'success') {
+        reject(new Error(response.message || 'History query failed'))
+        return
+      }
+      const events = Array.isArray(response.events)
+        ? response.events
+        : response.events.rows.map((row: any[]) => Object.fromEntries(
+            response.events.fields.map((field: string, i: number) => [field, row[i]]).filter(([, value]: any[]) => value !== null)
+          ))
+      resolve({ events, next_cursor: response.next_cursor })
+    }, reject)
   })
+}
+
+
+export type PiLocalDispense = {
+  key: string
+  date: string
+  time: string
+  time_frame: 'morning' | 'afternoon' | 'evening'
+  medications: string[]
+  dispensed_at: number
+  status: string
+  servo1_angle?: number | null
+  servo2_status?: string
+}
+
+// Called for each dose the Pi dispensed on its own (e.g. to log it to dispense_history).
+// The Pi forgets a dispense once the callback has resolved for it.
+export function setLocalDispenseCallback(callback: ((dispense: PiLocalDispense) => Promise<void> | void) | null) {
+  localDispenseCallback = callback
+}
+
+async function reconcileLocalDispenses(dispenses: PiLocalDispense[]) {
+  if (!localDispenseCallback) return
+  const handled: string[] = []
+  for (const dispense of dispenses) {
+    if (reconcilingKeys.has(dispense.key)) continue
+    reconcilingKeys.add(dispense.key)
+    try {
+      await localDispenseCallback(dispense)
+      handled.push(dispense.key)
+    } catch (error) {
+      console.error(`❌ Could not log Pi dispense ${dispense.key}:`, error)
+    }
+  }
+  try {
+    if (handled.length > 0 && ws && ws.readyState === WebSocket.OPEN) {
+      await sendRequest({ type: 'scheduler_ack', keys: handled }, 5000)
+    }
+  } finally {
+    handled.forEach(key => reconcilingKeys.delete(key))
+  }
+}
+
+// Attach this connection to our session on the Pi (or start one). Missed frames follow the
+// reply and go through the normal message handling.
+async function resumePiSession(): Promise<void> {
+  const response = await sendRequest({ type: 'session_resume', session_id: sessionId, last_seq: lastSeq }, 5000)
+  if (response.status !== 'success') return
+  if (!response.resumed) {
+    // New session (first connect, or the Pi restarted / expired ours): numbering starts over
+    lastSeq = response.current_seq
+  } else if (response.gap) {
+    console.warn('⚠️ Pi session resumed with a gap - some replies/events were dropped')
+  }
+  sessionId = response.session_id
+  console.log(`🔁 Pi session ${response.resumed ? 'resumed' : 'started'} at seq ${response.current_seq}`)
+}
+
+// Send the scheduler settings (if any) and pick up dispenses made while we were away
+async function syncPiScheduler(): Promise<any> {
+  const message: any = { type: schedulerConfig ? 'scheduler_config' : 'scheduler_status' }
+  if (schedulerConfig?.enabled !== undefined) message.enabled = schedulerConfig.enabled
+  if (schedulerConfig?.automatic !== undefined) message.automatic = schedulerConfig.automatic
+  if (schedulerConfig?.phoneNumbers !== undefined) message.phone_numbers = schedulerConfig.phoneNumbers
+
+  const status = await sendRequest(message, 5000)
+  await reconcileLocalDispenses(status.local_dispenses || [])
+  return status
+}
+
+// Settings for the Pi's local scheduler, which dispenses doses the web app misses (tab closed,
+// tunnel down). Kept and resent on every reconnect.
+export function configurePiScheduler(config: {enabled?: boolean, automatic?: boolean, phoneNumbers?: string[]}): Promise<any> {
+  schedulerConfig = config
+  if (!ws || !connected || ws.readyState !== WebSocket.OPEN || !serverFeatures.has('local_scheduler')) {
+    return Promise.resolve(null)  // Sent when the connection (re)opens
+  }
+  return syncPiScheduler()
 }
\ No newline at end of file
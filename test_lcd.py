@@ -4,9 +4,16 @@ Simple LCD Test Script
 Run this to check if LCD is working on Raspberry Pi
 """
 
+import os
 import sys
 import time
 
+try:
+    from i2c_bus import I2CBus, LCD_ADDRESSES
+except ImportError:  # Run from the repo root: the shared bus scanner lives in pi-server/
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pi-server'))
+    from i2c_bus import I2CBus, LCD_ADDRESSES
+
 print("=" * 50)
 print("LCD Display Test")
 print("=" * 50)
@@ -31,8 +38,15 @@ except ImportError:
 
 print()
 
-# LCD Configuration
-LCD_ADDRESS = 0x27  # Common I2C address (try 0x3F if this doesn't work)
+# LCD Configuration - address from the I2C bus scan (0x27 or 0x3F; 0x27 if the bus can't be scanned)
+bus = I2CBus()
+devices = bus.scan()
+if devices is None:
+    print(f"⚠️ Could not scan I2C bus: {bus.scan_error}")
+elif bus.find(LCD_ADDRESSES) is None:
+    print("⚠️ No LCD found at 0x27 or 0x3F on the I2C bus")
+    print("   Devices found: " + (", ".join(f"0x{address:02X}" for address in devices) or "none"))
+LCD_ADDRESS = bus.find(LCD_ADDRESSES) or LCD_ADDRESSES[0]
 LCD_COLS = 16
 LCD_ROWS = 2
 
@@ -151,9 +165,9 @@ except Exception as e:
     print("   SDA → GPIO2 (Pin 3)")
     print("   SCL → GPIO3 (Pin 5)")
     print()
-    print("4. Try different I2C address:")
-    print("   Common addresses: 0x27, 0x3F")
-    print("   Edit this script and change LCD_ADDRESS")
+    print("4. Check what answers on the bus:")
+    print("   python3 pi-server/i2c_bus.py")
+    print("   Should list 0x27 or 0x3F (lcd)")
     print()
     
     import traceback
@@ -8,6 +8,12 @@ import sys
 import time
 import os
 
+try:
+    from i2c_bus import I2CBus, LCD_ADDRESSES, PCA9685_ADDRESS
+except ImportError:  # Run from the repo root: the shared bus scanner lives in pi-server/
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pi-server'))
+    from i2c_bus import I2CBus, LCD_ADDRESSES, PCA9685_ADDRESS
+
 print("=" * 60)
 print("LCD Diagnostic Test - Detailed Troubleshooting")
 print("=" * 60)
@@ -45,76 +51,50 @@ print("Step 4: Checking I2C library (smbus)...")
 try:
     import smbus
     print("   ✅ smbus library found")
-    print(f"   Location: {smbus.__module__}")
+    print(f"   Location: {getattr(smbus, '__file__', smbus.__name__)}")
 except ImportError:
     print("   ⚠️ smbus library not found")
     print("   Install with: sudo apt-get install python3-smbus")
     print("   Note: May still work without it")
 print()
 
-# Step 5: Check I2C device
-print("Step 5: Checking I2C device...")
-try:
-    import subprocess
-    result = subprocess.run(['i2cdetect', '-y', '1'], 
-                          capture_output=True, text=True, timeout=5)
-    if result.returncode == 0:
-        print("   ✅ i2cdetect command works")
-        print("   Output:")
-        print("   " + "\n   ".join(result.stdout.split('\n')))
-        
-        # Check for common LCD addresses
-        output = result.stdout
-        if '27' in output or '0x27' in output.lower():
-            print("   ✅ Found device at 0x27")
-            lcd_address = 0x27
-        elif '3f' in output.lower() or '3F' in output:
-            print("   ✅ Found device at 0x3F")
-            lcd_address = 0x3F
-        else:
-            print("   ⚠️ Could not find LCD at 0x27 or 0x3F")
-            print("   What address did you see? (Enter manually)")
-            lcd_address = None
-    else:
-        print("   ⚠️ i2cdetect failed")
-        print("   Install with: sudo apt-get install i2c-tools")
-        lcd_address = 0x27  # Default
-except FileNotFoundError:
-    print("   ⚠️ i2cdetect not found")
-    print("   Install with: sudo apt-get install i2c-tools")
-    lcd_address = 0x27  # Default
-except Exception as e:
-    print(f"   ⚠️ Error running i2cdetect: {e}")
-    lcd_address = 0x27  # Default
-print()
-
-# Step 6: Try to access I2C bus directly
-print("Step 6: Testing I2C bus access...")
-try:
-    import smbus
-    bus = smbus.SMBus(1)  # I2C bus 1
-    print("   ✅ Can access I2C bus 1")
-    
-    # Try to read from LCD address
-    if lcd_address:
-        try:
-            # Try to read a byte (some LCDs respond, some don't)
-            bus.read_byte(lcd_address)
-            print(f"   ✅ Can read from address 0x{lcd_address:02X}")
-        except:
-            print(f"   ⚠️ Cannot read from 0x{lcd_address:02X} (this is normal for some LCDs)")
-    bus.close()
-except Exception as e:
-    print(f"   ❌ Cannot access I2C bus: {e}")
+# Step 5: Scan the I2C bus (same probe as i2cdetect -y 1, and the same scan the server runs)
+print("Step 5: Scanning I2C bus 1...")
+bus = I2CBus()
+devices = bus.scan()
+lcd_address = None
+if devices is None:
+    print(f"   ❌ Cannot access I2C bus: {bus.scan_error}")
     print("   Possible issues:")
     print("   - I2C not enabled (sudo raspi-config)")
     print("   - Permission denied (add user to i2c group)")
-    print("   - Wrong I2C bus number")
+    print("   - smbus missing (sudo apt-get install python3-smbus)")
+else:
+    print(f"   ✅ Scanned in {bus.scan_seconds * 1000:.0f} ms")
+    for address, name in sorted(devices.items()):
+        print(f"   Found 0x{address:02X} ({name})")
+    if not devices:
+        print("   ⚠️ No devices answered - check wiring and power")
+    lcd_address = bus.find(LCD_ADDRESSES)
+    if lcd_address:
+        print(f"   ✅ Found LCD at 0x{lcd_address:02X}")
+    else:
+        print("   ⚠️ Could not find LCD at 0x27 or 0x3F")
+print()
+
+# Step 6: Check the servo board shares the bus
+print("Step 6: Checking the other devices on the bus...")
+if devices is None:
+    print("   ⚠️ Skipped (bus could not be scanned)")
+elif bus.present(PCA9685_ADDRESS):
+    print("   ✅ PCA9685 servo board at 0x40")
+else:
+    print("   ⚠️ No PCA9685 at 0x40 (servos won't work either - check SDA/SCL and power)")
 print()
 
 # Step 7: Try to initialize LCD
 print("Step 7: Attempting LCD initialization...")
-print(f"   Trying address: 0x{lcd_address:02X if lcd_address else '27'}")
+print("   Trying address: " + (f"0x{lcd_address:02X}" if lcd_address else "0x27 and 0x3F"))
 
 lcd = None
 addresses_to_try = []
@@ -122,7 +102,7 @@ addresses_to_try = []
 if lcd_address:
     addresses_to_try = [lcd_address]
 else:
-    addresses_to_try = [0x27, 0x3F]  # Try both common addresses
+    addresses_to_try = list(LCD_ADDRESSES)  # Try both common addresses
 
 for addr in addresses_to_try:
     print(f"\n   Trying address 0x{addr:02X}...")
@@ -148,7 +128,7 @@ if not lcd:
     print("      GND → GND")
     print("      SDA → GPIO2 (Pin 3)")
     print("      SCL → GPIO3 (Pin 5)")
-    print("   2. Check I2C address with: i2cdetect -y 1")
+    print("   2. Check I2C address with: python3 pi-server/i2c_bus.py")
     print("   3. Try running with sudo: sudo python3 test_lcd_diagnostic.py")
     print("   4. Check if I2C is enabled: sudo raspi-config")
     sys.exit(1)
@@ -4,10 +4,22 @@ Ultra-Simple LCD Test
 Direct I2C access to test LCD
 """
 
+import os
 import sys
 import time
 
-print("LCD Simple Test - Address 0x27")
+try:
+    from i2c_bus import I2CBus, LCD_ADDRESSES
+except ImportError:  # Run from the repo root: the shared bus scanner lives in pi-server/
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pi-server'))
+    from i2c_bus import I2CBus, LCD_ADDRESSES
+
+# LCD address from the I2C bus scan (0x27 or 0x3F; 0x27 if the bus can't be scanned)
+i2c = I2CBus()
+i2c.scan()
+address = i2c.find(LCD_ADDRESSES) or LCD_ADDRESSES[0]
+
+print(f"LCD Simple Test - Address 0x{address:02X}")
 print("=" * 40)
 
 # Check libraries
@@ -33,12 +45,11 @@ print()
 print("Test 1: Direct I2C access...")
 try:
     bus = smbus.SMBus(1)
-    address = 0x27
     
     # Try to write to LCD (backlight on)
     bus.write_byte(address, 0x08)
     time.sleep(0.1)
-    print("   ✅ Can write to I2C address 0x27")
+    print(f"   ✅ Can write to I2C address 0x{address:02X}")
     bus.close()
 except Exception as e:
     print(f"   ❌ Cannot write to I2C: {e}")
@@ -56,7 +67,7 @@ try:
     print("   Trying PCF8574 expander...")
     lcd = CharLCD(
         i2c_expander='PCF8574',
-        address=0x27,
+        address=address,
         cols=16,
         rows=2
     )
@@ -69,7 +80,7 @@ except Exception as e1:
         print("   Trying MCP23008 expander...")
         lcd = CharLCD(
             i2c_expander='MCP23008',
-            address=0x27,
+            address=address,
             cols=16,
             rows=2
         )
@@ -7,36 +7,14 @@ For Globe SIM and other carriers
 
 import serial
 import serial.tools.list_ports
-import time
 import sys
 import os
 
-def send_at_command(ser, command, timeout=5, wait_for_ok=True):
-    """Send AT command and get response"""
-    try:
-        ser.reset_input_buffer()
-        time.sleep(0.2)
-        
-        ser.write(f"{command}\r\n".encode())
-        time.sleep(0.5)
-        
-        response = ""
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            if ser.in_waiting > 0:
-                chunk = ser.read(ser.in_waiting).decode('utf-8', errors='ignore')
-                response += chunk
-                if wait_for_ok and ('OK' in response or 'ERROR' in response):
-                    break
-            time.sleep(0.1)
-        
-        response = response.strip()
-        if command in response:
-            response = response.replace(command, "").strip()
-        
-        return response
-    except Exception as e:
-        return f"ERROR: {e}"
+try:
+    from simcom_at import REGISTERED, REGISTRATION_STATES, BAUD_RATES, open_modem
+except ImportError:  # Run from the repo root: the shared AT client lives in pi-server/
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pi-server'))
+    from simcom_at import REGISTERED, REGISTRATION_STATES, BAUD_RATES, open_modem
 
 def find_simcom_port():
     """Find SIMCOM module port"""
@@ -58,31 +36,6 @@ def find_simcom_port():
     
     return None
 
-def test_baud_rate(port, baudrate):
-    """Test if module responds at given baud rate"""
-    try:
-        ser = serial.Serial(port=port, baudrate=baudrate, timeout=3, writeTimeout=3)
-        time.sleep(2)
-        
-        ser.reset_input_buffer()
-        ser.write(b"AT\r\n")
-        time.sleep(0.5)
-        
-        response = ""
-        start_time = time.time()
-        while time.time() - start_time < 2:
-            if ser.in_waiting > 0:
-                response += ser.read(ser.in_waiting).decode('utf-8', errors='ignore')
-                if 'OK' in response:
-                    ser.close()
-                    return True
-            time.sleep(0.1)
-        
-        ser.close()
-        return False
-    except:
-        return False
-
 def check_network_registration():
     """Check and fix network registration"""
     print("=" * 70)
@@ -100,191 +53,102 @@ def check_network_registration():
         return False
     print(f"   ✅ Found: {port}")
     
-    # Find baud rate
-    print()
-    print("STEP 2: Finding correct baud rate...")
-    print("-" * 70)
-    baud_rates = [115200, 9600, 57600, 38400]
-    working_baud = None
-    
-    for baud in baud_rates:
-        print(f"   Trying {baud} baud... ", end="", flush=True)
-        if test_baud_rate(port, baud):
-            print("✅")
-            working_baud = baud
-            break
-        else:
-            print("❌")
-    
-    if not working_baud:
-        print("   ❌ Could not communicate with module!")
-        return False
-    
-    print(f"   ✅ Working baud rate: {working_baud}")
-    
-    # Connect
+    # Find baud rate and connect (answers within ~1 s per rate tried)
     print()
-    print("STEP 3: Connecting to module...")
+    print("STEP 2: Finding correct baud rate and connecting...")
     print("-" * 70)
-    try:
-        ser = serial.Serial(port=port, baudrate=working_baud, timeout=5, writeTimeout=5)
-        time.sleep(2)
-        print("   ✅ Connected")
-    except Exception as e:
-        print(f"   ❌ Connection failed: {e}")
+    at = open_modem(port, BAUD_RATES)
+    if at is None:
+        print(f"   ❌ Could not communicate with module! (tried {', '.join(map(str, BAUD_RATES))} baud)")
         return False
+    working_baud = at.ser.baudrate
+    print(f"   ✅ Connected at {working_baud} baud")
     
     # Check SIM card
     print()
-    print("STEP 4: Checking SIM card...")
+    print("STEP 3: Checking SIM card...")
     print("-" * 70)
-    response = send_at_command(ser, "AT+CPIN?")
-    print(f"   Response: {response}")
+    sim = at.sim_status()
+    print(f"   Status: {sim}")
     
-    if "READY" not in response:
+    if sim != "READY":
         print("   ❌ SIM card not ready!")
         print("   Fix SIM card first before checking network")
-        ser.close()
+        at.ser.close()
         return False
     print("   ✅ SIM card ready")
     
     # Check current registration status
     print()
-    print("STEP 5: Checking Network Registration Status...")
+    print("STEP 4: Checking Network Registration Status...")
     print("-" * 70)
-    response = send_at_command(ser, "AT+CREG?")
-    print(f"   Response: {response}")
-    
-    reg_status = None
-    if "+CREG:" in response:
-        try:
-            parts = response.split("+CREG:")[1].strip()
-            parts = parts.split(",")
-            if len(parts) >= 2:
-                stat = int(parts[1].strip())
-                reg_status = stat
-                
-                if stat == 0:
-                    print("   ⚠️ Status: Not registered, searching...")
-                elif stat == 1:
-                    print("   ✅ Status: Registered on HOME network")
-                elif stat == 2:
-                    print("   ✅ Status: Registered on ROAMING network")
-                elif stat == 3:
-                    print("   ❌ Status: Registration DENIED")
-                elif stat == 4:
-                    print("   ❌ Status: Unknown")
-                elif stat == 5:
-                    print("   ✅ Status: Registered (roaming)")
-        except:
-            pass
+    reg_status = at.registration()
+    if reg_status in REGISTERED:
+        print(f"   ✅ Status: {REGISTRATION_STATES[reg_status]}")
+    else:
+        print(f"   ⚠️ Status: {REGISTRATION_STATES.get(reg_status, 'no answer')}")
     
     # Check signal strength
     print()
-    print("STEP 6: Checking Signal Strength...")
+    print("STEP 5: Checking Signal Strength...")
     print("-" * 70)
-    response = send_at_command(ser, "AT+CSQ")
-    print(f"   Response: {response}")
-    
-    signal = 0
-    if "+CSQ:" in response:
-        try:
-            parts = response.split("+CSQ:")[1].strip().split(",")
-            signal = int(parts[0].strip())
-            
-            if signal == 99:
-                print("   ❌ Signal: Unknown/Not detectable")
-            elif signal == 0:
-                print("   ❌ Signal: NO SIGNAL (0/31)")
-            elif signal <= 10:
-                print(f"   ⚠️ Signal: Very weak ({signal}/31)")
-            elif signal <= 20:
-                print(f"   ⚠️ Signal: Weak ({signal}/31)")
-            else:
-                print(f"   ✅ Signal: Good ({signal}/31)")
-        except:
-            pass
+    quality = at.signal_quality()
+    signal = quality[0] if quality else 0
+    if quality is None or signal == 99:
+        print("   ❌ Signal: Unknown/Not detectable")
+    elif signal == 0:
+        print("   ❌ Signal: NO SIGNAL (0/31)")
+    elif signal <= 10:
+        print(f"   ⚠️ Signal: Very weak ({signal}/31)")
+    elif signal <= 20:
+        print(f"   ⚠️ Signal: Weak ({signal}/31)")
+    else:
+        print(f"   ✅ Signal: Good ({signal}/31)")
     
     # Check network operator
     print()
-    print("STEP 7: Checking Network Operator...")
+    print("STEP 6: Checking Network Operator...")
     print("-" * 70)
-    response = send_at_command(ser, "AT+COPS?")
-    print(f"   Response: {response}")
-    
-    operator = "Unknown"
-    if "+COPS:" in response:
-        try:
-            parts = response.split("+COPS:")[1].strip()
-            if "," in parts:
-                oper = parts.split(",")[-1].strip().strip('"')
-                operator = oper
-                print(f"   ✅ Operator: {operator}")
-        except:
-            pass
+    fields = at.command("AT+COPS?").fields("+COPS:")
+    operator = fields[2] if len(fields) >= 3 else "Unknown"
+    print(f"   {'✅' if len(fields) >= 3 else '⚠️'} Operator: {operator}")
     
     # If not registered, try to register
-    if reg_status != 1 and reg_status != 2:
+    if reg_status not in REGISTERED:
         print()
-        print("STEP 8: Attempting Network Registration...")
+        print("STEP 7: Attempting Network Registration...")
         print("-" * 70)
-        print("   Trying automatic registration...")
-        
-        # Set to automatic registration mode
-        response = send_at_command(ser, "AT+CREG=2")
-        print(f"   Response: {response}")
-        time.sleep(2)
-        
-        # Check registration again
-        print("   Checking registration status again...")
-        time.sleep(5)  # Wait for registration
-        
-        response = send_at_command(ser, "AT+CREG?")
-        print(f"   Response: {response}")
-        
-        if "+CREG:" in response:
-            try:
-                parts = response.split("+CREG:")[1].strip().split(",")
-                if len(parts) >= 2:
-                    new_stat = int(parts[1].strip())
-                    if new_stat == 1 or new_stat == 2:
-                        print("   ✅ Registration successful!")
-                        reg_status = new_stat
-                    else:
-                        print(f"   ⚠️ Still not registered (status: {new_stat})")
-            except:
-                pass
+        print("   Trying automatic registration (waiting up to 30 s for +CREG)...")
+        at.command("AT+COPS=0", timeout=30)
+        reg_status = at.wait_registered(30)
+        if reg_status in REGISTERED:
+            print("   ✅ Registration successful!")
+        else:
+            print(f"   ⚠️ Still not registered (status: {reg_status})")
         
         # Try manual network selection (for Globe)
-        if reg_status != 1 and reg_status != 2:
+        if reg_status not in REGISTERED:
             print()
             print("   Trying manual network selection (Globe)...")
             
             # Search for available networks
             print("   Searching for available networks...")
-            response = send_at_command(ser, "AT+COPS=?", timeout=30)
-            print(f"   Available networks: {response[:200]}...")
+            response = at.command("AT+COPS=?", timeout=60)
+            print(f"   Available networks: {response.text[:200]}...")
             
             # Try to register with Globe (common in Philippines)
             globe_operators = ["51502", "51503", "51505"]  # Globe network codes
             
             for op_code in globe_operators:
                 print(f"   Trying to register with operator {op_code}...")
-                response = send_at_command(ser, f'AT+COPS=1,2,"{op_code}"', timeout=30)
+                response = at.command(f'AT+COPS=1,2,"{op_code}"', timeout=60)
                 print(f"   Response: {response}")
                 
-                if "OK" in response:
-                    time.sleep(5)
-                    # Check if registered
-                    response = send_at_command(ser, "AT+CREG?")
-                    if "+CREG:" in response:
-                        parts = response.split("+CREG:")[1].strip().split(",")
-                        if len(parts) >= 2:
-                            stat = int(parts[1].strip())
-                            if stat == 1 or stat == 2:
-                                print(f"   ✅ Successfully registered with operator {op_code}!")
-                                reg_status = stat
-                                break
+                if response.ok:
+                    reg_status = at.wait_registered(15)
+                    if reg_status in REGISTERED:
+                        print(f"   ✅ Successfully registered with operator {op_code}!")
+                        break
     
     # Final summary
     print()
@@ -297,12 +161,8 @@ def check_network_registration():
     print(f"Signal Strength: {signal}/31")
     print(f"Network Operator: {operator}")
     
-    if reg_status == 1:
-        print(f"Network Registration: ✅ REGISTERED (HOME)")
-        print()
-        print("✅ Network is registered! SMS should work.")
-    elif reg_status == 2:
-        print(f"Network Registration: ✅ REGISTERED (ROAMING)")
+    if reg_status in REGISTERED:
+        print(f"Network Registration: ✅ {REGISTRATION_STATES[reg_status].upper()}")
         print()
         print("✅ Network is registered! SMS should work.")
     else:
@@ -318,8 +178,8 @@ def check_network_registration():
         print("5. Try power cycling the module (unplug/replug USB)")
         print("6. Check if SIM card is locked (PIN/PUK)")
     
-    ser.close()
-    return reg_status == 1 or reg_status == 2
+    at.ser.close()
+    return reg_status in REGISTERED
 
 if __name__ == "__main__":
     try:
@@ -4,31 +4,14 @@ Test Phone Number Formatting
 Tests different phone number formats to see which works with SIMCOM
 """
 
-import serial
-import time
 import sys
+import os
 
-def send_at_command(ser, command, timeout=5):
-    """Send AT command and get response"""
-    try:
-        ser.reset_input_buffer()
-        time.sleep(0.2)
-        ser.write(f"{command}\r\n".encode())
-        time.sleep(0.3)
-        
-        response = ""
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            if ser.in_waiting > 0:
-                chunk = ser.read(ser.in_waiting).decode('utf-8', errors='ignore')
-                response += chunk
-                if 'OK' in response or 'ERROR' in response or '>' in response:
-                    break
-            time.sleep(0.1)
-        
-        return response.strip()
-    except Exception as e:
-        return f"ERROR: {e}"
+try:
+    from simcom_at import open_modem
+except ImportError:  # Run from the repo root: the shared AT client lives in pi-server/
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pi-server'))
+    from simcom_at import open_modem
 
 def test_phone_formats():
     """Test different phone number formats"""
@@ -44,13 +27,11 @@ def test_phone_formats():
     test_number = input("Enter test phone number (e.g., 09276760439): ").strip()
     
     print(f"Connecting to {port} at {baudrate} baud...")
-    try:
-        ser = serial.Serial(port=port, baudrate=baudrate, timeout=5, writeTimeout=5)
-        time.sleep(2)
-        print("✅ Connected")
-    except Exception as e:
-        print(f"❌ Connection failed: {e}")
+    at = open_modem(port, (baudrate,))
+    if at is None:
+        print("❌ Connection failed: module not answering AT")
         return False
+    print("✅ Connected")
     
     # Test different formats
     formats_to_test = [
@@ -65,8 +46,7 @@ def test_phone_formats():
     
     # Set SMS text mode
     print("Setting SMS text mode...")
-    send_at_command(ser, "AT+CMGF=1", timeout=3)
-    time.sleep(0.5)
+    at.command("AT+CMGF=1", timeout=3)
     
     for phone_format, description in formats_to_test:
         print()
@@ -74,23 +54,15 @@ def test_phone_formats():
         print("-" * 70)
         
         # Try to get CMGS prompt
-        response = send_at_command(ser, f'AT+CMGS="{phone_format}"', timeout=8)
+        response = at.command(f'AT+CMGS="{phone_format}"', timeout=8, expect_prompt=True)
         
-        if '>' in response:
+        if response.prompt:
             print(f"   ✅ Got '>' prompt - format works!")
-            # Cancel the SMS (send Ctrl+C)
-            ser.write(b'\x03')
-            time.sleep(0.3)
-            ser.reset_input_buffer()
-        elif '+CMGS:' in response:
-            print(f"   ✅ Got CMGS response - format works!")
-            ser.reset_input_buffer()
         else:
             print(f"   ❌ No prompt - format may not work")
-            print(f"   Response: {response[:200]}")
-            ser.reset_input_buffer()
-        
-        time.sleep(1)
+            print(f"   Response: {response.text[:200]}")
+        # Abort the SMS input (ESC) so nothing is sent
+        at.cancel()
     
     print()
     print("=" * 70)
@@ -107,7 +79,7 @@ def test_phone_formats():
     print("  Example: +639123456789")
     print()
     
-    ser.close()
+    at.ser.close()
     return True
 
 if __name__ == "__main__":
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Test Resumable Sessions
+Runs the Pi server's handle_client on a local port (no hardware needed) and checks that the
+session handshake gets past the web app's seq dedupe on a first connect and on a reconnect
+the Pi doesn't resume (restart, expired session).
+
+Run with pytest or directly: python3 test_sessions.py
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pi-server'))
+
+import websockets  # noqa: E402
+
+import pi_websocket_server_PCA9685 as server  # noqa: E402
+
+
+class SeqGate:
+    """The seq dedupe in src/lib/pi-websocket.ts (onmessage + resumePiSession)"""
+    
+    def __init__(self):
+        self.last_seq = 0
+    
+    def accept(self, message: dict) -> bool:
+        if isinstance(message.get('seq'), int):
+            if message['seq'] <= self.last_seq:
+                return False
+            self.last_seq = message['seq']
+        return True
+    
+    def on_session(self, reply: dict):
+        if not reply['resumed']:
+            self.last_seq = reply['current_seq']
+
+
+async def _request(ws, gate: SeqGate, message: dict) -> dict:
+    """Send a request and return its reply as the web app would see it (None if dropped)"""
+    await ws.send(json.dumps(message))
+    while True:
+        reply = json.loads(await asyncio.wait_for(ws.recv(), 5))
+        if reply.get('request_id') == message['request_id']:
+            return reply if gate.accept(reply) else None
+        gate.accept(reply)  # Events in between still move the gate
+
+
+async def _connect(uri: str, gate: SeqGate, session_id=None) -> tuple:
+    ws = await websockets.connect(uri)
+    info = json.loads(await ws.recv())
+    assert info['type'] == 'server_info' and 'sessions' in info['features']
+    reply = await _request(ws, gate, {"type": "session_resume", "session_id": session_id,
+                                      "last_seq": gate.last_seq, "request_id": 1})
+    assert reply is not None, "session reply dropped by the seq dedupe"
+    gate.on_session(reply)
+    return ws, reply
+
+
+async def _with_server(scenario):
+    async with websockets.serve(server.handle_client, '127.0.0.1', 0) as ws_server:
+        port = ws_server.sockets[0].getsockname()[1]
+        await scenario(f"ws://127.0.0.1:{port}")
+
+
+def test_first_connect():
+    async def scenario(uri):
+        gate = SeqGate()
+        ws, session = await _connect(uri, gate)
+        assert session['resumed'] is False and session['current_seq'] == 0
+        for request_id in (2, 3):
+            reply = await _request(ws, gate, {"type": "scheduler_status", "request_id": request_id})
+            assert reply is not None and reply['status'] == 'success'
+        await ws.close()
+    
+    asyncio.run(_with_server(scenario))
+
+
+def test_reconnect_without_resume():
+    async def scenario(uri):
+        gate = SeqGate()
+        ws, _ = await _connect(uri, gate)
+        for request_id in range(2, 7):
+            await _request(ws, gate, {"type": "scheduler_status", "request_id": request_id})
+        await ws.close()
+        assert gate.last_seq >= 5
+        
+        # The Pi restarted (or the session expired): it starts a new session at seq 0
+        ws, session = await _connect(uri, gate, session_id="expired-session")
+        assert session['resumed'] is False and gate.last_seq == 0
+        reply = await _request(ws, gate, {"type": "scheduler_status", "request_id": 7})
+        assert reply is not None and reply['seq'] == 1, "reply after a new session was dropped"
+        await ws.close()
+    
+    asyncio.run(_with_server(scenario))
+
+
+if __name__ == '__main__':
+    for test in (test_first_connect, test_reconnect_without_resume):
+        test()
+        print(f"✅ {test.__name__}")
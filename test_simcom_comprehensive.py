@@ -7,40 +7,14 @@ Run this on the Raspberry Pi to verify SIMCOM is working correctly
 
 import serial
 import serial.tools.list_ports
-import time
 import sys
 import os
 
-def send_at_command(ser, command, timeout=3, wait_for_ok=True):
-    """Send AT command and get response"""
-    try:
-        ser.reset_input_buffer()
-        time.sleep(0.1)
-        
-        # Send command
-        ser.write(f"{command}\r\n".encode())
-        time.sleep(0.2)
-        
-        # Read response
-        response = ""
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            if ser.in_waiting > 0:
-                chunk = ser.read(ser.in_waiting).decode('utf-8', errors='ignore')
-                response += chunk
-                if wait_for_ok and ('OK' in response or 'ERROR' in response):
-                    break
-            time.sleep(0.1)
-        
-        # Clean up response
-        response = response.strip()
-        # Remove echo of command if present
-        if command in response:
-            response = response.replace(command, "").strip()
-        
-        return response
-    except Exception as e:
-        return f"ERROR: {e}"
+try:
+    from simcom_at import BAUD_RATES, REGISTERED, REGISTRATION_STATES, open_modem
+except ImportError:  # Run from the repo root: the shared AT client lives in pi-server/
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pi-server'))
+    from simcom_at import BAUD_RATES, REGISTERED, REGISTRATION_STATES, open_modem
 
 def check_simcom_status():
     """Comprehensive SIMCOM module status check"""
@@ -79,42 +53,26 @@ def check_simcom_status():
         print("      - Run: ls -l /dev/ttyUSB*")
         return False
     
-    # Step 2: Connect to SIMCOM
+    # Step 2/3: Connect and test basic communication (probes baud rates until AT answers OK)
     print()
     print("STEP 2: Connecting to SIMCOM Module...")
     print("-" * 70)
-    try:
-        ser = serial.Serial(
-            port=simcom_port,
-            baudrate=9600,
-            timeout=3,
-            writeTimeout=3
-        )
-        time.sleep(2)  # Wait for module to initialize
-        print(f"   ✅ Connected to {simcom_port} at 9600 baud")
-    except Exception as e:
-        print(f"   ❌ Connection failed: {e}")
+    at = open_modem(simcom_port, BAUD_RATES)
+    if at is None:
+        print(f"   ❌ Module not answering AT on {simcom_port} (tried {', '.join(map(str, BAUD_RATES))} baud)")
         print("   Check:")
         print("      - Port permissions (may need sudo)")
         print("      - Another program using the port")
+        print("      - Module power (LED should be on)")
         return False
-    
-    # Step 3: Test basic communication
-    print()
-    print("STEP 3: Testing Module Communication...")
-    print("-" * 70)
-    response = send_at_command(ser, "AT")
-    if "OK" in response:
-        print("   ✅ Module responding to AT commands")
-    else:
-        print(f"   ⚠️ Unexpected response: {response}")
-        print("   Module may not be ready, continuing anyway...")
+    print(f"   ✅ Connected to {simcom_port} at {at.ser.baudrate} baud")
+    print("   ✅ Module responding to AT commands")
     
     # Step 4: Check SIM card status
     print()
     print("STEP 4: Checking SIM Card Status...")
     print("-" * 70)
-    response = send_at_command(ser, "AT+CPIN?")
+    response = at.command("AT+CPIN?").text
     print(f"   Response: {response}")
     
     sim_ready = False
@@ -144,80 +102,54 @@ def check_simcom_status():
     print()
     print("STEP 5: Checking Network Registration...")
     print("-" * 70)
-    response = send_at_command(ser, "AT+CREG?")
+    response = at.command("AT+CREG?")
     print(f"   Response: {response}")
     
     network_registered = False
     reg_status = "Unknown"
     
-    if "+CREG:" in response:
-        try:
-            # Parse: +CREG: <n>,<stat>
-            parts = response.split("+CREG:")[1].strip()
-            parts = parts.split(",")
-            if len(parts) >= 2:
-                stat = int(parts[1].strip())
-                if stat == 1:
-                    print("   ✅ Registered on home network")
-                    network_registered = True
-                    reg_status = "HOME"
-                elif stat == 2:
-                    print("   ✅ Registered on roaming network")
-                    network_registered = True
-                    reg_status = "ROAMING"
-                elif stat == 0:
-                    print("   ⚠️ Not registered, searching...")
-                    reg_status = "SEARCHING"
-                elif stat == 3:
-                    print("   ❌ Registration denied")
-                    reg_status = "DENIED"
-                elif stat == 4:
-                    print("   ❌ Unknown registration status")
-                    reg_status = "UNKNOWN"
-                else:
-                    print(f"   ⚠️ Registration status: {stat}")
-                    reg_status = f"STATUS_{stat}"
-        except (ValueError, IndexError) as e:
-            print(f"   ⚠️ Could not parse registration: {e}")
+    # Parse: +CREG: <n>,<stat> (only the +CREG line - the response also holds OK)
+    fields = response.fields("+CREG:")
+    try:
+        stat = int(fields[1])
+        network_registered = stat in REGISTERED
+        reg_status = REGISTRATION_STATES.get(stat, f"status {stat}").upper()
+        print(f"   {'✅' if network_registered else '⚠️'} {REGISTRATION_STATES.get(stat, f'Registration status: {stat}')}")
+    except (ValueError, IndexError):
+        print(f"   ⚠️ Could not parse registration: {response.text}")
     
     # Step 6: Check signal strength
     print()
     print("STEP 6: Checking Signal Strength...")
     print("-" * 70)
-    response = send_at_command(ser, "AT+CSQ")
+    response = at.command("AT+CSQ")
     print(f"   Response: {response}")
     
     signal_strength = 0
     signal_quality = "Unknown"
     
-    if "+CSQ:" in response:
-        try:
-            # Parse: +CSQ: <rssi>,<ber>
-            parts = response.split("+CSQ:")[1].strip()
-            parts = parts.split(",")
-            rssi = int(parts[0].strip())
-            ber = int(parts[1].strip()) if len(parts) > 1 else 0
-            
-            if rssi == 99:
-                print("   ❌ Signal strength: Unknown/Not detectable")
-                signal_strength = 0
+    # Parse: +CSQ: <rssi>,<ber>
+    fields = response.fields("+CSQ:")
+    if fields and fields[0].isdigit():
+        rssi = int(fields[0])
+        if rssi == 99:
+            print("   ❌ Signal strength: Unknown/Not detectable")
+            signal_strength = 0
+            signal_quality = "NO_SIGNAL"
+        else:
+            signal_strength = rssi
+            if signal_strength == 0:
+                print(f"   ❌ Signal strength: {signal_strength}/31 (NO SIGNAL)")
                 signal_quality = "NO_SIGNAL"
+            elif signal_strength <= 10:
+                print(f"   ⚠️ Signal strength: {signal_strength}/31 (Very weak)")
+                signal_quality = "VERY_WEAK"
+            elif signal_strength <= 20:
+                print(f"   ⚠️ Signal strength: {signal_strength}/31 (Weak)")
+                signal_quality = "WEAK"
             else:
-                signal_strength = rssi
-                if signal_strength == 0:
-                    print(f"   ❌ Signal strength: {signal_strength}/31 (NO SIGNAL)")
-                    signal_quality = "NO_SIGNAL"
-                elif signal_strength <= 10:
-                    print(f"   ⚠️ Signal strength: {signal_strength}/31 (Very weak)")
-                    signal_quality = "VERY_WEAK"
-                elif signal_strength <= 20:
-                    print(f"   ⚠️ Signal strength: {signal_strength}/31 (Weak)")
-                    signal_quality = "WEAK"
-                else:
-                    print(f"   ✅ Signal strength: {signal_strength}/31 (Good)")
-                    signal_quality = "GOOD"
-        except (ValueError, IndexError) as e:
-            print(f"   ⚠️ Could not parse signal: {e}")
+                print(f"   ✅ Signal strength: {signal_strength}/31 (Good)")
+                signal_quality = "GOOD"
     else:
         print("   ❌ Could not check signal strength")
     
@@ -225,22 +157,17 @@ def check_simcom_status():
     print()
     print("STEP 7: Checking Network Operator...")
     print("-" * 70)
-    response = send_at_command(ser, "AT+COPS?")
+    response = at.command("AT+COPS?")
     print(f"   Response: {response}")
     
+    # Parse: +COPS: <mode>[,<format>,<oper>]
     operator_name = "Unknown"
-    if "+COPS:" in response:
-        try:
-            # Parse: +COPS: <mode>[,<format>,<oper>]
-            parts = response.split("+COPS:")[1].strip()
-            if "," in parts:
-                oper = parts.split(",")[-1].strip().strip('"')
-                operator_name = oper
-                print(f"   ✅ Network operator: {operator_name}")
-            else:
-                print(f"   ⚠️ Could not parse operator: {response}")
-        except Exception as e:
-            print(f"   ⚠️ Error parsing operator: {e}")
+    fields = response.fields("+COPS:")
+    if len(fields) >= 3:
+        operator_name = fields[2]
+        print(f"   ✅ Network operator: {operator_name}")
+    elif fields:
+        print(f"   ⚠️ Could not parse operator: {response}")
     else:
         print("   ⚠️ Could not get operator information")
     
@@ -248,14 +175,14 @@ def check_simcom_status():
     print()
     print("STEP 8: Checking SMS Configuration...")
     print("-" * 70)
-    response = send_at_command(ser, "AT+CMGF?")
-    if "+CMGF: 1" in response:
+    response = at.command("AT+CMGF?")
+    if response.value("+CMGF:") == "1":
         print("   ✅ SMS text mode enabled")
     else:
         print(f"   ⚠️ SMS mode: {response}")
         print("   Setting SMS text mode...")
-        response = send_at_command(ser, "AT+CMGF=1")
-        if "OK" in response:
+        response = at.command("AT+CMGF=1")
+        if response.ok:
             print("   ✅ SMS text mode set")
         else:
             print(f"   ⚠️ Could not set SMS mode: {response}")
@@ -264,15 +191,11 @@ def check_simcom_status():
     print()
     print("STEP 9: Checking SMS Service Center...")
     print("-" * 70)
-    response = send_at_command(ser, "AT+CSCA?")
-    if "+CSCA:" in response:
-        try:
-            sca = response.split("+CSCA:")[1].strip().strip('"')
-            print(f"   ✅ Service center: {sca}")
-        except:
-            print(f"   Response: {response}")
+    sca = at.service_center()
+    if sca:
+        print(f"   ✅ Service center: {sca}")
     else:
-        print(f"   ⚠️ Could not get service center: {response}")
+        print("   ⚠️ Could not get service center")
     
     # Final Summary
     print()
@@ -305,7 +228,7 @@ def check_simcom_status():
     
     print("=" * 70)
     
-    ser.close()
+    at.ser.close()
     return all_ok
 
 if __name__ == "__main__":